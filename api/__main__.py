@@ -1,7 +1,4 @@
-from .prefect_config.flows import fetch_from_api
+from .cli import main
 
 if __name__ == "__main__":
-    tribalwars_server_list = ["tribalwars.com.pt",
-                              "die-staemme.de",
-                              "tribalwars.com.br"]
-    fetch_from_api(tribalwars_server_list) #.visualize()
\ No newline at end of file
+    main()
@@ -0,0 +1,146 @@
+"""
+Command line interface, python -m api <command>.
+
+    python -m api list-servers tribalwars.com.pt
+    python -m api list-worlds tribalwars.com.pt
+    python -m api config tribalwars.com.pt pt90 --key speed
+    python -m api fetch-one tribalwars.com.pt pt90 village --validation fast --output pt90.json
+    python -m api run tribalwars.com.pt die-staemme.de
+
+Only the client layer (api.twapi, requests) is loaded up front: pandas is
+loaded by the commands parsing map files, pandera by --validation and
+Prefect by run, the orchestrated daily job (the default command).
+"""
+import sys
+import json
+import argparse
+from .twapi.baseserver import Server, country_name
+from .twapi.world import World, DATASETS, CONFIGS
+
+#: Regions fetched by run when none is given.
+REGIONS = ["tribalwars.com.pt",
+           "die-staemme.de",
+           "tribalwars.com.br"]
+
+def find_world(region: str, gameworld: str, refresh: bool = False) -> World:
+    """Get a world of a region by its identifier.
+
+    Args:
+        region (str): The base URL domain of the region.
+        gameworld (str): The game world identifier, e.g. "pt90".
+        refresh (bool): Download the world list even if it is cached.
+
+    Returns:
+        World: The world, sharing the session of the region.
+    """
+    server = Server(region)
+    worlds = server.get_active_servers(region, refresh)
+    if gameworld not in worlds:
+        raise SystemExit("{} is not an active world of {}, see list-worlds".format(gameworld, region))
+    return(World(gameworld, worlds[gameworld], server.session))
+
+def list_servers(args) -> None:
+    for region in args.regions:
+        for gameworld, url in sorted(Server(region).get_active_servers(region, args.refresh).items()):
+            code = gameworld[:2].upper()
+            print("\t".join([gameworld, url, region, country_name(code) or code]))
+
+def list_worlds(args) -> None:
+    print("\n".join(sorted(Server(args.region).get_active_servers(args.region, args.refresh))))
+
+def config(args) -> None:
+    value = find_world(args.region, args.gameworld, args.refresh).config(args.kind)
+    for name in args.key.split(".") if args.key else []:
+        if not isinstance(value, dict) or name not in value:
+            raise SystemExit("{} has no {} in its {} configuration".format(args.gameworld, args.key, args.kind))
+        value = value[name]
+    print(json.dumps(value, indent = 1))
+
+def fetch_one(args) -> None:
+    from .twapi.parsing import parse_frame
+    world = find_world(args.region, args.gameworld, args.refresh)
+    frame = parse_frame(args.dataset, world.download(args.dataset), args.gameworld)
+    rows = len(frame)
+    schema = None
+    if args.validation is not None:
+        from .pandera.schemas import SCHEMAS
+        schema = SCHEMAS[args.dataset]
+        if args.validation == "fast":
+            from .pandera.fast import fast_validate
+            frame, _ = fast_validate(schema, frame)
+        else:
+            frame = schema.validate(frame, lazy = True)
+    if args.output is None:
+        lines = frame.to_json(orient = "records", lines = True)
+        sys.stdout.write(lines if lines.endswith("\n") else lines + "\n")
+    else:
+        from .storage.writers import get_writer
+        get_writer(args.format, schema).write(frame, args.output)
+    print("{}:{} {} rows, {} dropped".format(args.gameworld, args.dataset, len(frame), rows - len(frame)),
+          file = sys.stderr)
+
+def run(args) -> None:
+    from .prefect_config.flows import fetch_from_api
+    fetch_from_api(args.regions or REGIONS, conditional = args.conditional, output_format = args.format,
+                   storage_mode = args.storage_mode, validation = args.validation, workers = args.workers,
+                   update_catalog = args.update_catalog, archive = args.archive, enrich = args.enrich,
+                   compact = args.compact, events = args.events, shard = args.shard, shards = args.shards)
+
+def parser() -> argparse.ArgumentParser:
+    """Get the parser of the command line, one subparser per command."""
+    main = argparse.ArgumentParser(prog = "python -m api", description = __doc__,
+                                   formatter_class = argparse.RawDescriptionHelpFormatter)
+    commands = main.add_subparsers(dest = "command")
+
+    command = commands.add_parser("list-servers", help = "active worlds of regions, with their url and country")
+    command.add_argument("regions", nargs = "+", help = "base domains of the regions, e.g. tribalwars.com.pt")
+    command.set_defaults(handler = list_servers)
+
+    command = commands.add_parser("list-worlds", help = "identifiers of the active worlds of a region")
+    command.add_argument("region")
+    command.set_defaults(handler = list_worlds)
+
+    command = commands.add_parser("config", help = "configuration of a world, as json")
+    command.add_argument("region")
+    command.add_argument("gameworld")
+    command.add_argument("--kind", choices = list(CONFIGS), default = "config")
+    command.add_argument("--key", help = "only this setting, dotted for nested ones, e.g. speed or game.tech")
+    command.set_defaults(handler = config)
+
+    command = commands.add_parser("fetch-one", help = "download and parse one dataset of one world")
+    command.add_argument("region")
+    command.add_argument("gameworld")
+    command.add_argument("dataset", choices = list(DATASETS))
+    command.add_argument("--validation", choices = ["pandera", "fast"], default = None,
+                         help = "drop the invalid rows, not validated by default")
+    command.add_argument("--output", default = None, help = "write there instead of json lines on stdout")
+    command.add_argument("--format", choices = ["json", "parquet"], default = "json")
+    command.set_defaults(handler = fetch_one)
+
+    command = commands.add_parser("run", help = "the daily job, fetch_from_api (the default command)")
+    command.add_argument("regions", nargs = "*", help = "defaults to {}".format(", ".join(REGIONS)))
+    command.add_argument("--conditional", action = "store_true")
+    command.add_argument("--format", choices = ["json", "parquet"], default = "json")
+    command.add_argument("--storage-mode", choices = ["full", "delta"], default = "full")
+    command.add_argument("--validation", choices = ["pandera", "fast"], default = "pandera")
+    command.add_argument("--workers", type = int, default = None)
+    command.add_argument("--update-catalog", action = "store_true")
+    command.add_argument("--archive", action = "store_true")
+    command.add_argument("--enrich", action = "store_true")
+    command.add_argument("--compact", action = "store_true")
+    command.add_argument("--events", action = "store_true")
+    command.add_argument("--shard", type = int, default = None)
+    command.add_argument("--shards", type = int, default = 1)
+    command.set_defaults(handler = run)
+
+    for command in commands.choices.values():
+        if command.prog.split()[-1] != "run":
+            command.add_argument("--refresh", action = "store_true", help = "ignore the cached world lists")
+    return(main)
+
+def main(argv: list = None) -> None:
+    """Run the command line, python -m api alone runs the daily job."""
+    args = parser().parse_args(argv)
+    if args.command is None:
+        args = parser().parse_args(["run"])
+    args.handler(args)
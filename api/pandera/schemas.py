@@ -74,4 +74,52 @@ defense_data_schema = DataFrameSchema({
 }, 
 add_missing_columns = True, 
 coerce = True,
-drop_invalid_rows = True)
\ No newline at end of file
+drop_invalid_rows = True)
+
+# Schema of each dataset
+SCHEMAS = {"village": village_data_schema,
+           "ally": ally_data_schema,
+           "player": player_data_schema,
+           "oda": attack_data_schema,
+           "odd": defense_data_schema}
+
+def _enriched_schema(columns: dict, keys: tuple = ("player_id", "ally_id")) -> DataFrameSchema:
+    return DataFrameSchema({**{name: Column(dtype, nullable = name not in keys)
+                               for name, dtype in columns.items()},
+                            "datetime": Column(datetime.datetime),
+                            "server": Column(str)},
+                           coerce = True)
+
+AGGREGATES = {"villages": int, "village_points": int, "continents": int, "main_continent": int,
+              "oda": int, "oda_rank": int, "odd": int, "odd_rank": int}
+
+# Schema of the enriched player table (api.twapi.enrich.enrich_players)
+player_enriched_schema = _enriched_schema({"player_id": int, "name": str, "ally_id": int, "ally_tag": str,
+                                           "ally_name": str, "num_vill": int, "points": int, "rank": int,
+                                           **AGGREGATES})
+
+# Schema of the enriched ally table (api.twapi.enrich.enrich_allies)
+ally_enriched_schema = _enriched_schema({"ally_id": int, "name": str, "tag": str, "members": int, "num_vill": int,
+                                         "points": int, "total_points": int, "rank": int, **AGGREGATES})
+
+# Schema of each enriched table, used to write and read them back (they arent validated)
+ENRICHED_SCHEMAS = {"player_enriched": player_enriched_schema,
+                    "ally_enriched": ally_enriched_schema}
+
+# Schema of the villages conquered since the previous snapshot (api.twapi.events.conquers)
+conquer_event_schema = _enriched_schema({"village_id": int, "x": int, "y": int, "continent": int, "points": int,
+                                         "old_player_id": int, "new_player_id": int, "old_ally_id": int,
+                                         "new_ally_id": int}, ("village_id",))
+
+# Schema of the points, ODA and ODD changes since the previous snapshot (api.twapi.events.point_deltas)
+point_delta_event_schema = _enriched_schema({"player_id": int, "kind": str, "old_points": int, "new_points": int,
+                                             "delta": int, "old_rank": int, "new_rank": int}, ("player_id",))
+
+# Schema of the tribe changes since the previous snapshot (api.twapi.events.tribe_changes)
+tribe_change_event_schema = _enriched_schema({"player_id": int, "old_ally_id": int, "new_ally_id": int,
+                                              "points": int}, ("player_id",))
+
+# Schema of each event table, used to write and read them back
+EVENT_SCHEMAS = {"conquer": conquer_event_schema,
+                 "point_delta": point_delta_event_schema,
+                 "tribe_change": tribe_change_event_schema}
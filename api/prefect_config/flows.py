@@ -1,13 +1,37 @@
 import sys
 sys.path.append("..")
+from typing import List, Optional
 
 # python -m api 
 
 from .subflows import *
-from .tasks import fetch_server_data
+from .tasks import fetch_server_data, refresh_catalog, compact_history, publish_metrics, dump_unit, derive_unit
+from .units import WorkUnit, plan_units, run_units, unit_session
+from api.twapi.world import DATASETS, CONFIGS
+from api.storage.manifest import run_manifest
+from api.storage.archive import RawArchive
+from api.storage.layout import ENRICHED_FOLDERS, EVENT_FOLDERS
+from api.storage.shards import Shard, shard_plan, merge_shards
+from api.twapi.metrics import run_metrics
+from requests import RequestException
+import logging
+import multiprocessing
+import os
+
+logger = logging.getLogger(__name__)
 
 @flow(name="Get data for all endpoints and dump it into json.")
-def fetch_from_api(tribalwars_server_list) -> None:
+def fetch_from_api(tribalwars_server_list, max_concurrency: int = 16, per_host: int = 4,
+                   conditional: bool = False, village_batch_size: Optional[int] = None,
+                   output_format: str = "json", storage_mode: str = "full", base_every: int = 7,
+                   validation: str = "pandera", update_catalog: bool = False,
+                   workers: Optional[int] = None,
+                   metrics_folder: Optional[str] = "data/metrics", publish_artifacts: bool = False,
+                   requests_per_second: Optional[float] = 5, retries: int = 3,
+                   archive: bool = False, replay: bool = False, replay_start: Optional[str] = None,
+                   replay_end: Optional[str] = None, enrich: bool = False,
+                   shard: Optional[int] = None, shards: int = 1, compact: bool = False,
+                   events: bool = False) -> None:
     """
     Starts the subflows. Main flow.
     
@@ -15,27 +39,376 @@ def fetch_from_api(tribalwars_server_list) -> None:
     and dumps it into JSON files.
     Creates a object dict for each {server (str): World (object)}
 
-    Flow isnt able to leverage ConcurrentTaskRunner() because different
-    tasks share the same objects.
+    Every dataset of every world is an immutable work unit (WorkUnit)
+    dumped by its own dump_unit task, named <world>:<dataset> and cached
+    by day, world, dataset and output options. The datasets of a world and
+    different worlds run side by side on the task runner of the flow, the
+    thread pool by default, or processes and Dask with
+    fetch_from_api.with_options(task_runner=...).
+
+    :param max_concurrency: Maximum number of units (download, parse,
+        validate and write) in flight
+    :type max_concurrency: int
+    :param per_host: Maximum number of units in flight per host
+    :type per_host: int
+    :param conditional: Send conditional requests and skip the files that
+        didnt change since they were last dumped (no file is written for them)
+    :type conditional: bool
+    :param village_batch_size: Stream village.txt in batches of this many rows,
+        bounding memory on the largest worlds. None loads each file at once
+    :type village_batch_size: int
+    :param output_format: "json" for json lines, or "parquet" for compressed
+        typed columns. Files keep the data/<dataset>-data/<date>/<world> layout
+    :type output_format: str
+    :param storage_mode: "full" stores a full copy of every dataset every day,
+        "delta" a full copy every base_every days and only the inserted,
+        updated and deleted rows in between (read them with DeltaStore.read)
+    :type storage_mode: str
+    :param base_every: Days between two full copies in delta mode
+    :type base_every: int
+    :param validation: "pandera" validates with the pandera schemas, "fast"
+        with the vectorized equivalent of api.pandera.fast. Both drop and
+        report invalid rows
+    :type validation: str
+    :param update_catalog: Load the new files into the SQLite catalog
+        (api.storage.catalog.Catalog) at the end of the run
+    :type update_catalog: bool
+    :param workers: Parse, validate and dump in a pool of this many worker
+        processes while the remaining files download, e.g. os.cpu_count().
+        None keeps everything in the process running the unit. Meant for
+        the default thread pool task runner, cannot be combined with
+        village_batch_size
+    :type workers: int
+    :param metrics_folder: Where to write the duration, bytes, rows (parsed,
+        dropped, written) and peak memory of every stage of every world and
+        dataset: twapi.prom for the Prometheus textfile collector, and
+        runs/<start>.json, the run summary, twapi.<shard>.prom (series
+        labelled shard) and runs/<start>.<shard>.json for a shard. None
+        disables the export
+    :type metrics_folder: str
+    :param publish_artifacts: Also publish the run summary as Prefect artifacts
+    :type publish_artifacts: bool
+    :param requests_per_second: Requests per second sent to each host by
+        each process, None for no limit
+    :type requests_per_second: float
+    :param retries: Retries of a request failing with a connection error,
+        a timeout, 429 or 5xx, after a jittered exponential backoff. Hosts
+        failing 5 times in a row are skipped for the rest of the run: their
+        worlds (or whole region) are logged and left for the next run
+    :type retries: int
+    :param archive: Also keep the raw map files and configurations, gzipped
+        and deduplicated by checksum, in the RawArchive (data/raw). Cannot be
+        combined with village_batch_size
+    :type archive: bool
+    :param replay: Rebuild the dumps of the archived days between
+        replay_start and replay_end from the RawArchive instead of fetching
+        today's files, without any request, see replay_archive
+    :type replay: bool
+    :param replay_start: First day to replay, "%Y-%m-%d", the first archived day if None
+    :type replay_start: str
+    :param replay_end: Last day to replay, included, the last archived day if None
+    :type replay_end: str
+    :param enrich: Once every dataset of a world is done, also build its
+        enriched player and ally tables (tribe, villages, points, continents,
+        ODA/ODD and ranks of every player and tribe, see api.twapi.enrich)
+        into data/player-enriched-data and data/ally-enriched-data
+    :type enrich: bool
+    :param shard: Only fetch the worlds of this shard, numbered from 0, of
+        the shards of a sharded run, see fetch_sharded. Every worker
+        discovers the regions and takes its worlds from the partition plan
+        of the day (api.storage.shards.shard_plan, weighted by the sizes of
+        the last days), written once by the first worker in
+        data/manifests/<date>.plan-<shards>.json, then writes the files of
+        its worlds and its own manifest,
+        data/manifests/<date>.shard-<shard>-of-<shards>.json, merged by
+        merge_shard_runs. Cannot be combined with replay or update_catalog
+    :type shard: int
+    :param shards: Number of shards of a sharded run
+    :type shards: int
+    :param compact: Append the days written to the monthly history of
+        their worlds (data/history/<dataset>/<world>/<month>.parquet, see
+        api.storage.history.HistoryStore). Days already compacted are
+        skipped, backfill older ones with compact_history_flow
+    :type compact: bool
+    :param events: Once every dataset of a world is done, also write its
+        events since the previous snapshot (see api.twapi.events): villages
+        conquered (data/conquer-events), points, ODA and ODD changes
+        (data/point-delta-events) and tribe changes (data/tribe-change-events)
+    :type events: bool
+
+    Progress is kept in the run manifest of the day (data/manifests/<date>.json).
+    Running the flow again the same day, e.g. after a crash, reuses the
+    world lists found by the first run and only fetches the (world,
+    dataset) pairs that werent written yet.
 
     :return: None
     :rtype: None
     """
 
+    if village_batch_size and workers:
+        raise ValueError("Streaming (village_batch_size) cannot be combined with worker processes")
+    if village_batch_size and storage_mode == "delta":
+        raise ValueError("Streaming (village_batch_size) cannot be combined with the delta storage mode")
+    if village_batch_size and archive:
+        raise ValueError("Streaming (village_batch_size) cannot be combined with the raw archive")
+
+    if shard is not None and not 0 <= shard < shards:
+        raise ValueError("Shard {} out of range, expected 0 to {}".format(shard, shards - 1))
+    if shard is not None and (replay or update_catalog):
+        raise ValueError("A shard cannot replay nor update the catalog, see merge_shard_runs")
+
+    run_metrics.reset()
+    if replay:
+        with run_metrics.stage("replay") as stage:
+            stage["rows"] = replay_archive(replay_start, replay_end, tribalwars_server_list, output_format,
+                                           storage_mode, base_every, validation, workers)
+        if update_catalog:
+            with run_metrics.stage("catalog") as stage:
+                stage["rows"] = refresh_catalog()
+        if metrics_folder is not None:
+            summary = run_metrics.export(metrics_folder)
+            if publish_artifacts:
+                publish_metrics(summary)
+        return
+
+    # a worker of a sharded run owns its manifest, archive index, validators and metrics
+    shard_name = Shard(shard, shards).name if shard is not None else None
+    manifest = run_manifest(date, shard = shard_name)
+    # one pooled session shared by every world of every region, and the units run by this process
+    session_options = {"per_host": per_host, "requests_per_second": requests_per_second, "retries": retries}
+    session = unit_session(**session_options)
+    raw_archive = RawArchive(shard = shard_name) if archive else None
     obj_list = []
+    discovered = {}
     for server in tribalwars_server_list:
         # create a list of objects per server
-        obj_list.extend(Server(server).generate_worlds())
+        with run_metrics.stage("discover") as stage:
+            region = Server(server, session)
+            try:
+                # a resumed run reuses the worlds found by the first one
+                worlds = manifest.worlds(server)
+                if worlds is None:
+                    worlds = region.get_active_servers(server)
+                    manifest.set_worlds(server, worlds)
+                discovered[server] = worlds
+                if raw_archive is not None:
+                    raw_archive.add_worlds(date, server, worlds)
+                obj_list.extend(region.generate_worlds(server_dict = worlds))
+            except (RequestException, ValueError) as error:
+                # one unreachable region, or one answering a malformed list, doesnt stop the others
+                logger.error("%s skipped, server list unavailable: %s", server, error)
+            stage["rows"] = len(obj_list)
+
+    if shard is not None:
+        recorded = manifest.content.get("shard")
+        if recorded is not None and (recorded["index"], recorded["count"]) == (shard, shards):
+            # a resumed shard keeps the worlds it started with
+            owned = recorded["worlds"]
+        else:
+            owned = shard_plan(date, [obj.gameworld for obj in obj_list], shards)[shard]
+        logger.info("%s: %d worlds of %d", shard_name, len(owned), len(obj_list))
+        obj_list = [obj for obj in obj_list if obj.gameworld in owned]
+        manifest.set_shard(shard, shards, owned)
+
+    extension = get_writer(output_format).extension
+    if shard in (None, 0) and not manifest.done("server-data", "servers", "data/server-data/server_data.{}".format(extension)):
+        path = fetch_server_data(tribalwars_server_list, output_format, discovered)
+        if path is not None:
+            manifest.written("server-data", "servers", path)
 
-    fetch_server_data(tribalwars_server_list)
-    fetch_player_data(obj_list)
-    fetch_ally_data(obj_list)
-    fetch_defense_data(obj_list)
-    fetch_attack_data(obj_list)
-    fetch_village_data(obj_list)
+    planned = plan_units(obj_list, list(DATASETS) + (list(CONFIGS) if archive else []), date)
+    if raw_archive is not None and planned:
+        recover_archive(manifest, raw_archive, planned)
+    # one unit per (world, dataset) left to do today
+    units = [unit for unit in planned
+             if not is_done(manifest, unit.gameworld, unit.dataset, storage_mode, extension)]
+    # written before but not done anymore, the file is gone or changed since: dont trust a cached result
+    stale = {unit for unit in units
+             if (manifest.entry(unit.gameworld, unit.dataset) or {}).get("state") == "written"}
+    for unit in units:
+        manifest.mark(unit.gameworld, unit.dataset, "pending", save = False)
+    manifest.save()
+    validators = None
+    if conditional:
+        validators = ValidatorStore() if shard is None else ValidatorStore(
+            "data/http-cache/validators.{}.json".format(shard_name))
+    options = {"output_format": output_format, "storage_mode": storage_mode, "base_every": base_every,
+               "validation": validation, "workers": workers, "session_options": session_options,
+               "archive": raw_archive.root if raw_archive is not None else None}
+    by_name = {obj.gameworld: obj for obj in obj_list}
+
+    def submit(unit):
+        url = by_name[unit.gameworld].url(unit.dataset)
+        return dump_unit.with_options(refresh_cache = unit in stale).submit(
+            unit, batch_size = village_batch_size if unit.dataset == "village" else None,
+            validators = validators.get(url) if validators is not None and unit.dataset in DATASETS else None,
+            **options)
+
+    errors = []
+    # worlds with a dataset written by this run, whose derived tables are outdated
+    changed = set()
+    try:
+        while units:
+            retry = []
+            for unit, future in run_units(units, submit, max_concurrency, per_host):
+                result = future.result(raise_on_failure = False)
+                if isinstance(result, BaseException):
+                    # download errors are logged and left for the next run, other errors fail the flow once every unit ran
+                    if not failed(unit, unit.dataset, result, manifest):
+                        errors.append(result)
+                    continue
+                if result["state"] == "written" and (not os.path.exists(result["path"])
+                                                     or os.path.getsize(result["path"]) != result["bytes"]):
+                    # cached result of a file deleted or changed since, run the unit again
+                    retry.append(unit)
+                    continue
+                if raw_archive is not None and result.get("raw_checksum") and not raw_archive.has_object(result["raw_checksum"]):
+                    # cached result of a response archived elsewhere (or deleted since), run the unit again
+                    retry.append(unit)
+                    continue
+                run_metrics.extend(result.pop("records"))
+                if validators is not None and result["validators"] is not None:
+                    validators.commit(by_name[unit.gameworld].url(unit.dataset), result["validators"])
+                    validators.save()
+                del result["validators"]
+                if raw_archive is not None:
+                    # an unchanged file is the last archived one
+                    digest = result.get("raw_checksum") or raw_archive.latest(unit.gameworld, unit.dataset, date)
+                    if digest is not None:
+                        raw_archive.record(date, unit.gameworld, unit.dataset, digest, save = False)
+                if result["state"] == "written":
+                    changed.add(unit.gameworld)
+                manifest.mark(unit.gameworld, unit.dataset, **result)
+            stale.update(retry)
+            units = retry
+
+        # tables derived from the datasets, as {unit dataset: tables}
+        derived = {name: tables for name, tables, wanted in (("enriched", ENRICHED_FOLDERS, enrich),
+                                                             ("events", EVENT_FOLDERS, events)) if wanted}
+        if derived:
+            # the worlds whose datasets are all done, unless their tables are already built from them
+            done = [obj for obj in obj_list
+                    if all(is_done(manifest, obj.gameworld, dataset, storage_mode, extension) for dataset in DATASETS)]
+            pending = [WorkUnit(obj.gameworld, obj.server, name, date) for obj in done for name, tables in derived.items()
+                       if obj.gameworld in changed
+                       or not all(manifest.done(obj.gameworld, table, derived_path(table, obj.gameworld, extension))
+                                  for table in tables)]
+            submit = lambda unit: derive_unit.submit(unit, output_format, storage_mode, workers)
+            for unit, future in run_units(pending, submit, max_concurrency, per_host):
+                result = future.result(raise_on_failure = False)
+                if isinstance(result, BaseException):
+                    errors.append(result)
+                    continue
+                run_metrics.extend(result["records"])
+                for table, output in result["files"].items():
+                    manifest.mark(unit.gameworld, table, "written", save = False, **output)
+                manifest.save()
+    finally:
+        # the archive index is written once for the whole run, also when it fails,
+        # and rebuilt from the manifest by the next run if this one is killed
+        if raw_archive is not None:
+            raw_archive.save(date)
+        # the worker processes of dump_unit and derive_unit
+        shutdown_pools()
+    if errors:
+        raise errors[0]
+
+    if compact:
+        with run_metrics.stage("compact") as stage:
+            stage["rows"] = compact_history([obj.gameworld for obj in obj_list], [date[:7]])
+
+    if update_catalog:
+        with run_metrics.stage("catalog") as stage:
+            stage["rows"] = refresh_catalog()
+
+    manifest.finish()
+    if metrics_folder is not None:
+        summary = run_metrics.export(metrics_folder, shard_name)
+        if publish_artifacts:
+            publish_metrics(summary)
 
     return
 
+@flow(name="Merge shard manifests")
+def merge_shard_runs(shards: int, day: Optional[str] = None, update_catalog: bool = False) -> dict:
+    """
+    Coordinator of a sharded run: merges the manifests of its shards into
+    the manifest of the day (data/manifests/<date>.json) and reports the
+    shards still missing or running and the worlds left incomplete. Can run
+    while shards still run, or again after one was resumed.
+
+    :param shards: Number of shards of the run
+    :type shards: int
+    :param day: Day of the run, "%Y-%m-%d", today if None
+    :type day: str
+    :param update_catalog: Load the new files of every shard into the
+        SQLite catalog, once every shard finished
+    :type update_catalog: bool
+
+    :return: The merge report, see api.storage.shards.merge_shards
+    :rtype: dict
+    """
+    report = merge_shards(day or date, shards)
+    for name, status in report["shards"].items():
+        if status["state"] != "finished":
+            logger.warning("%s is %s", name, status["state"])
+    if report["incomplete"]:
+        logger.warning("%d worlds incomplete: %s", len(report["incomplete"]), ", ".join(report["incomplete"]))
+    if report["unowned"]:
+        logger.warning("%d worlds owned by no shard: %s", len(report["unowned"]), ", ".join(report["unowned"]))
+    if update_catalog and all(status["state"] == "finished" for status in report["shards"].values()):
+        refresh_catalog()
+    return report
+
+@flow(name="Compact history")
+def compact_history_flow(months: Optional[List[str]] = None) -> int:
+    """
+    Merges the daily files into the monthly history files of every world,
+    e.g. to backfill the history of the days dumped before compaction, or
+    after a replay. Only reads the days not compacted yet, or changed since.
+
+    :param months: Months to compact, "%Y-%m", every month if None
+    :type months: List[str]
+
+    :return: Number of days added or replaced
+    :rtype: int
+    """
+    return compact_history(months = months)
+
+def _fetch_shard(tribalwars_server_list, shard, shards, options):
+    fetch_from_api(tribalwars_server_list, shard = shard, shards = shards, **options)
+
+def fetch_sharded(tribalwars_server_list, shards: int, update_catalog: bool = False, **options) -> dict:
+    """
+    Runs a sharded fetch_from_api on this machine: one worker process per
+    shard, then merge_shard_runs. On several machines, run
+    fetch_from_api(servers, shard = i, shards = n) on each one instead (e.g.
+    one deployment per shard, see deploy_entrypoint.py), sharing the data
+    folder, and merge_shard_runs(n) once they are done.
+
+    :param tribalwars_server_list: Regions to fetch
+    :type tribalwars_server_list: List[str]
+    :param shards: Number of shards, and worker processes
+    :type shards: int
+    :param update_catalog: Load the new files into the SQLite catalog once merged
+    :type update_catalog: bool
+    :param options: Other parameters of fetch_from_api, the same for every shard
+
+    :return: The merge report, see api.storage.shards.merge_shards
+    :rtype: dict
+    """
+    context = multiprocessing.get_context("spawn")
+    workers = [context.Process(target = _fetch_shard, args = (tribalwars_server_list, shard, shards, options),
+                               name = Shard(shard, shards).name)
+               for shard in range(shards)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+        if worker.exitcode != 0:
+            logger.error("%s exited with %s", worker.name, worker.exitcode)
+    return merge_shard_runs(shards, update_catalog = update_catalog)
+
 if __name__ == "__main__":
     tribalwars_server_list = ["tribalwars.com.pt",
                               "die-staemme.de",
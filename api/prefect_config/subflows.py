@@ -1,169 +1,571 @@
 import sys
 sys.path.append("..")
 from api.twapi.baseserver import Server
-# python -m api 
+from api.twapi.cache import ValidatorStore
+from api.storage.writers import get_writer
+from api.storage.layout import FOLDERS, DERIVED_FOLDERS
+from api.storage.delta import DeltaStore, KEYS
+from api.storage.manifest import run_manifest, checksum, file_checksum, DONE
+from api.storage.archive import RawArchive
+from api.pandera.fast import fast_validate
+from api.twapi.parsing import parse_frame
+from api.twapi.enrich import enrich
+from api.twapi.events import diff
+from api.twapi.metrics import Metrics, run_metrics
+from requests import RequestException
+# python -m api
 
 
 from prefect import task, flow
 import os
+import logging
 import json
+import multiprocessing
+import threading
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
 from api.pandera.schemas import *
 
 date = str(datetime.datetime.now().strftime("%Y-%m-%d"))
 
-@flow(name="Get player data")
-def fetch_player_data(worlds):
-    """
-    Function returns the player data for a specific world.
+logger = logging.getLogger(__name__)
 
-    :param worlds: List of objects of class World
-    :type parameter1: List[World]
+# worker processes, kept for the whole run and shared by the subflows and the units
+_pools = {}
+_pools_lock = threading.Lock()
 
-    :return: Uploads data into a json
-    :rtype: None
+def output_path(dataset, gameworld, extension = "json", day = None):
     """
-    for obj in worlds:
-        #data = json.loads(data)
-        if not os.path.exists("data"):
-            os.makedirs("data")
-
-        if not os.path.exists("data/player-data"):
-            os.makedirs("data/player-data")
-
-        if not os.path.exists("data/player-data/{}".format(date)):
-            os.makedirs("data/player-data/{}".format(date))
-
-        json_path = 'data/player-data/{}/{}.json'.format(date, getattr(obj, "gameworld"))
-        if not os.path.exists(json_path):
-            data = obj.get_player()
-            data = json.dumps(data)
-            data = json.loads(data)
-            data = player_data_schema.validate(pd.DataFrame(data).T, lazy = True)
-            data.to_json(json_path, orient='records', lines=True)
-
-    return
-
-@flow(name="Get ally data")
-def fetch_ally_data(worlds):
+    Returns the path of the dump of a dataset for a specific world.
+
+    :param dataset: Dataset name, one of FOLDERS
+    :type dataset: str
+    :param gameworld: World identifier
+    :type gameworld: str
+    :param extension: File extension of the output format
+    :type extension: str
+    :param day: Snapshot date, "%Y-%m-%d", today if None
+    :type day: str
+
+    :return: data/<dataset>-data/<date>/<gameworld>.<extension>
+    :rtype: str
     """
-    Function returns the ally data for a specific world.
+    return 'data/{}/{}/{}.{}'.format(FOLDERS[dataset], day or date, gameworld, extension)
 
-    :param worlds: List of objects of class World
-    :type parameter1: List[World]
-
-    :return: Uploads data into a json
-    :rtype: None
+def process_pool(workers):
     """
-    for obj in worlds:
-        #data = json.loads(data)
-        if not os.path.exists("data"):
-            os.makedirs("data")
-
-        if not os.path.exists("data/ally-data"):
-            os.makedirs("data/ally-data")
-
-        if not os.path.exists("data/ally-data/{}".format(date)):
-            os.makedirs("data/ally-data/{}".format(date))
+    Returns a pool of worker processes, created on first use.
 
-        json_path = 'data/ally-data/{}/{}.json'.format(date, getattr(obj, "gameworld"))
-        if not os.path.exists(json_path):
-            data = json.dumps(obj.get_ally())
-            data = json.loads(data)
-            data = ally_data_schema.validate(pd.DataFrame(data).T, lazy = True)
-            data.to_json(json_path, orient='records', lines=True)
+    Workers are spawned rather than forked, forking a process running the
+    download threads and the Prefect client is not safe.
 
-    return
+    :param workers: Number of processes
+    :type workers: int
 
-@flow(name="Get ODD data")
-def fetch_defense_data(worlds):
+    :rtype: ProcessPoolExecutor
     """
-    Function returns the defense data for a specific world.
+    # units running in the threads of the task runner ask for it at the same time
+    with _pools_lock:
+        if workers not in _pools:
+            _pools[workers] = ProcessPoolExecutor(workers, mp_context = multiprocessing.get_context("spawn"))
+        return _pools[workers]
 
-    :param worlds: List of objects of class World
-    :type parameter1: List[World]
-
-    :return: Uploads data into a json
-    :rtype: None
+def shutdown_pools():
     """
-    for obj in worlds:
-        #data = json.loads(data)
-        if not os.path.exists("data"):
-            os.makedirs("data")
-
-        if not os.path.exists("data/defense-data"):
-            os.makedirs("data/defense-data")
-
-        if not os.path.exists("data/defense-data/{}".format(date)):
-            os.makedirs("data/defense-data/{}".format(date))
-
-        json_path = 'data/defense-data/{}/{}.json'.format(date, getattr(obj, "gameworld"))
-        if not os.path.exists(json_path):
-            data = json.dumps(obj.get_odd())
-            data = json.loads(data)
-            data = defense_data_schema.validate(pd.DataFrame(data).T, lazy = True)
-            data.to_json(json_path, orient='records', lines=True)
-
-    return
-
-@flow(name="Get ODA data",  log_prints=True)
-def fetch_attack_data(worlds):
+    Stops the worker processes of process_pool, once the run no longer
+    submits work. The next process_pool call spawns new ones.
     """
-    Function returns the attack data for a specific world.
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.shutdown()
 
-    :param worlds: List of objects of class World
-    :type parameter1: List[World]
-
-    :return: Uploads data into a json
-    :rtype: None
+def validate(schema, frame, validation = "pandera", name = ""):
     """
-    for obj in worlds:
-        #data = json.loads(data)
-        if not os.path.exists("data"):
-            os.makedirs("data")
-
-        if not os.path.exists("data/attack-data"):
-            os.makedirs("data/attack-data")
-
-        if not os.path.exists("data/attack-data/{}".format(date)):
-            os.makedirs("data/attack-data/{}".format(date))
-
-        json_path = 'data/attack-data/{}/{}.json'.format(date, getattr(obj, "gameworld"))
-        if not os.path.exists(json_path):
-            data = json.dumps(obj.get_oda())
-            data = json.loads(data)
-            data = attack_data_schema.validate(pd.DataFrame(data).T, lazy = True)
-            data.to_json(json_path, orient='records', lines=True)
-
-    return
-
-@flow(name="Get village data")
-def fetch_village_data(worlds):
+    Validates a frame and reports the rows dropped as invalid.
+
+    :param schema: Pandera schema of the dataset
+    :type schema: DataFrameSchema
+    :param frame: Parsed data
+    :type frame: pd.DataFrame
+    :param validation: "pandera" for schema.validate, "fast" for api.pandera.fast.fast_validate
+    :type validation: str
+    :param name: What is validated, used in the report
+    :type name: str
+
+    :return: The valid rows
+    :rtype: pd.DataFrame
     """
-    Function returns the village data for a specific world.
-
-    :param worlds: List of objects of class World
-    :type parameter1: List[World]
+    if validation == "fast":
+        data, report = fast_validate(schema, frame)
+    elif validation == "pandera":
+        data = schema.validate(frame, lazy = True)
+        report = {"rows": len(frame), "valid": len(data), "invalid": len(frame) - len(data), "errors": {}}
+    else:
+        raise ValueError("Unknown validation {}, expected pandera or fast".format(validation))
+
+    if report["invalid"]:
+        logger.warning("%s: dropped %d invalid rows out of %d %s", name, report["invalid"],
+                       report["rows"], report["errors"])
+    return data
+
+def failed(obj, dataset, error, manifest = None):
+    """
+    Whether a world failed to download, logged, marked failed in the run
+    manifest and skipped rather than failing the whole subflow. Its file
+    isnt written, so a resumed or the next run fetches it again.
+
+    :param obj: World that was fetched
+    :type obj: World
+    :param dataset: Dataset name, one of FOLDERS
+    :type dataset: str
+    :param error: Exception raised for the world
+    :type error: Exception
+    :param manifest: Run manifest to mark, the one of the day if None
+    :type manifest: RunManifest
+
+    :return: True for download errors (host down, throttling, circuit open)
+    :rtype: bool
+    """
+    if not isinstance(error, RequestException):
+        return False
+    (manifest or run_manifest(date)).mark(obj.gameworld, dataset, "failed", error = str(error))
+    logger.error("%s:%s skipped, download failed: %s", obj.gameworld, dataset, error)
+    return True
 
-    :return: Uploads data into a json
-    :rtype: None
+def is_done(manifest, gameworld, dataset, storage_mode = "full", extension = "json", day = None):
     """
-    for obj in worlds:
-        #data = json.loads(data)
-        if not os.path.exists("data"):
-            os.makedirs("data")
+    Whether the run manifest has the dataset of a world done for the day.
+    In full mode the written file must also be the one of the output format.
+
+    :param manifest: Run manifest of the day
+    :type manifest: RunManifest
+    :param gameworld: World identifier
+    :type gameworld: str
+    :param dataset: Dataset name, one of FOLDERS
+    :type dataset: str
+    :param storage_mode: "full" or "delta", see api.storage.delta.DeltaStore
+    :type storage_mode: str
+    :param extension: File extension of the output format
+    :type extension: str
+    :param day: Snapshot date, "%Y-%m-%d", today if None
+    :type day: str
+
+    :rtype: bool
+    """
+    if storage_mode == "delta" or dataset not in FOLDERS:
+        # delta files and archived configurations are checked by the manifest alone
+        return manifest.done(gameworld, dataset)
+    if storage_mode == "full":
+        return manifest.done(gameworld, dataset, output_path(dataset, gameworld, extension, day))
+    raise ValueError("Unknown storage mode {}, expected full or delta".format(storage_mode))
+
+def recover_archive(manifest, archive, units):
+    """
+    Adds to the raw archive index of the day the units the run manifest has
+    done but the index misses. The index is only saved at the end of a
+    run, so a run killed before leaves units done, and skipped by the next
+    run, without their entry. Their response is the archived object of
+    their raw_checksum, or the last archived one when it was unchanged.
+
+    :param manifest: Run manifest of the day
+    :type manifest: RunManifest
+    :param archive: Raw archive of the run
+    :type archive: RawArchive
+    :param units: Units of the run, done or not
+    :type units: List[WorkUnit]
+
+    :return: Number of entries recovered
+    :rtype: int
+    """
+    recovered = 0
+    for unit in units:
+        entry = manifest.entry(unit.gameworld, unit.dataset)
+        if entry is None or entry["state"] not in DONE or archive.entry(unit.day, unit.gameworld, unit.dataset):
+            continue
+        digest = entry.get("raw_checksum") or archive.latest(unit.gameworld, unit.dataset, unit.day)
+        if digest is not None and archive.has_object(digest):
+            archive.record(unit.day, unit.gameworld, unit.dataset, digest, save = False)
+            recovered += 1
+    if recovered:
+        archive.save(units[0].day)
+        logger.warning("%d raw archive entries recovered from the run manifest", recovered)
+    return recovered
+
+def dump_world(dataset, gameworld, data, day, output_format = "json", storage_mode = "full", base_every = 7,
+               validation = "pandera"):
+    """
+    Parses, validates and writes the raw dataset of one world.
+
+    Only takes picklable arguments and reads nothing but its own files, so
+    it runs as well in a worker process as in the flow.
+
+    :param dataset: Dataset name, one of FOLDERS
+    :type dataset: str
+    :param gameworld: World identifier
+    :type gameworld: str
+    :param data: Raw response
+    :type data: str
+    :param day: Snapshot date, "%Y-%m-%d"
+    :type day: str
+    :param output_format: One of api.storage.writers.WRITERS
+    :type output_format: str
+    :param storage_mode: "full" or "delta", see api.storage.delta.DeltaStore
+    :type storage_mode: str
+    :param base_every: Days between two full copies in delta mode
+    :type base_every: int
+    :param validation: "pandera" or "fast", see validate
+    :type validation: str
+
+    :return: The parse, validate and write records of a Metrics, to merge
+        into run_metrics, and the path, rows, bytes and checksum of the
+        written file, for the run manifest
+    :rtype: tuple
+    """
+    metrics = Metrics()
+    schema = SCHEMAS[dataset]
+    with metrics.stage("parse", gameworld, dataset) as stage:
+        stage["bytes"] = len(data)
+        frame = parse_frame(dataset, data, gameworld, day)
+        stage["rows"] = len(frame)
+    with metrics.stage("validate", gameworld, dataset) as stage:
+        data = validate(schema, frame, validation, "{}:{}".format(gameworld, dataset))
+        stage["rows"], stage["dropped"] = len(data), len(frame) - len(data)
+    with metrics.stage("write", gameworld, dataset) as stage:
+        if storage_mode == "delta":
+            store = DeltaStore("data/{}".format(FOLDERS[dataset]), KEYS[dataset], output_format, schema, base_every)
+            path = store.path(gameworld, day, store.write(data, gameworld, day))
+        else:
+            writer = get_writer(output_format, schema)
+            path = output_path(dataset, gameworld, writer.extension, day)
+            writer.write(data, path)
+        stage["rows"], stage["bytes"] = len(data), os.path.getsize(path)
+    return metrics.records, {"path": path, "rows": len(data), "bytes": stage["bytes"], "checksum": file_checksum(path)}
+
+def replay_world(archive, dataset, gameworld, days, output_format = "json", storage_mode = "full", base_every = 7,
+                 validation = "pandera"):
+    """
+    Rebuilds the dumps of one dataset of one world from the raw archive,
+    day after day, as dump_world would have written them.
+
+    Days run in order, which the delta storage mode needs, and only take
+    picklable arguments, so different worlds and datasets replay side by
+    side in worker processes.
+
+    :param archive: Root folder of the RawArchive
+    :type archive: str
+    :param dataset: Dataset name, one of FOLDERS
+    :type dataset: str
+    :param gameworld: World identifier
+    :type gameworld: str
+    :param days: (day, checksum of the archived response) pairs, in order
+    :type days: List[tuple]
+    :param output_format: One of api.storage.writers.WRITERS
+    :type output_format: str
+    :param storage_mode: "full" or "delta", see api.storage.delta.DeltaStore
+    :type storage_mode: str
+    :param base_every: Days between two full copies in delta mode
+    :type base_every: int
+    :param validation: "pandera" or "fast", see validate
+    :type validation: str
+
+    :return: (day, stage records, written file) of every day, see dump_world
+    :rtype: List[tuple]
+    """
+    archive = RawArchive(archive)
+    results = []
+    for day, digest in days:
+        metrics = Metrics()
+        with metrics.stage("read", gameworld, dataset) as stage:
+            data = archive.get_object(digest)
+            stage["bytes"] = len(data)
+        records, output = dump_world(dataset, gameworld, data, day, output_format, storage_mode, base_every, validation)
+        output["raw_checksum"] = digest
+        results.append((day, metrics.records + records, output))
+    return results
+
+def derived_path(table, gameworld, extension = "json", day = None):
+    """
+    Returns the path of a table derived from the dumps of a world (enriched
+    or events), next to the dumps: data/<folder>/<date>/<gameworld>.<extension>.
+
+    :param table: One of DERIVED_FOLDERS, e.g. "player_enriched" or "conquer"
+    :type table: str
+    :param gameworld: World identifier
+    :type gameworld: str
+    :param extension: File extension of the output format
+    :type extension: str
+    :param day: Snapshot date, "%Y-%m-%d", today if None
+    :type day: str
+
+    :rtype: str
+    """
+    return 'data/{}/{}/{}.{}'.format(DERIVED_FOLDERS[table], day or date, gameworld, extension)
 
-        if not os.path.exists("data/village-data"):
-            os.makedirs("data/village-data")
+def load_snapshot(dataset, gameworld, day, output_format = "json", storage_mode = "full"):
+    """
+    Reads back the last dump of a dataset of a world as of a day: the file
+    of the day, or of the last day it changed when it was unchanged (304).
+
+    :param dataset: Dataset name, one of FOLDERS
+    :type dataset: str
+    :param gameworld: World identifier
+    :type gameworld: str
+    :param day: Snapshot date, "%Y-%m-%d"
+    :type day: str
+    :param output_format: One of api.storage.writers.WRITERS
+    :type output_format: str
+    :param storage_mode: "full" or "delta", see api.storage.delta.DeltaStore
+    :type storage_mode: str
+
+    :return: The dump, None if there is none up to day
+    :rtype: pd.DataFrame
+    """
+    schema = SCHEMAS[dataset]
+    folder = "data/{}".format(FOLDERS[dataset])
+    if storage_mode == "delta":
+        return DeltaStore(folder, KEYS[dataset], output_format, schema).read(gameworld, day)
+    writer = get_writer(output_format, schema)
+    days = sorted(os.listdir(folder), reverse = True) if os.path.isdir(folder) else []
+    for name in days:
+        path = output_path(dataset, gameworld, writer.extension, name)
+        if name <= day and os.path.exists(path):
+            return writer.read(path)
+    return None
+
+def enrich_world(gameworld, day, output_format = "json", storage_mode = "full"):
+    """
+    Builds and writes the enriched player and ally tables of a world
+    (see api.twapi.enrich) from its dumps of the day, see derived_path.
+
+    :param gameworld: World identifier
+    :type gameworld: str
+    :param day: Snapshot date, "%Y-%m-%d"
+    :type day: str
+    :param output_format: One of api.storage.writers.WRITERS
+    :type output_format: str
+    :param storage_mode: Storage mode of the dumps read, "full" or "delta"
+    :type storage_mode: str
+
+    :return: The load and enrich stage records, and the path, rows, bytes
+        and checksum of each written table, as {table: file}
+    :rtype: tuple
+    """
+    metrics = Metrics()
+    frames = load_snapshots(FOLDERS, gameworld, day, output_format, storage_mode, metrics)
+    if any(frame is None for frame in frames.values()):
+        raise FileNotFoundError("{} has no dump of every dataset up to {}".format(gameworld, day))
+    with metrics.stage("enrich", gameworld) as stage:
+        tables = enrich(frames["player"], frames["ally"], frames["village"], frames["oda"], frames["odd"])
+        stage["rows"] = sum(len(table) for table in tables.values())
+    return metrics.records, write_tables(tables, ENRICHED_SCHEMAS, gameworld, day, output_format, metrics)
+
+def events_world(gameworld, day, output_format = "json", storage_mode = "full"):
+    """
+    Builds and writes the events of a world since its previous snapshot
+    (see api.twapi.events): villages conquered, points, ODA and ODD changes
+    and tribe changes, see derived_path. The previous snapshot is the last
+    dump before day, so a dataset unchanged today (304) has no events. The
+    first day of a world has no previous snapshot and empty event tables.
+
+    :param gameworld: World identifier
+    :type gameworld: str
+    :param day: Snapshot date, "%Y-%m-%d"
+    :type day: str
+    :param output_format: One of api.storage.writers.WRITERS
+    :type output_format: str
+    :param storage_mode: Storage mode of the dumps read, "full" or "delta"
+    :type storage_mode: str
+
+    :return: The load and diff stage records, and the path, rows, bytes
+        and checksum of each written table, as {table: file}
+    :rtype: tuple
+    """
+    metrics = Metrics()
+    datasets = ["village", "player", "oda", "odd"]
+    new = load_snapshots(datasets, gameworld, day, output_format, storage_mode, metrics)
+    if any(frame is None for frame in new.values()):
+        raise FileNotFoundError("{} has no dump of every dataset up to {}".format(gameworld, day))
+    previous = (pd.Timestamp(day) - pd.Timedelta(days = 1)).strftime("%Y-%m-%d")
+    old = load_snapshots(datasets, gameworld, previous, output_format, storage_mode, metrics)
+    with metrics.stage("diff", gameworld) as stage:
+        if any(frame is None for frame in old.values()):
+            tables = {name: pd.DataFrame(columns = list(schema.columns)) for name, schema in EVENT_SCHEMAS.items()}
+        else:
+            tables = diff(old, new, gameworld, day)
+        stage["rows"] = sum(len(table) for table in tables.values())
+    return metrics.records, write_tables(tables, EVENT_SCHEMAS, gameworld, day, output_format, metrics)
+
+def load_snapshots(datasets, gameworld, day, output_format, storage_mode, metrics):
+    """
+    Reads back the last dump of several datasets of a world as of a day,
+    see load_snapshot, recording a "load" stage per dataset.
 
-        if not os.path.exists("data/village-data/{}".format(date)):
-            os.makedirs("data/village-data/{}".format(date))
+    :return: {dataset: frame}, frame being None when there is no dump
+    :rtype: dict
+    """
+    frames = {}
+    for dataset in datasets:
+        with metrics.stage("load", gameworld, dataset) as stage:
+            frames[dataset] = load_snapshot(dataset, gameworld, day, output_format, storage_mode)
+            stage["rows"] = len(frames[dataset]) if frames[dataset] is not None else None
+    return frames
+
+def write_tables(tables, schemas, gameworld, day, output_format, metrics):
+    """
+    Writes the tables derived from the dumps of a world, see derived_path,
+    recording a "write" stage per table.
 
-        json_path = 'data/village-data/{}/{}.json'.format(date, getattr(obj, "gameworld"))
-        if not os.path.exists(json_path):
-            data = json.dumps(obj.get_village())
-            data = json.loads(data)
-            data = village_data_schema.validate(pd.DataFrame(data).T, lazy = True)
-            data.to_json(json_path, orient='records', lines=True)
+    :param tables: {table: frame}
+    :type tables: dict
+    :param schemas: {table: schema} used to write the tables
+    :type schemas: dict
 
-    return
\ No newline at end of file
+    :return: The path, rows, bytes and checksum of each written table, as {table: file}
+    :rtype: dict
+    """
+    files = {}
+    for name, table in tables.items():
+        with metrics.stage("write", gameworld, name) as stage:
+            writer = get_writer(output_format, schemas[name])
+            path = derived_path(name, gameworld, writer.extension, day)
+            writer.write(table, path)
+            stage["rows"], stage["bytes"] = len(table), os.path.getsize(path)
+        files[name] = {"path": path, "rows": len(table), "bytes": stage["bytes"], "checksum": file_checksum(path)}
+    return files
+
+def dump_stream(obj, dataset, schema, batch_size, validators = None, writer = None, validation = "pandera",
+                metrics = None, day = None):
+    """
+    Streams a dataset of one world into its file, batch by batch, so
+    memory is bounded by batch_size rather than by the world size.
+
+    Batches go to a temporary file that is renamed once complete, so a
+    crash never leaves a truncated file that looks dumped.
+
+    :param obj: World to fetch
+    :type obj: World
+    :param dataset: Dataset name, one of FOLDERS
+    :type dataset: str
+    :param schema: Pandera schema used to validate the dataset
+    :type schema: DataFrameSchema
+    :param batch_size: Maximum number of rows parsed, validated and written at once
+    :type batch_size: int
+    :param validators: Makes the download conditional when given
+    :type validators: ValidatorStore
+    :param writer: Output format writer, json lines if None
+    :type writer: JsonWriter
+    :param validation: "pandera" or "fast", see validate
+    :type validation: str
+    :param metrics: Records the stream stage, run_metrics if None
+    :type metrics: Metrics
+    :param day: Snapshot date, "%Y-%m-%d", today if None
+    :type day: str
+
+    :return: Number of rows written, None if the server answered 304 and nothing was written
+    :rtype: int
+    """
+    writer = writer if writer is not None else get_writer("json", schema)
+    metrics = metrics if metrics is not None else run_metrics
+    # download, parse, validate and write interleave, recorded as one stream stage
+    with metrics.stage("stream", obj.gameworld, dataset) as stage:
+        frames = obj.iter_frames(dataset, batch_size, validators, day or date)
+        if frames is None:
+            return None
+
+        path = output_path(dataset, obj.gameworld, writer.extension, day)
+        stage["rows"] = stage["dropped"] = 0
+        with writer.open(path) as f:
+            for frame in frames:
+                data = validate(schema, frame, validation, "{}:{}".format(obj.gameworld, dataset))
+                f.write(data)
+                stage["rows"] += len(data)
+                stage["dropped"] += len(frame) - len(data)
+        stage["bytes"] = os.path.getsize(path)
+    return stage["rows"]
+
+@flow(name="Replay raw archive")
+def replay_archive(start = None, end = None, tribalwars_server_list = None, output_format = "json",
+                   storage_mode = "full", base_every = 7, validation = "pandera", workers = None,
+                   archive = "data/raw"):
+    """
+    Rebuilds the dumps of past days from the raw archive, without the
+    network, e.g. after a schema change or a parser fix.
+
+    Every (world, dataset) replays its days in order (see replay_world),
+    in worker processes when workers is given, and the written files are
+    recorded in the run manifest of their day.
+
+    :param start: First day to replay, "%Y-%m-%d", the first archived day if None
+    :type start: str
+    :param end: Last day to replay, included, the last archived day if None
+    :type end: str
+    :param tribalwars_server_list: Only replay the worlds of these regions, every region if None
+    :type tribalwars_server_list: List[str]
+    :param output_format: One of api.storage.writers.WRITERS, "json" or "parquet"
+    :type output_format: str
+    :param storage_mode: "full" or "delta", see api.storage.delta.DeltaStore
+    :type storage_mode: str
+    :param base_every: Days between two full copies in delta mode
+    :type base_every: int
+    :param validation: "pandera" or "fast", see validate
+    :type validation: str
+    :param workers: Number of worker processes, e.g. os.cpu_count(), None to replay in the flow process
+    :type workers: int
+    :param archive: Root folder of the RawArchive
+    :type archive: str
+
+    :return: Number of files written
+    :rtype: int
+    """
+    store = RawArchive(archive)
+    chains = {}
+    for day in store.days(start, end):
+        index = store.index(day)
+        for key, digest in sorted(index["entries"].items()):
+            gameworld, dataset = key.split("/", 1)
+            region = index["worlds"].get(gameworld, {}).get("region")
+            if dataset not in FOLDERS:
+                continue
+            if tribalwars_server_list is not None and region not in tribalwars_server_list:
+                continue
+            chains.setdefault((gameworld, dataset), []).append((day, digest))
+
+    options = {"output_format": output_format, "storage_mode": storage_mode, "base_every": base_every,
+               "validation": validation}
+    jobs = {}
+    if workers:
+        pool = process_pool(workers)
+        for (gameworld, dataset), days in chains.items():
+            jobs[(gameworld, dataset)] = pool.submit(replay_world, archive, dataset, gameworld, days, **options)
+
+    manifests = set()
+    written = 0
+    errors = []
+    try:
+        for (gameworld, dataset), days in chains.items():
+            try:
+                if workers:
+                    results = jobs[(gameworld, dataset)].result()
+                else:
+                    results = replay_world(archive, dataset, gameworld, days, **options)
+            except Exception as error:
+                # the other worlds still replay, the flow fails at the end
+                logger.error("%s:%s replay failed: %s", gameworld, dataset, error)
+                errors.append(error)
+                continue
+            for day, records, output in results:
+                run_metrics.extend(records)
+                run_manifest(day).mark(gameworld, dataset, "written", save = False, **output)
+                manifests.add(day)
+                written += 1
+            logger.info("%s:%s replayed %d days", gameworld, dataset, len(results))
+    finally:
+        shutdown_pools()
+    for day in sorted(manifests):
+        run_manifest(day).save()
+    if errors:
+        raise errors[0]
+    return written
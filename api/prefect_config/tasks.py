@@ -1,30 +1,233 @@
 import sys
 sys.path.append("..")
 from api.twapi.baseserver import ServerBaseClass
+from api.storage.writers import get_writer
+from api.storage.catalog import Catalog
+from api.storage.history import HistoryStore
+from api.storage.manifest import checksum, file_checksum
+from api.storage.archive import RawArchive
+from api.twapi.world import World, CONFIGS
+from api.twapi.cache import ValidatorStore
+from api.twapi.metrics import Metrics
+from api.pandera.schemas import SCHEMAS
+from .subflows import dump_world, dump_stream, enrich_world, events_world, output_path, process_pool
+from .units import unit_cache_key, unit_session
 from prefect import task
+from requests import RequestException
 import os
-from datetime import datetime
+import logging
+from datetime import datetime, timedelta
+from functools import partial
 import json
 import pandas as pd
 
 date = str(datetime.now().strftime("%Y-%m-%d"))
 
+logger = logging.getLogger(__name__)
+
+# tables derived from the dumps of a world, built by derive_unit
+DERIVED = {"enriched": enrich_world,
+           "events": events_world}
+
 @task(name = "Fetch server data")
-def fetch_server_data(server):
+def fetch_server_data(server, output_format = "json", discovered = None):
+    """
+    Dumps the table of active servers of every region.
+
+    :param server: Base URL domains of the regions
+    :type server: List[str]
+    :param output_format: One of api.storage.writers.WRITERS, "json" or "parquet"
+    :type output_format: str
+    :param discovered: {region: {gameworld: url}} found by the discovery step
+        of the flow, regions missing from it are looked up (and cached) by
+        ServerBaseClass.get_active_servers
+    :type discovered: dict
+
+    :return: Path of the overwritten data/server-data/server_data.<extension>,
+        None if no region answered
+    :rtype: str
+    """
     data_list = []
+    base = ServerBaseClass()
     for _server in server:
-        data = ServerBaseClass().get_servers_table(server=_server)
+        try:
+            data = base.get_servers_table(_server, (discovered or {}).get(_server))
+        except (RequestException, ValueError) as error:
+            # unreachable, or answering something else than a server list
+            logger.error("%s skipped, server list unavailable: %s", _server, error)
+            continue
         data_list.append(data)
+    if not data_list:
+        return None
 
-    data_list = pd.concat(data_list).to_json(orient = "records")
+    writer = get_writer(output_format)
+    path = 'data/server-data/server_data.{}'.format(writer.extension)
+    # overwrite
+    writer.write(pd.concat(data_list), path)
+    return path
 
-    if not os.path.exists("data"):
-        os.makedirs("data")
+@task(name = "Refresh catalog")
+def refresh_catalog():
+    """
+    Loads the snapshot files written since the last refresh into the
+    SQLite catalog (data/catalog.sqlite).
 
-    if not os.path.exists("data/server-data"):
-        os.makedirs("data/server-data")
-        
-    json_path = 'data/server-data/server_data.json'.format(date)
-    # overwrite
-    with open(json_path, 'w') as f:
-        json.dump(data_list, f)  
\ No newline at end of file
+    :return: Number of files loaded
+    :rtype: int
+    """
+    catalog = Catalog()
+    try:
+        return catalog.refresh()
+    finally:
+        catalog.close()
+
+@task(name = "Compact history")
+def compact_history(worlds = None, months = None):
+    """
+    Merges the daily files written since the last compaction into the
+    monthly history files (data/history), see HistoryStore.
+
+    :param worlds: World identifiers to compact, every world if None
+    :type worlds: List[str]
+    :param months: Months to compact, "%Y-%m", every month if None
+    :type months: List[str]
+
+    :return: Number of days added or replaced
+    :rtype: int
+    """
+    return HistoryStore().compact(worlds = worlds, months = months)
+
+@task(name = "Publish run metrics")
+def publish_metrics(summary):
+    """
+    Publishes a run summary (api.twapi.metrics.Metrics.summary) as Prefect
+    artifacts: a table of the totals per stage and one of the worlds,
+    slowest first.
+
+    :param summary: Run summary
+    :type summary: dict
+
+    :return: None
+    :rtype: None
+    """
+    from prefect.artifacts import create_table_artifact
+
+    create_table_artifact(key = "run-metrics-stages",
+                          table = [dict(stage = stage, **total) for stage, total in summary["stages"].items()],
+                          description = "Totals per stage, run started {}".format(summary["started"]))
+    create_table_artifact(key = "run-metrics-worlds",
+                          table = summary["worlds"],
+                          description = "Totals per world, slowest first")
+
+@task(name = "Dump world dataset",
+      task_run_name = "{unit.gameworld}:{unit.dataset}",
+      cache_key_fn = unit_cache_key,
+      cache_expiration = timedelta(days = 1),
+      persist_result = True)
+def dump_unit(unit, output_format = "json", storage_mode = "full", base_every = 7, validation = "pandera",
+              batch_size = None, workers = None, validators = None, session_options = None, archive = None):
+    """
+    Downloads, parses, validates and writes one dataset of one world.
+    Configuration units (a kind of CONFIGS) are only downloaded into the
+    raw archive.
+
+    Only gets the immutable unit and plain options, and returns what the
+    flow records instead of touching the run manifest, run_metrics or the
+    validator store itself, so units run side by side under any task
+    runner (threads, processes, Dask).
+
+    :param unit: The world and dataset to dump
+    :type unit: WorkUnit
+    :param output_format: One of api.storage.writers.WRITERS
+    :type output_format: str
+    :param storage_mode: "full" or "delta", see api.storage.delta.DeltaStore
+    :type storage_mode: str
+    :param base_every: Days between two full copies in delta mode
+    :type base_every: int
+    :param validation: "pandera" or "fast", see validate
+    :type validation: str
+    :param batch_size: Stream village.txt in batches of this many rows, see dump_stream
+    :type batch_size: int
+    :param workers: Parse, validate and write in a pool of this many processes
+    :type workers: int
+    :param validators: Committed ETag/Last-Modified of the url, the request
+        is conditional when given
+    :type validators: dict
+    :param session_options: per_host, requests_per_second and retries of unit_session
+    :type session_options: dict
+    :param archive: Root folder of a RawArchive keeping the raw response
+    :type archive: str
+
+    :return: state ("written", "unchanged" or "archived"), the stage
+        records, the new validators of the url and, once written, the path,
+        rows, bytes and checksum of the file and the raw_bytes and
+        raw_checksum of the download, the key of the archived response
+    :rtype: dict
+    """
+    metrics = Metrics()
+    obj = World(unit.gameworld, unit.server, unit_session(**(session_options or {})))
+    url = obj.url(unit.dataset)
+    if unit.dataset in CONFIGS:
+        with metrics.stage("download", unit.gameworld, unit.dataset) as stage:
+            response = obj.session.get(url)
+            response.raise_for_status()
+            stage["bytes"] = len(response.content)
+        return {"state": "archived", "records": metrics.records, "validators": None,
+                "raw_bytes": len(response.content), "raw_checksum": RawArchive(archive).put(response.text)}
+    store = None
+    if validators is not None:
+        store = ValidatorStore(None)
+        store.commit(url, validators)
+    schema = SCHEMAS[unit.dataset]
+
+    if batch_size and unit.dataset == "village":
+        writer = get_writer(output_format, schema)
+        rows = dump_stream(obj, unit.dataset, schema, batch_size, store, writer, validation, metrics, unit.day)
+        output = None
+        if rows is not None:
+            path = output_path(unit.dataset, unit.gameworld, writer.extension, unit.day)
+            output = {"path": path, "rows": rows, "bytes": os.path.getsize(path), "checksum": file_checksum(path)}
+    else:
+        data = obj.download(unit.dataset, store, metrics)
+        output = None
+        if data is not None:
+            dump = partial(dump_world, unit.dataset, unit.gameworld, data, unit.day, output_format,
+                           storage_mode, base_every, validation)
+            records, output = process_pool(workers).submit(dump).result() if workers else dump()
+            metrics.extend(records)
+            # the archive is keyed by the same checksum
+            output.update(raw_bytes = len(data),
+                          raw_checksum = RawArchive(archive).put(data) if archive is not None else checksum(data))
+
+    if output is None:
+        # 304, unchanged since the last dump
+        return {"state": "unchanged", "records": metrics.records, "validators": None}
+    return dict(output, state = "written", records = metrics.records,
+                validators = store.pending(url) if store is not None else None)
+
+@task(name = "Derive world tables",
+      task_run_name = "{unit.gameworld}:{unit.dataset}")
+def derive_unit(unit, output_format = "json", storage_mode = "full", workers = None):
+    """
+    Builds tables derived from the dumps of one world: its enriched player
+    and ally tables when unit.dataset is "enriched" (see
+    subflows.enrich_world), its events since the previous snapshot when it
+    is "events" (see subflows.events_world). Reads files only, so it runs
+    once every dataset of the world is done for the day.
+
+    :param unit: The world, and the tables to build as dataset
+    :type unit: WorkUnit
+    :param output_format: One of api.storage.writers.WRITERS
+    :type output_format: str
+    :param storage_mode: Storage mode of the dumps read, "full" or "delta"
+    :type storage_mode: str
+    :param workers: Build in a pool of this many processes
+    :type workers: int
+
+    :return: The stage records, and the path, rows, bytes and checksum of
+        each written table, as {table: file}
+    :rtype: dict
+    """
+    build = partial(DERIVED[unit.dataset], unit.gameworld, unit.day, output_format, storage_mode)
+    records, files = process_pool(workers).submit(build).result() if workers else build()
+    return {"records": records, "files": files}
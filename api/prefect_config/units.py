@@ -0,0 +1,126 @@
+import sys
+sys.path.append("..")
+from api.twapi.session import Session
+from api.twapi.policy import FetchPolicy
+from typing import NamedTuple
+from urllib.parse import urlparse
+import hashlib
+import json
+import queue
+import threading
+
+# one session per process and settings, shared by the units it runs
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+class WorkUnit(NamedTuple):
+    """
+    One dataset of one world, as dumped by the dump_unit task.
+
+    Only holds strings, so it pickles to any task runner (threads,
+    processes, Dask) and names and caches its task deterministically,
+    unlike the World objects and their session.
+    """
+    gameworld: str
+    server: str
+    dataset: str
+    day: str
+
+    @property
+    def host(self):
+        return urlparse(self.server).netloc
+
+def plan_units(worlds, datasets, day):
+    """
+    Returns the work units of every dataset of every world, world by world,
+    so the datasets of a world and different worlds run side by side.
+
+    :param worlds: List of objects of class World
+    :type worlds: List[World]
+    :param datasets: Dataset names, see api.twapi.world.DATASETS
+    :type datasets: List[str]
+    :param day: Snapshot date, "%Y-%m-%d"
+    :type day: str
+
+    :rtype: List[WorkUnit]
+    """
+    return [WorkUnit(obj.gameworld, obj.server, dataset, day)
+            for obj in worlds for dataset in datasets]
+
+def unit_cache_key(context, parameters):
+    """
+    Prefect cache key of a dump_unit run: the day, world, dataset, the
+    options shaping the written file, the archive folder and the
+    validators of a conditional request, which decide whether the file is
+    unchanged. Transport options (workers, session) dont change the result
+    and are left out.
+
+    :rtype: str
+    """
+    unit = parameters["unit"]
+    options = {name: parameters.get(name) for name in ("output_format", "storage_mode", "base_every",
+                                                        "validation", "batch_size", "validators",
+                                                        "archive")}
+    digest = hashlib.sha256(json.dumps(options, sort_keys = True).encode("utf-8")).hexdigest()[:16]
+    return "twapi-{}-{}-{}-{}".format(unit.day, unit.gameworld, unit.dataset, digest)
+
+def unit_session(per_host = 4, requests_per_second = 5, retries = 3):
+    """
+    Returns the session of the current process for these settings, created
+    on first use. Units run by the threads of a process share it, and so
+    its rate limits, while processes and Dask workers get their own.
+
+    :param per_host: Connections kept alive per host
+    :type per_host: int
+    :param requests_per_second: Requests per second sent to each host, None for no limit
+    :type requests_per_second: float
+    :param retries: Retries of a failed request
+    :type retries: int
+
+    :rtype: Session
+    """
+    key = (per_host, requests_per_second, retries)
+    with _sessions_lock:
+        if key not in _sessions:
+            _sessions[key] = Session(pool_maxsize = per_host,
+                                     policy = FetchPolicy(rate = requests_per_second, retries = retries))
+        return _sessions[key]
+
+def run_units(units, submit, max_concurrency = 16, per_host = 4):
+    """
+    Submits the units to the task runner of the flow, keeping at most
+    max_concurrency of them, and per_host per host, in flight. This bounds
+    the memory held by downloaded files and the load put on every host,
+    whatever the task runner.
+
+    :param units: Units to run
+    :type units: List[WorkUnit]
+    :param submit: Submits a unit, returns its PrefectFuture
+    :type submit: Callable
+    :param max_concurrency: Maximum number of units in flight
+    :type max_concurrency: int
+    :param per_host: Maximum number of units in flight per host
+    :type per_host: int
+
+    :return: Yields (unit, future) as the units finish
+    :rtype: generator
+    """
+    waiting = list(units)
+    running = {}
+    hosts = {}
+    # every future puts itself there once when it finishes, whatever the task runner
+    finished = queue.SimpleQueue()
+    while waiting or running:
+        for unit in list(waiting):
+            if len(running) >= max_concurrency:
+                break
+            if hosts.get(unit.host, 0) < per_host:
+                waiting.remove(unit)
+                hosts[unit.host] = hosts.get(unit.host, 0) + 1
+                future = submit(unit)
+                running[future] = unit
+                future.add_done_callback(finished.put)
+        future = finished.get()
+        unit = running.pop(future)
+        hosts[unit.host] -= 1
+        yield unit, future
@@ -0,0 +1,168 @@
+import os
+import gzip
+import json
+import threading
+from .layout import ROOT
+from .writers import fsync
+from .manifest import checksum
+
+#: gzip level of the archived objects, fast to write and to read back.
+COMPRESSION_LEVEL = 6
+
+class RawArchive:
+    """Content addressed archive of the raw responses (map files and configs).
+
+    Every response is stored once, gzipped, under objects/<sha[:2]>/<sha>.gz,
+    so a file that didnt change between two days costs nothing. A json
+    index per day maps each <world>/<name> (a dataset or a config kind) to
+    the checksum of its response, and records the server and region of
+    every world, which is all a replay needs to rebuild the dumps of that
+    day without the network.
+
+    Objects are written atomically and are immutable, so any process may
+    add them. The indexes are only written by the process running the flow,
+    the worker of a sharded run writing its own, <day>.<shard>.json, which
+    an archive opened without a shard reads as part of the day.
+
+    Attributes:
+        root (str): Folder of the archive, <data>/raw by default.
+        shard (str): Name of the shard whose index is written, None for the whole run.
+    """
+
+    def __init__(self, root: str = os.path.join(ROOT, "raw"), shard: str = None):
+        """Constructor for the RawArchive class.
+
+        Args:
+            root (str): Folder of the archive.
+            shard (str): Name of a shard, e.g. "shard-0-of-4".
+        """
+        self.root = root
+        self.shard = shard
+        self._indexes = {}
+        self._lock = threading.Lock()
+
+    def _object(self, digest: str) -> str:
+        digest = digest.split(":", 1)[-1]
+        return(os.path.join(self.root, "objects", digest[:2], "{}.gz".format(digest)))
+
+    def _index_path(self, day: str) -> str:
+        name = day if self.shard is None else "{}.{}".format(day, self.shard)
+        return(os.path.join(self.root, "index", "{}.json".format(name)))
+
+    def _index_paths(self, day: str) -> list:
+        """Index files of a day: its own, and without a shard, those of every shard."""
+        if self.shard is not None:
+            return([self._index_path(day)] if os.path.exists(self._index_path(day)) else [])
+        folder = os.path.join(self.root, "index")
+        names = sorted(os.listdir(folder)) if os.path.isdir(folder) else []
+        return([os.path.join(folder, name) for name in names
+                if name == "{}.json".format(day) or (name.startswith(day + ".") and name.endswith(".json"))])
+
+    def put(self, text: str) -> str:
+        """Store a response, unless an identical one is already stored.
+
+        Args:
+            text (str): The raw response.
+
+        Returns:
+            str: Its checksum, "sha256:<hex>", the key of get_object.
+        """
+        data = text.encode("utf-8")
+        digest = checksum(data)
+        path = self._object(digest)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # unique per process and thread, two writers of the same object dont share a temporary file
+            tmp = "{}.{}.{}.tmp".format(path, os.getpid(), threading.get_ident())
+            with open(tmp, "wb") as f:
+                f.write(gzip.compress(data, COMPRESSION_LEVEL))
+            fsync(tmp)
+            os.replace(tmp, path)
+        return(digest)
+
+    def get_object(self, digest: str) -> str:
+        """Read a stored response back."""
+        with open(self._object(digest), "rb") as f:
+            return(gzip.decompress(f.read()).decode("utf-8"))
+
+    def has_object(self, digest: str) -> bool:
+        return(os.path.exists(self._object(digest)))
+
+    def index(self, day: str) -> dict:
+        """Get the index of a day: {"worlds": {world: {"server", "region"}}, "entries": {"<world>/<name>": checksum}}."""
+        with self._lock:
+            if day not in self._indexes:
+                index = {"worlds": {}, "entries": {}}
+                for path in self._index_paths(day):
+                    with open(path) as f:
+                        content = json.load(f)
+                    index["worlds"].update(content["worlds"])
+                    index["entries"].update(content["entries"])
+                self._indexes[day] = index
+            return(self._indexes[day])
+
+    def save(self, day: str) -> None:
+        """Write the index of a day, atomically."""
+        index = self.index(day)
+        path = self._index_path(day)
+        with self._lock:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path + ".tmp", "w") as f:
+                json.dump(index, f, indent=1)
+            fsync(path + ".tmp")
+            os.replace(path + ".tmp", path)
+
+    def add_worlds(self, day: str, region: str, worlds: dict, save: bool = True) -> None:
+        """Record the {gameworld: url} of a region for a day."""
+        index = self.index(day)
+        with self._lock:
+            for gameworld, server in worlds.items():
+                index["worlds"][gameworld] = {"server": server, "region": region}
+        if save:
+            self.save(day)
+
+    def record(self, day: str, gameworld: str, name: str, digest: str, save: bool = True) -> None:
+        """Record that the <name> response of a world on a day is the object digest.
+
+        Args:
+            day (str): Day of the response, "%Y-%m-%d".
+            gameworld (str): The game world identifier.
+            name (str): Dataset name or config kind.
+            digest (str): Checksum returned by put.
+            save (bool): Write the index now.
+        """
+        index = self.index(day)
+        with self._lock:
+            index["entries"]["{}/{}".format(gameworld, name)] = digest
+        if save:
+            self.save(day)
+
+    def entry(self, day: str, gameworld: str, name: str) -> str:
+        """Get the checksum of the <name> response of a world on a day, None if it wasnt archived."""
+        return(self.index(day)["entries"].get("{}/{}".format(gameworld, name)))
+
+    def get(self, day: str, gameworld: str, name: str) -> str:
+        """Get the archived <name> response of a world on a day, None if it wasnt archived."""
+        digest = self.entry(day, gameworld, name)
+        return(self.get_object(digest) if digest is not None else None)
+
+    def latest(self, gameworld: str, name: str, before: str) -> str:
+        """Get the checksum of the last <name> response of a world archived before a day, None if there is none.
+
+        Used for the files that didnt change (304), whose day points to the
+        response they are identical to.
+        """
+        for day in reversed(self.days()):
+            if day < before:
+                digest = self.index(day)["entries"].get("{}/{}".format(gameworld, name))
+                if digest is not None:
+                    return(digest)
+        return(None)
+
+    def days(self, start: str = None, end: str = None) -> list:
+        """Get the archived days, sorted, optionally between start and end included."""
+        folder = os.path.join(self.root, "index")
+        if not os.path.isdir(folder):
+            return([])
+        days = sorted(set(name.split(".")[0] for name in os.listdir(folder) if name.endswith(".json")))
+        return([day for day in days if (start is None or day >= start) and (end is None or day <= end)])
@@ -0,0 +1,148 @@
+import os
+import sqlite3
+import pandas as pd
+from api.pandera.schemas import SCHEMAS
+from .layout import ROOT, FOLDERS, snapshot_files
+from .delta import DeltaStore, KEYS
+from .writers import get_writer
+
+#: Indexed columns of each table, besides (server, date).
+INDEXES = {"village": ["village_id", "player_id"],
+           "player": ["player_id", "ally_id"],
+           "ally": ["ally_id"],
+           "odd": ["player_id"],
+           "oda": ["player_id"]}
+
+class Catalog:
+    """Embedded SQLite catalog over the dumped snapshots.
+
+    Every dataset gets a table with the columns of its pandera schema, the
+    datetime column being stored as a "%Y-%m-%d" date, indexed on
+    (server, <entity id>, date) for time series lookups. refresh() only
+    loads the snapshot files that are new or changed since the last call,
+    so it can run after every flow run.
+
+    Attributes:
+        path (str): SQLite database file.
+        root (str): Root folder of the dumps.
+    """
+
+    def __init__(self, path: str = os.path.join(ROOT, "catalog.sqlite"), root: str = ROOT):
+        """Constructor for the Catalog class.
+
+        Args:
+            path (str): SQLite database file, created if missing.
+            root (str): Root folder of the dumps.
+        """
+        self.path = path
+        self.root = root
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.connection = sqlite3.connect(path)
+        self._create()
+
+    def _create(self):
+        with self.connection:
+            self.connection.execute("CREATE TABLE IF NOT EXISTS files ("
+                                    "path TEXT PRIMARY KEY, dataset TEXT, server TEXT, date TEXT, "
+                                    "mtime REAL, size INTEGER)")
+            for dataset, schema in SCHEMAS.items():
+                columns = []
+                for name, column in schema.columns.items():
+                    if name == "datetime":
+                        columns.append("date TEXT NOT NULL")
+                    else:
+                        kind = "INTEGER" if str(column.dtype).startswith("int") else "TEXT"
+                        columns.append("{} {}".format(name, kind))
+                self.connection.execute("CREATE TABLE IF NOT EXISTS {} ({})".format(dataset, ", ".join(columns)))
+                self.connection.execute("CREATE INDEX IF NOT EXISTS {0}_day ON {0} (server, date)".format(dataset))
+                for column in INDEXES[dataset]:
+                    self.connection.execute("CREATE INDEX IF NOT EXISTS {0}_{1} ON {0} (server, {1}, date)"
+                                            .format(dataset, column))
+
+    def _read(self, dataset, date, gameworld, kind, extension, path) -> pd.DataFrame:
+        if kind == "full":
+            return(get_writer(extension, SCHEMAS[dataset]).read(path))
+        store = DeltaStore(os.path.join(self.root, FOLDERS[dataset]), KEYS[dataset], extension, SCHEMAS[dataset])
+        return(store.read(gameworld, date))
+
+    def refresh(self) -> int:
+        """Load the new or changed snapshot files into the catalog.
+
+        A changed file replaces the rows of its (dataset, world, date).
+
+        Returns:
+            int: Number of files loaded.
+        """
+        known = {path: (mtime, size) for path, mtime, size
+                 in self.connection.execute("SELECT path, mtime, size FROM files")}
+        loaded = 0
+        for dataset, date, gameworld, kind, extension, path in snapshot_files(self.root):
+            stat = os.stat(path)
+            if known.get(path) == (stat.st_mtime, stat.st_size):
+                continue
+
+            frame = self._read(dataset, date, gameworld, kind, extension, path)
+            frame = frame.drop(columns=["datetime"], errors="ignore").assign(date=date, server=gameworld)
+            columns = [("date" if name == "datetime" else name) for name in SCHEMAS[dataset].columns]
+            with self.connection:
+                self.connection.execute("DELETE FROM {} WHERE server = ? AND date = ?".format(dataset),
+                                        (gameworld, date))
+                frame.reindex(columns=columns).to_sql(dataset, self.connection, if_exists="append",
+                                                      index=False, chunksize=50000)
+                self.connection.execute("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?)",
+                                        (path, dataset, gameworld, date, stat.st_mtime, stat.st_size))
+            loaded += 1
+        return(loaded)
+
+    def query(self, sql: str, params=()) -> pd.DataFrame:
+        """Run any SQL query against the catalog.
+
+        Args:
+            sql (str): The query, tables are named after the datasets
+                (village, player, ally, odd, oda).
+            params (tuple): Query parameters.
+
+        Returns:
+            pd.DataFrame: The result, with date columns as datetime64.
+        """
+        frame = pd.read_sql_query(sql, self.connection, params=params)
+        if "date" in frame:
+            frame["date"] = pd.to_datetime(frame["date"])
+        return(frame)
+
+    def history(self, dataset: str, server: str, key: str, value: int, start: str = None,
+                end: str = None) -> pd.DataFrame:
+        """Get the rows of one entity over a date range, oldest first.
+
+        Args:
+            dataset (str): Table to read, one of SCHEMAS.
+            server (str): The game world identifier.
+            key (str): Indexed column identifying the entity, see INDEXES.
+            value (int): Id of the entity.
+            start (str): First date included, "%Y-%m-%d".
+            end (str): Last date included, "%Y-%m-%d".
+        """
+        if key not in INDEXES[dataset]:
+            raise ValueError("{} is not indexed in {}, expected one of {}".format(key, dataset, INDEXES[dataset]))
+        return(self.query("SELECT * FROM {} WHERE server = ? AND {} = ? AND date BETWEEN ? AND ? "
+                          "ORDER BY date".format(dataset, key),
+                          (server, int(value), start or "0000-00-00", end or "9999-99-99")))
+
+    def player_history(self, server: str, player_id: int, start: str = None, end: str = None) -> pd.DataFrame:
+        """Get the player.txt rows of a player over a date range."""
+        return(self.history("player", server, "player_id", player_id, start, end))
+
+    def ally_history(self, server: str, ally_id: int, start: str = None, end: str = None) -> pd.DataFrame:
+        """Get the ally.txt rows of a tribe over a date range."""
+        return(self.history("ally", server, "ally_id", ally_id, start, end))
+
+    def village_history(self, server: str, village_id: int, start: str = None, end: str = None) -> pd.DataFrame:
+        """Get the village.txt rows of a village over a date range."""
+        return(self.history("village", server, "village_id", village_id, start, end))
+
+    def snapshot(self, dataset: str, server: str, date: str) -> pd.DataFrame:
+        """Get the full table of a dataset for one world and date."""
+        return(self.query("SELECT * FROM {} WHERE server = ? AND date = ?".format(dataset), (server, date)))
+
+    def close(self) -> None:
+        self.connection.close()
@@ -0,0 +1,158 @@
+import os
+from datetime import datetime
+import pandas as pd
+from pandera import Column
+from api.twapi.parsing import KEYS
+from .writers import get_writer
+
+#: Column of a delta holding the operation: I(nserted), U(pdated) or D(eleted).
+OP = "op"
+
+def diff(old: pd.DataFrame, new: pd.DataFrame, key: str) -> pd.DataFrame:
+    """Get the rows that changed between two snapshots of a dataset.
+
+    The datetime column is ignored, it differs on every snapshot.
+
+    Args:
+        old (pd.DataFrame): Previous snapshot.
+        new (pd.DataFrame): Current snapshot.
+        key (str): Column identifying a row.
+
+    Returns:
+        pd.DataFrame: Inserted and updated rows with their new values and
+        deleted rows with their last values, plus an OP column.
+    """
+    old = old.set_index(key)
+    new = new.set_index(key)
+    columns = [column for column in new.columns if column != "datetime"]
+
+    common = new.index.intersection(old.index)
+    before = old.loc[common, columns]
+    after = new.loc[common, columns]
+    same = (before == after) | (before.isna() & after.isna())
+    updated = common[~same.all(axis=1).to_numpy()]
+
+    changes = [new.loc[new.index.difference(old.index)].assign(**{OP: "I"}),
+               new.loc[updated].assign(**{OP: "U"}),
+               old.loc[old.index.difference(new.index)].assign(**{OP: "D"})]
+    return(pd.concat(changes).reset_index()[[key] + list(new.columns) + [OP]])
+
+class DeltaStore:
+    """Stores a dataset as periodic full snapshots plus daily deltas.
+
+    Files keep the usual dataset/date/world partitioning:
+    <root>/<date>/<world>.base.<extension> holds a full snapshot and
+    <root>/<date>/<world>.delta.<extension> the rows inserted, updated or
+    deleted since the previous day. A new base is written every base_every
+    days, which bounds how many deltas a read has to apply.
+
+    Attributes:
+        root (str): Folder of the dataset, e.g. data/village-data.
+        key (str): Key column of the dataset.
+        base_every (int): Days between two full snapshots.
+    """
+
+    def __init__(self, root: str, key: str, output_format: str = "json", schema = None,
+                 base_every: int = 7):
+        """Constructor for the DeltaStore class.
+
+        Args:
+            root (str): Folder of the dataset, e.g. data/village-data.
+            key (str): Key column of the dataset, see KEYS.
+            output_format (str): One of api.storage.writers.WRITERS.
+            schema (DataFrameSchema): Pandera schema of the dataset.
+            base_every (int): Days between two full snapshots.
+        """
+        self.root = root
+        self.key = key
+        self.base_every = base_every
+        self.writer = get_writer(output_format, schema)
+        self.delta_writer = get_writer(output_format,
+                                       schema.add_columns({OP: Column(str)}) if schema is not None else None)
+
+    def path(self, gameworld: str, date: str, kind: str) -> str:
+        """Get the path of the "base" or "delta" file of a world at a date."""
+        return(os.path.join(self.root, date, "{}.{}.{}".format(gameworld, kind, self.writer.extension)))
+
+    def history(self, gameworld: str, until: str = None) -> list:
+        """List the files of a world, oldest first.
+
+        Args:
+            gameworld (str): The game world identifier.
+            until (str): Last date included, "%Y-%m-%d". Every date if None.
+
+        Returns:
+            list: (date, kind, path) tuples, kind being "base" or "delta".
+        """
+        if not os.path.isdir(self.root):
+            return([])
+        files = []
+        for date in sorted(os.listdir(self.root)):
+            if until is not None and date > until:
+                break
+            for kind in ("base", "delta"):
+                path = self.path(gameworld, date, kind)
+                if os.path.exists(path):
+                    files.append((date, kind, path))
+        return(files)
+
+    def exists(self, gameworld: str, date: str) -> bool:
+        """Whether the snapshot of a world was already stored for a date."""
+        return(any(os.path.exists(self.path(gameworld, date, kind)) for kind in ("base", "delta")))
+
+    def read(self, gameworld: str, date: str) -> pd.DataFrame:
+        """Rebuild the full table of a world as of a date.
+
+        Starts from the last base up to the date and applies every later
+        delta in one pass: the latest change of each key wins.
+
+        Args:
+            gameworld (str): The game world identifier.
+            date (str): Snapshot date, "%Y-%m-%d".
+
+        Returns:
+            pd.DataFrame: The full table sorted by key, with the datetime of
+            the last stored day, or None if nothing was stored up to date.
+        """
+        files = self.history(gameworld, date)
+        bases = [i for i, (_, kind, _) in enumerate(files) if kind == "base"]
+        if not bases:
+            return(None)
+
+        table = self.writer.read(files[bases[-1]][2])
+        deltas = [self.delta_writer.read(path) for _, _, path in files[bases[-1] + 1:]]
+        deltas = [delta for delta in deltas if len(delta)]
+        if deltas:
+            changes = pd.concat(deltas).drop_duplicates(self.key, keep="last")
+            table = table[~table[self.key].isin(changes[self.key])]
+            changes = changes[changes[OP] != "D"].drop(columns=OP)
+            table = pd.concat([table, changes[table.columns]])
+        table = table.sort_values(self.key).reset_index(drop=True)
+        table["datetime"] = pd.Timestamp(files[-1][0])
+        return(table)
+
+    def write(self, frame: pd.DataFrame, gameworld: str, date: str) -> str:
+        """Store the snapshot of a world for a date.
+
+        Writes a base when there is none yet or the last one is at least
+        base_every days old, a delta against the previous day otherwise.
+
+        Args:
+            frame (pd.DataFrame): Full validated snapshot.
+            gameworld (str): The game world identifier.
+            date (str): Snapshot date, "%Y-%m-%d".
+
+        Returns:
+            str: "base" or "delta", the kind of file written.
+        """
+        files = [file for file in self.history(gameworld, date) if file[0] < date]
+        bases = [file[0] for file in files if file[1] == "base"]
+        age = (datetime.strptime(date, "%Y-%m-%d") - datetime.strptime(bases[-1], "%Y-%m-%d")).days if bases else None
+
+        if age is None or age >= self.base_every:
+            self.writer.write(frame, self.path(gameworld, date, "base"))
+            return("base")
+
+        previous = self.read(gameworld, files[-1][0])
+        self.delta_writer.write(diff(previous, frame, self.key), self.path(gameworld, date, "delta"))
+        return("delta")
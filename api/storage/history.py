@@ -0,0 +1,191 @@
+import os
+import json
+import pandas as pd
+from api.pandera.schemas import SCHEMAS
+from .layout import ROOT, FOLDERS, snapshot_files
+from .delta import DeltaStore, KEYS
+from .writers import get_writer, arrow_schema, fsync
+
+#: Folder of the compacted history, under the root of the dumps.
+HISTORY = "history"
+
+class HistoryStore:
+    """Monthly compacted history of the daily dumps.
+
+    The daily files of a dataset and world are merged into one Parquet file
+    per month, <root>/history/<dataset>/<world>/<YYYY-MM>.parquet, sorted
+    by the key of the dataset (see KEYS) then by date, so the history of an
+    entity is contiguous. String columns (names, tags, server) are
+    dictionary encoded, stored once per file instead of once per row, and
+    read back as categoricals.
+
+    <root>/history/<dataset>/<world>/index.json records, per month, the
+    days it holds with their rows and the size and mtime of their daily
+    file. A date range read only opens the months it covers, and
+    compact() only reads the daily files that are new or changed since the
+    last call, so it is idempotent and can run after every flow run. The
+    days of daily files deleted since stay in the history.
+
+    Attributes:
+        root (str): Root folder of the dumps.
+        compression (str): Parquet compression codec.
+    """
+
+    def __init__(self, root: str = ROOT, compression: str = "zstd"):
+        """Constructor for the HistoryStore class.
+
+        Args:
+            root (str): Root folder of the dumps, the history is <root>/history.
+            compression (str): Parquet compression codec.
+        """
+        import pyarrow
+        import pyarrow.parquet
+        self.pa = pyarrow
+        self.pq = pyarrow.parquet
+        self.root = root
+        self.compression = compression
+
+    def path(self, dataset: str, gameworld: str, month: str) -> str:
+        """Get the file of a month, "%Y-%m", of a dataset and world."""
+        return(os.path.join(self.root, HISTORY, dataset, gameworld, "{}.parquet".format(month)))
+
+    def _index_path(self, dataset: str, gameworld: str) -> str:
+        return(os.path.join(self.root, HISTORY, dataset, gameworld, "index.json"))
+
+    def index(self, dataset: str, gameworld: str) -> dict:
+        """Get the index of a dataset and world: {month: {"rows", "bytes", "days": {date: {"rows", "source"}}}}."""
+        path = self._index_path(dataset, gameworld)
+        if not os.path.exists(path):
+            return({})
+        with open(path) as f:
+            return(json.load(f))
+
+    def _save_index(self, dataset: str, gameworld: str, index: dict) -> None:
+        path = self._index_path(dataset, gameworld)
+        with open(path + ".tmp", "w") as f:
+            json.dump(index, f, indent=1, sort_keys=True)
+        fsync(path + ".tmp")
+        os.replace(path + ".tmp", path)
+
+    def schema(self, dataset: str):
+        """Get the Arrow schema of the files of a dataset, string columns dictionary encoded."""
+        fields = []
+        for field in arrow_schema(SCHEMAS[dataset]):
+            if field.type == self.pa.string():
+                field = field.with_type(self.pa.dictionary(self.pa.int32(), self.pa.string()))
+            fields.append(field)
+        return(self.pa.schema(fields))
+
+    def _read_day(self, dataset, date, gameworld, kind, extension, path) -> pd.DataFrame:
+        if kind == "full":
+            return(get_writer(extension, SCHEMAS[dataset]).read(path))
+        store = DeltaStore(os.path.join(self.root, FOLDERS[dataset]), KEYS[dataset], extension, SCHEMAS[dataset])
+        return(store.read(gameworld, date))
+
+    def _write(self, frame: pd.DataFrame, dataset: str, path: str) -> None:
+        schema = self.schema(dataset)
+        columns = {}
+        for field in schema:
+            column = frame[field.name]
+            if self.pa.types.is_dictionary(field.type):
+                # categoricals of different days dont share their categories, encode again
+                column = column.astype(object).where(column.notna(), None)
+            columns[field.name] = column
+        table = self.pa.Table.from_pandas(pd.DataFrame(columns), schema=schema, preserve_index=False)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.pq.write_table(table, path + ".tmp", compression=self.compression, use_dictionary=True)
+        fsync(path + ".tmp")
+        os.replace(path + ".tmp", path)
+
+    def compact(self, datasets: list = None, worlds: list = None, months: list = None) -> int:
+        """Merge the new or changed daily files into the monthly files.
+
+        Each month to update is read once, its replaced days dropped, the
+        new days appended and the whole month sorted and written again,
+        atomically, before its index.
+
+        Args:
+            datasets (list): Datasets to compact, every dataset if None.
+            worlds (list): Game world identifiers to compact, every world if None.
+            months (list): Months to compact, "%Y-%m", every month if None.
+
+        Returns:
+            int: Number of days added or replaced.
+        """
+        groups = {}
+        for dataset, date, gameworld, kind, extension, path in snapshot_files(self.root):
+            if ((datasets is not None and dataset not in datasets) or (worlds is not None and gameworld not in worlds)
+                    or (months is not None and date[:7] not in months)):
+                continue
+            stat = os.stat(path)
+            groups.setdefault((dataset, gameworld, date[:7]), {})[date] = (kind, extension, path,
+                                                                          [stat.st_size, stat.st_mtime])
+        compacted = 0
+        for (dataset, gameworld, month), days in sorted(groups.items()):
+            index = self.index(dataset, gameworld)
+            known = index.get(month, {"days": {}})["days"]
+            changed = {date: day for date, day in days.items()
+                       if date not in known or known[date]["source"] != day[3]}
+            if not changed:
+                continue
+
+            path = self.path(dataset, gameworld, month)
+            frames = []
+            if os.path.exists(path):
+                frame = self.pq.read_table(path).to_pandas()
+                frames.append(frame[~frame["datetime"].dt.strftime("%Y-%m-%d").isin(list(changed))])
+            rows = {}
+            for date, (kind, extension, source, _) in sorted(changed.items()):
+                frame = self._read_day(dataset, date, gameworld, kind, extension, source)
+                frame["datetime"] = pd.Timestamp(date)
+                rows[date] = len(frame)
+                frames.append(frame)
+            frame = pd.concat(frames, ignore_index=True).sort_values([KEYS[dataset], "datetime"], kind="stable")
+            self._write(frame, dataset, path)
+
+            month_index = index.setdefault(month, {"days": {}})
+            for date, (_, _, _, source) in changed.items():
+                month_index["days"][date] = {"rows": rows[date], "source": source}
+            month_index["rows"] = len(frame)
+            month_index["bytes"] = os.path.getsize(path)
+            self._save_index(dataset, gameworld, index)
+            compacted += len(changed)
+        return(compacted)
+
+    def read(self, dataset: str, gameworld: str, start: str = None, end: str = None, key: int = None,
+             columns: list = None) -> pd.DataFrame:
+        """Read the history of a dataset and world over a date range.
+
+        Only the months holding days between start and end are opened, and
+        rows outside the range, or of another key, are filtered while
+        reading.
+
+        Args:
+            dataset (str): Dataset name, one of FOLDERS.
+            gameworld (str): The game world identifier.
+            start (str): First date included, "%Y-%m-%d".
+            end (str): Last date included, "%Y-%m-%d".
+            key (int): Only the rows of this entity, see KEYS.
+            columns (list): Columns to read, every column if None.
+
+        Returns:
+            pd.DataFrame: The rows sorted by key and date, string columns
+            as categoricals.
+        """
+        filters = []
+        if start is not None:
+            filters.append(("datetime", ">=", pd.Timestamp(start)))
+        if end is not None:
+            filters.append(("datetime", "<=", pd.Timestamp(end)))
+        if key is not None:
+            filters.append((KEYS[dataset], "=", int(key)))
+        tables = []
+        for month, content in sorted(self.index(dataset, gameworld).items()):
+            days = content["days"]
+            if not any((start is None or date >= start) and (end is None or date <= end) for date in days):
+                continue
+            tables.append(self.pq.read_table(self.path(dataset, gameworld, month), columns=columns,
+                                             filters=filters or None))
+        if not tables:
+            return(self.schema(dataset).empty_table().to_pandas()[columns or slice(None)])
+        return(self.pa.concat_tables(tables, promote_options="permissive").to_pandas())
@@ -0,0 +1,53 @@
+import os
+
+#: Root folder of every dump.
+ROOT = "data"
+
+# dataset -> folder under data/
+FOLDERS = {"player": "player-data",
+           "ally": "ally-data",
+           "odd": "defense-data",
+           "oda": "attack-data",
+           "village": "village-data"}
+
+# enriched table -> folder under data/, next to the datasets they are built from
+ENRICHED_FOLDERS = {"player_enriched": "player-enriched-data",
+                    "ally_enriched": "ally-enriched-data"}
+
+# event table -> folder under data/, changes between two consecutive snapshots
+EVENT_FOLDERS = {"conquer": "conquer-events",
+                 "point_delta": "point-delta-events",
+                 "tribe_change": "tribe-change-events"}
+
+# every table derived from the datasets -> folder under data/
+DERIVED_FOLDERS = {**ENRICHED_FOLDERS, **EVENT_FOLDERS}
+
+def snapshot_files(root: str = ROOT):
+    """
+    Lists every dumped snapshot file under root.
+
+    :param root: Root folder of the dumps
+    :type root: str
+
+    :return: (dataset, date, gameworld, kind, extension, path) tuples, kind
+        being "full", "base" or "delta"
+    :rtype: generator
+    """
+    for dataset, folder in FOLDERS.items():
+        folder = os.path.join(root, folder)
+        if not os.path.isdir(folder):
+            continue
+        for date in sorted(os.listdir(folder)):
+            if not os.path.isdir(os.path.join(folder, date)):
+                continue
+            for name in sorted(os.listdir(os.path.join(folder, date))):
+                parts = name.split(".")
+                if len(parts) == 2:
+                    gameworld, extension = parts
+                    kind = "full"
+                elif len(parts) == 3 and parts[1] in ("base", "delta"):
+                    gameworld, kind, extension = parts
+                else:
+                    # temporary or foreign files
+                    continue
+                yield dataset, date, gameworld, kind, extension, os.path.join(folder, date, name)
@@ -0,0 +1,184 @@
+import os
+import json
+import hashlib
+import threading
+from datetime import datetime, timezone
+from .layout import ROOT
+from .writers import fsync
+
+#: States of a manifest entry, in order.
+STATES = ("pending", "fetched", "written")
+
+#: States with nothing left to do for the day: written, unchanged since the last dump (304),
+#: or archived (configurations, only kept in the raw archive).
+DONE = ("written", "unchanged", "archived")
+
+def checksum(data) -> str:
+    """Get the sha256 of a str (encoded as utf-8) or bytes."""
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    return("sha256:" + hashlib.sha256(data).hexdigest())
+
+def file_checksum(path: str) -> str:
+    """Get the sha256 of a file, read in chunks."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return("sha256:" + digest.hexdigest())
+
+class RunManifest:
+    """Progress of the run of one day, kept in a json file.
+
+    Records the worlds found for every region and, for every (world,
+    dataset), its state: pending, fetched (downloaded, with the checksum
+    of the raw file), written (with the path, size, row count and checksum
+    of the dump), unchanged (304), archived (a configuration kept in the
+    RawArchive) or failed. A run resumed after a crash
+    reuses the world lists and only redoes the entries that arent done.
+
+    The file is rewritten atomically after every change. A sharded run
+    keeps one manifest per shard, <date>.<shard>.json, each written by its
+    worker only, and merged into <date>.json by the coordinator (see
+    api.storage.shards.merge_shards).
+
+    Attributes:
+        path (str): Json file of the manifest.
+        date (str): Day of the run, "%Y-%m-%d".
+        shard (str): Name of the shard, None for the whole run.
+    """
+
+    def __init__(self, date: str, root: str = ROOT, shard: str = None):
+        """Constructor for the RunManifest class.
+
+        Args:
+            date (str): Day of the run, "%Y-%m-%d".
+            root (str): Root folder of the dumps, the manifest is
+                <root>/manifests/<date>.json.
+            shard (str): Name of a shard, e.g. "shard-0-of-4", whose
+                manifest is <root>/manifests/<date>.<shard>.json.
+        """
+        self.date = date
+        self.shard = shard
+        name = date if shard is None else "{}.{}".format(date, shard)
+        self.path = os.path.join(root, "manifests", "{}.json".format(name))
+        self._lock = threading.Lock()
+        if os.path.exists(self.path):
+            with open(self.path) as f:
+                self.content = json.load(f)
+        else:
+            self.content = {"date": date, "started": self._now(), "finished": None, "regions": {}, "entries": {}}
+
+    @staticmethod
+    def _now() -> str:
+        return(datetime.now(timezone.utc).isoformat())
+
+    @staticmethod
+    def _key(name: str, dataset: str) -> str:
+        return("{}/{}".format(name, dataset))
+
+    def save(self) -> None:
+        """Write the manifest, atomically."""
+        with self._lock:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(self.path + ".tmp", "w") as f:
+                json.dump(self.content, f, indent=1)
+            fsync(self.path + ".tmp")
+            os.replace(self.path + ".tmp", self.path)
+
+    def worlds(self, region: str) -> dict:
+        """Get the {gameworld: url} found for a region by this run, None if not discovered yet."""
+        return(self.content["regions"].get(region))
+
+    def set_worlds(self, region: str, worlds: dict) -> None:
+        """Record the {gameworld: url} of a region."""
+        with self._lock:
+            self.content["regions"][region] = dict(worlds)
+        self.save()
+
+    def set_shard(self, index: int, count: int, worlds: list) -> None:
+        """Record the worlds owned by the shard index of count."""
+        with self._lock:
+            self.content["shard"] = {"index": index, "count": count, "worlds": sorted(worlds)}
+        self.save()
+
+    def entry(self, name: str, dataset: str) -> dict:
+        """Get the entry of a (world, dataset), None if unknown."""
+        return(self.content["entries"].get(self._key(name, dataset)))
+
+    def mark(self, name: str, dataset: str, state: str, save: bool = True, **fields) -> None:
+        """Set the state of a (world, dataset) entry, with extra fields.
+
+        Args:
+            name (str): The game world identifier.
+            dataset (str): Dataset name.
+            state (str): One of STATES, "unchanged", "archived" or "failed".
+            save (bool): Write the manifest now.
+            fields: rows, bytes, checksum, path, error...
+        """
+        with self._lock:
+            entry = self.content["entries"].setdefault(self._key(name, dataset), {})
+            entry.update(fields, state=state, updated=self._now())
+        if save:
+            self.save()
+
+    def written(self, name: str, dataset: str, path: str, rows: int = None) -> None:
+        """Mark a (world, dataset) as written into path, with the size and checksum of the file."""
+        self.mark(name, dataset, "written", path=path, rows=rows, bytes=os.path.getsize(path),
+                  checksum=file_checksum(path))
+
+    def done(self, name: str, dataset: str, path: str = None, verify: bool = False) -> bool:
+        """Whether a (world, dataset) needs no more work today.
+
+        A written entry only counts while its file is still there with the
+        recorded size, and with verify, the recorded checksum.
+
+        Args:
+            name (str): The game world identifier.
+            dataset (str): Dataset name.
+            path (str): Expected file, a written entry pointing to another
+                file (e.g. of another output format) isnt done.
+            verify (bool): Also compare the checksum of the file.
+        """
+        entry = self.entry(name, dataset)
+        if entry is None or entry["state"] not in DONE:
+            return(False)
+        if entry["state"] in ("unchanged", "archived"):
+            return(True)
+        if path is not None and entry.get("path") != path:
+            return(False)
+        path = entry.get("path")
+        if path is None or not os.path.exists(path) or os.path.getsize(path) != entry.get("bytes"):
+            return(False)
+        return(not verify or file_checksum(path) == entry.get("checksum"))
+
+    def finish(self) -> None:
+        """Record the end of the run."""
+        with self._lock:
+            self.content["finished"] = self._now()
+        self.save()
+
+    def summary(self) -> dict:
+        """Get the number of entries per state."""
+        states = {}
+        for entry in self.content["entries"].values():
+            states[entry["state"]] = states.get(entry["state"], 0) + 1
+        return(states)
+
+# one manifest object per file, shared by the flow and its subflows
+_manifests = {}
+_manifests_lock = threading.Lock()
+
+def run_manifest(date: str, root: str = ROOT, shard: str = None) -> RunManifest:
+    """Get the manifest of a day, loaded from disk on first use.
+
+    Args:
+        date (str): Day of the run, "%Y-%m-%d".
+        root (str): Root folder of the dumps.
+        shard (str): Name of a shard, to get the manifest of the shard.
+    """
+    with _manifests_lock:
+        key = (os.path.abspath(os.path.join(root, "manifests", date)), shard)
+        if key not in _manifests:
+            _manifests[key] = RunManifest(date, root, shard)
+        return(_manifests[key])
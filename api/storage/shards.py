@@ -0,0 +1,189 @@
+import os
+import json
+import zlib
+import heapq
+from typing import NamedTuple
+from .layout import ROOT, FOLDERS
+from .manifest import RunManifest
+from .writers import fsync
+
+#: Days of manifests looked back at for the size of every world.
+HISTORY = 7
+
+class Shard(NamedTuple):
+    """One of the count shards of a sharded run, numbered from 0."""
+    index: int
+    count: int
+
+    @property
+    def name(self) -> str:
+        return("shard-{}-of-{}".format(self.index, self.count))
+
+def _days(root: str) -> list:
+    """Days with a manifest of the whole run (or merged from the shards), sorted."""
+    folder = os.path.join(root, "manifests")
+    if not os.path.isdir(folder):
+        return([])
+    return(sorted(name[:-len(".json")] for name in os.listdir(folder)
+                  if name.endswith(".json") and "." not in name[:-len(".json")]))
+
+def world_weights(day: str, root: str = ROOT, history: int = HISTORY) -> dict:
+    """Expected size of every world, from the manifests of the days before day.
+
+    The size of a dataset is its last download (raw_bytes), or file, of the
+    last history days; a world weighs the sum of its datasets. Only earlier
+    days are read, so every worker of a day gets the same weights.
+
+    Args:
+        day (str): Day of the run, "%Y-%m-%d".
+        root (str): Root folder of the dumps.
+        history (int): Number of earlier days read.
+
+    Returns:
+        dict: {gameworld: bytes}, empty when no earlier day is known.
+    """
+    sizes = {}
+    for previous in [name for name in _days(root) if name < day][-history:][::-1]:
+        for key, entry in RunManifest(previous, root).content["entries"].items():
+            gameworld, dataset = key.split("/", 1)
+            size = entry.get("raw_bytes") or entry.get("bytes")
+            if dataset in FOLDERS and size and key not in sizes:
+                sizes[key] = (gameworld, size)
+    weights = {}
+    for gameworld, size in sizes.values():
+        weights[gameworld] = weights.get(gameworld, 0) + size
+    return(weights)
+
+def partition(worlds: list, count: int, weights: dict = None) -> list:
+    """Split worlds into count shards of about the same expected size.
+
+    Greedy: from the largest world down, each world goes to the lightest
+    shard, ties broken by name and shard number, so the same worlds and
+    weights always give the same shards. Worlds without a weight (new or
+    never fetched) weigh the mean of the others.
+
+    Args:
+        worlds (list): Game world identifiers.
+        count (int): Number of shards.
+        weights (dict): {gameworld: expected size}, see world_weights.
+
+    Returns:
+        list: count sorted lists of game world identifiers, the worlds of
+        each shard.
+    """
+    weights = weights or {}
+    worlds = sorted(set(worlds))
+    known = [weights[gameworld] for gameworld in worlds if gameworld in weights]
+    default = sum(known) / len(known) if known else 1
+    shards = [[] for _ in range(count)]
+    loads = [(0, index) for index in range(count)]
+    for gameworld in sorted(worlds, key=lambda gameworld: (-weights.get(gameworld, default), gameworld)):
+        load, index = heapq.heappop(loads)
+        shards[index].append(gameworld)
+        heapq.heappush(loads, (load + weights.get(gameworld, default), index))
+    return([sorted(shard) for shard in shards])
+
+def plan_path(day: str, count: int, root: str = ROOT) -> str:
+    """Get the path of the partition plan of a day, <root>/manifests/<day>.plan-<count>.json."""
+    return(os.path.join(root, "manifests", "{}.plan-{}.json".format(day, count)))
+
+def shard_plan(day: str, worlds: list, count: int, root: str = ROOT, history: int = HISTORY) -> list:
+    """Get the worlds of each of the count shards of a day, the same for every worker.
+
+    The first worker of the day partitions the worlds it found (see
+    partition and world_weights) and publishes the plan, every other
+    worker, and a resumed one, reads it. Merging an earlier day again
+    (which changes the weights) or a worker starting later thus never moves
+    a world to another shard. Worlds missing from the plan, e.g. found by
+    only some workers, go to the shard given by a hash of their name.
+
+    Args:
+        day (str): Day of the run, "%Y-%m-%d".
+        worlds (list): Game world identifiers found by this worker.
+        count (int): Number of shards.
+        root (str): Root folder of the dumps.
+        history (int): Number of earlier days read for the weights.
+
+    Returns:
+        list: count sorted lists of game world identifiers, the worlds of
+        each shard.
+    """
+    path = plan_path(day, count, root)
+    if not os.path.exists(path):
+        plan = {"day": day, "count": count, "shards": partition(worlds, count, world_weights(day, root, history))}
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temporary = "{}.{}.tmp".format(path, os.getpid())
+        with open(temporary, "w") as f:
+            json.dump(plan, f, indent=1)
+        fsync(temporary)
+        try:
+            # unlike a rename, a link fails if another worker published its plan first
+            os.link(temporary, path)
+        except FileExistsError:
+            pass
+        finally:
+            os.remove(temporary)
+    with open(path) as f:
+        shards = json.load(f)["shards"]
+    planned = {gameworld for shard in shards for gameworld in shard}
+    for gameworld in sorted(set(worlds) - planned):
+        shards[zlib.crc32(gameworld.encode("utf-8")) % count].append(gameworld)
+    return([sorted(shard) for shard in shards])
+
+def merge_shards(day: str, count: int, root: str = ROOT) -> dict:
+    """Merge the manifests of the shards of a day into the manifest of the day.
+
+    The manifest of the day (<root>/manifests/<day>.json) gets the worlds
+    and entries of every shard, the state of each shard and the worlds left
+    incomplete. It is finished once every shard is. Merging again, e.g.
+    while shards still run or after one was resumed, updates it.
+
+    Args:
+        day (str): Day of the run, "%Y-%m-%d".
+        count (int): Number of shards.
+        root (str): Root folder of the dumps.
+
+    Returns:
+        dict: shards ({name: state, started, finished, worlds, summary},
+        state being "missing", "running" or "finished"), incomplete (worlds
+        owned by a shard with a dataset not done), unowned (worlds found by
+        a shard but owned by none, the shards saw different world lists)
+        and summary (entries per state).
+    """
+    merged = RunManifest(day, root)
+    shards = {}
+    owned = set()
+    finished = []
+    for index in range(count):
+        shard = Shard(index, count)
+        manifest = RunManifest(day, root, shard.name)
+        if not os.path.exists(manifest.path):
+            shards[shard.name] = {"state": "missing"}
+            continue
+        content = manifest.content
+        for region, worlds in content["regions"].items():
+            merged.content["regions"].setdefault(region, {}).update(worlds)
+        merged.content["entries"].update(content["entries"])
+        worlds = content.get("shard", {}).get("worlds", [])
+        owned.update(worlds)
+        shards[shard.name] = {"state": "finished" if content["finished"] else "running",
+                              "started": content["started"],
+                              "finished": content["finished"],
+                              "worlds": len(worlds),
+                              "summary": manifest.summary()}
+        merged.content["started"] = min(merged.content["started"], content["started"])
+        finished.append(content["finished"])
+
+    found = set()
+    for worlds in merged.content["regions"].values():
+        found.update(worlds)
+    incomplete = sorted(gameworld for gameworld in owned
+                        if not all(merged.done(gameworld, dataset) for dataset in FOLDERS))
+    unowned = sorted(found - owned)
+    merged.content["shards"] = shards
+    merged.content["incomplete"] = incomplete
+    merged.content["unowned"] = unowned
+    done = len(finished) == count and all(finished)
+    merged.content["finished"] = max(finished) if done else None
+    merged.save()
+    return({"shards": shards, "incomplete": incomplete, "unowned": unowned, "summary": merged.summary()})
@@ -0,0 +1,199 @@
+import os
+
+class JsonWriter:
+    """Writes DataFrames as json lines, one record per row.
+
+    Attributes:
+        extension (str): File extension of the written files.
+    """
+
+    extension = "json"
+
+    def __init__(self, schema = None):
+        """Constructor for the JsonWriter class.
+
+        Args:
+            schema (DataFrameSchema): Pandera schema of the written dataset,
+                used to restore column types on read.
+        """
+        self.schema = schema
+
+    def _lines(self, frame) -> str:
+        lines = frame.to_json(orient='records', lines=True)
+        return(lines if lines.endswith("\n") else lines + "\n")
+
+    def write(self, frame, path: str) -> None:
+        """Write a whole DataFrame into path, atomically."""
+        with self.open(path) as batches:
+            batches.write(frame)
+
+    def read(self, path: str):
+        """Read a file written by this writer back into a DataFrame.
+
+        With a schema, values keep their json type (a name like "123" stays
+        a string) and the datetime columns are restored from epoch millis.
+        """
+        import pandas as pd
+        if self.schema is None:
+            return(pd.read_json(path, orient='records', lines=True))
+        if os.path.getsize(path) == 0:
+            return(pd.DataFrame(columns=list(self.schema.columns)))
+        frame = pd.read_json(path, orient='records', lines=True, dtype=False, convert_dates=False)
+        for name, column in self.schema.columns.items():
+            if name in frame and str(column.dtype).startswith("datetime"):
+                frame[name] = pd.to_datetime(frame[name], unit="ms")
+        return(frame)
+
+    def open(self, path: str):
+        """Open path for writing DataFrames batch by batch.
+
+        Returns:
+            BatchFile: Context manager with a write(frame) method. The file
+            only appears under path once the context exits without error.
+        """
+        return(BatchFile(path, self))
+
+    def _start(self, tmp_path: str):
+        return(open(tmp_path, "w"))
+
+    def _write(self, handle, frame) -> None:
+        if len(frame):
+            handle.write(self._lines(frame))
+
+class ParquetWriter(JsonWriter):
+    """Writes DataFrames as compressed Parquet files with typed columns.
+
+    The Arrow schema is derived from the pandera schema of the dataset, so
+    every daily file of a dataset has identical column types.
+
+    Attributes:
+        extension (str): File extension of the written files.
+        compression (str): Parquet compression codec.
+    """
+
+    extension = "parquet"
+
+    def __init__(self, schema = None, compression: str = "zstd"):
+        """Constructor for the ParquetWriter class.
+
+        Args:
+            schema (DataFrameSchema): Pandera schema of the written dataset.
+                Column types are inferred from each frame when None.
+            compression (str): Parquet compression codec.
+        """
+        import pyarrow
+        import pyarrow.parquet
+        self.pa = pyarrow
+        self.pq = pyarrow.parquet
+        self.schema = arrow_schema(schema) if schema is not None else None
+        self.compression = compression
+
+    def read(self, path: str):
+        """Read a file written by this writer back into a DataFrame."""
+        return(self.pq.read_table(path).to_pandas())
+
+    def _table(self, frame):
+        return(self.pa.Table.from_pandas(frame, schema=self.schema, preserve_index=False))
+
+    def _start(self, tmp_path: str):
+        return(_LazyParquetFile(self, tmp_path))
+
+    def _write(self, handle, frame) -> None:
+        handle.write(self._table(frame))
+
+class _LazyParquetFile:
+    """pyarrow ParquetWriter opened on the first batch, once the schema is known."""
+
+    def __init__(self, writer: ParquetWriter, path: str):
+        self.writer = writer
+        self.path = path
+        self.handle = None
+
+    def write(self, table) -> None:
+        if self.handle is None:
+            self.handle = self.writer.pq.ParquetWriter(self.path, table.schema,
+                                                       compression=self.writer.compression)
+        self.handle.write_table(table)
+
+    def close(self) -> None:
+        if self.handle is None:
+            # no batch at all, still leave a valid empty file
+            if self.writer.schema is None:
+                raise ValueError("Cannot write an empty parquet file without a schema")
+            self.writer.pq.write_table(self.writer.schema.empty_table(), self.path,
+                                       compression=self.writer.compression)
+        else:
+            self.handle.close()
+
+def fsync(path: str) -> None:
+    """Flush a closed file to disk."""
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+class BatchFile:
+    """Context manager writing batches into a temporary file renamed on success."""
+
+    def __init__(self, path: str, writer):
+        self.path = path
+        self.writer = writer
+
+    def __enter__(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self.handle = self.writer._start(self.path + ".tmp")
+        return(self)
+
+    def write(self, frame) -> None:
+        """Append a DataFrame to the file."""
+        self.writer._write(self.handle, frame)
+
+    def __exit__(self, exc_type, exc, tb):
+        self.handle.close()
+        if exc_type is None:
+            # on disk before the rename, so a crash never leaves a renamed but empty file
+            fsync(self.path + ".tmp")
+            os.replace(self.path + ".tmp", self.path)
+        else:
+            os.remove(self.path + ".tmp")
+        return(False)
+
+def arrow_schema(schema):
+    """Get the Arrow schema matching a pandera DataFrameSchema.
+
+    Args:
+        schema (DataFrameSchema): One of the schemas of api.pandera.schemas.
+
+    Returns:
+        pyarrow.Schema: int columns as int64, datetimes as timestamps and
+        everything else as strings.
+    """
+    import pyarrow as pa
+
+    fields = []
+    for name, column in schema.columns.items():
+        dtype = str(column.dtype)
+        if dtype.startswith("int"):
+            arrow_type = pa.int64()
+        elif dtype.startswith("datetime"):
+            arrow_type = pa.timestamp("ns")
+        else:
+            arrow_type = pa.string()
+        fields.append(pa.field(name, arrow_type, nullable=column.nullable))
+    return(pa.schema(fields))
+
+#: Output formats, as {name: writer class}.
+WRITERS = {"json": JsonWriter,
+           "parquet": ParquetWriter}
+
+def get_writer(output_format: str = "json", schema = None):
+    """Get the writer of an output format.
+
+    Args:
+        output_format (str): One of the keys of WRITERS.
+        schema (DataFrameSchema): Pandera schema of the written dataset.
+    """
+    if output_format not in WRITERS:
+        raise ValueError("Unknown output format {}, expected one of {}".format(output_format, list(WRITERS)))
+    return(WRITERS[output_format](schema))
@@ -1,26 +1,53 @@
-import requests
-import xmltodict
-from urllib.parse import unquote
-from datetime import datetime
-import itertools
-import re
-import pandas as pd
+from __future__ import annotations
+from functools import lru_cache
 from .world import World
-import pycountry
+from .session import Session
+from .cache import ConfigCache, discovery_cache
+from .parsing import unserialize
+
+@lru_cache(maxsize=None)
+def country_name(code: str) -> str:
+    """
+    Get the country name of an ISO 3166 alpha-2 region code, memoized.
+
+    :param code: Region code, e.g. "PT".
+    :type code: str
+
+    :return: The country name, None for codes that arent countries (e.g. "EN").
+    :rtype: str
+    """
+    import pycountry
+    country = pycountry.countries.get(alpha_2=code)
+    return(country.name if country is not None else None)
 
 class ServerBaseClass:
     """Server Base Class used for managing server information."""
 
-    def __init__(self):
-        """Constructor for ServerBaseClass."""
-        pass
-        
-    def get_active_servers(self, server: str = "tribalwars.com.pt") -> dict:
+    def __init__(self, session = None, cache: ConfigCache = None):
+        """
+        Constructor for ServerBaseClass.
+
+        :param session: HTTP session used for every request, a pooled Session is created if None.
+        :type session: Session
+        :param cache: Cache of the world lists, defaults to the discovery_cache of the process.
+        :type cache: ConfigCache
+        """
+        self.session = session if session is not None else Session()
+        self.cache = cache if cache is not None else discovery_cache
+
+    def get_active_servers(self, server: str = "tribalwars.com.pt", refresh: bool = False) -> dict:
         """
         Get a dictionary of active servers based on the provided base server.
 
+        backend/get_servers.php is downloaded once per region and TTL of the
+        cache, so the world list and the server table share one request.
+
         :param server: The base URL domain for the region (default is "tribalwars.com.pt").
         :type server: str
+        :param refresh: Download the list even if a valid copy is cached.
+        :type refresh: bool
+
+        :raises ValueError: The answer is not a serialized array, e.g. an HTML page.
 
         :return: A dictionary mapping server tag to server base URL.
         :rtype: dict
@@ -29,44 +56,80 @@ class ServerBaseClass:
         'pt88': 'https://pt88.tribalwars.com.pt', 'pt90': 'https://pt90.tribalwars.com.pt', 
         'pt91': 'https://pt91.tribalwars.com.pt', 'pt92': 'https://pt92.tribalwars.com.pt'}
         """
-        base_server = server
-        server_list = f"http://{base_server}/backend/get_servers.php"
-        re_text = re.findall(r'(\".+?\")', requests.get(server_list).text)
-        re_text = [x.strip('"') for x in re_text]
-        pairs = itertools.zip_longest(*[iter(re_text)] * 2, fillvalue=None)
-        dct = {key: value for key, value in pairs}
-        return(dct)
-    
-    def get_servers_table(self, server: str = "tribalwars.com.pt") -> dict:
-        servers_list = self.get_active_servers(server=server)
-        server_df = pd.DataFrame(list(servers_list.items()), columns=['Server Code', 'URL'])
-        server_df["Region"] = server_df["Server Code"].apply(lambda x: re.findall(r'^([a-zA-Z]{2})', x)[0].upper())
-        server_df["Name"] = server_df["Region"].apply(lambda x: pycountry.countries.get(alpha_2=x).name)
+        def fetch():
+            response = self.session.get(f"http://{server}/backend/get_servers.php")
+            response.raise_for_status()
+            servers = unserialize(response.content)
+            if not isinstance(servers, dict):
+                raise ValueError("get_servers.php of {} is not an array of servers".format(server))
+            return({str(key): value for key, value in servers.items()})
+
+        return(dict(self.cache.get(server, "servers", fetch, refresh)))
+
+    def get_servers_table(self, server: str = "tribalwars.com.pt", server_dict: dict = None) -> pd.DataFrame:
+        """
+        Get the active servers of a region as a table.
+
+        :param server: The base URL domain for the region.
+        :type server: str
+        :param server_dict: {gameworld: url} of the active servers, e.g. kept
+            by the run manifest. Taken from get_active_servers if None.
+        :type server_dict: dict
+
+        :return: Server Code, URL, Region (e.g. "PT") and Name (country name) of every server.
+        :rtype: pd.DataFrame
+        """
+        import pandas as pd
+        if server_dict is None:
+            server_dict = self.get_active_servers(server=server)
+        server_df = pd.DataFrame(list(server_dict.items()), columns=['Server Code', 'URL'])
+        server_df["Region"] = server_df["Server Code"].str.extract(r'^([a-zA-Z]{2})', expand=False).str.upper()
+        # one lookup per region rather than per server
+        regions = server_df["Region"].dropna().unique()
+        server_df["Name"] = server_df["Region"].map({region: country_name(region) for region in regions})
         return(server_df)
     
 class Server(ServerBaseClass):
     """Child class of ServerBaseClass for additional server-related functionality."""
     
-    def __init__(self, server):
+    def __init__(self, server, session = None, cache: ConfigCache = None):
         """
         Constructor for the Server class.
 
         :param server: The base URL domain for the region.
         :type server: str
+        :param session: HTTP session shared with the generated worlds.
+        :type session: Session
+        :param cache: Cache of the world lists, defaults to the discovery_cache of the process.
+        :type cache: ConfigCache
         """
+        super().__init__(session, cache)
         self.server = server
 
-    def generate_worlds(self):
+    def generate_worlds(self, session = None, server_dict = None):
         """
         Generate a list of World objects based on active servers.
 
+        The worlds share one session, whose connection pools are sized to
+        the number of worlds.
+
+        :param session: HTTP session injected into every World, defaults to the session of the Server.
+        :type session: Session
+        :param server_dict: {gameworld: url} of the active servers, e.g. kept
+            from an earlier call of get_active_servers. Downloaded if None.
+        :type server_dict: dict
+
         :return: A list of World objects.
         :rtype: list
         """
-        server_dict = self.get_active_servers(self.server)
+        session = session if session is not None else self.session
+        if server_dict is None:
+            server_dict = self.get_active_servers(self.server)
+        if isinstance(session, Session):
+            session.register_hosts(server_dict.values())
         worlds_list = []
         for gameworld, server in server_dict.items():
-            worlds_list.append(World(gameworld, server))
+            worlds_list.append(World(gameworld, server, session))
         return(worlds_list)
     
 
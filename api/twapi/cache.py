@@ -0,0 +1,163 @@
+import os
+import json
+import time
+
+#: Seconds a cached world configuration stays valid.
+CONFIG_TTL = 7 * 24 * 3600
+
+#: Seconds the world list of a region (backend/get_servers.php) stays valid.
+DISCOVERY_TTL = 3600
+
+class ConfigCache:
+    """Two level cache (memory, then json files on disk) for world configurations.
+
+    World configurations (speed, buildings, units) barely change during the
+    lifetime of a world, so each one is downloaded once per TTL and shared by
+    every World object of the process. The same cache, with a short TTL,
+    keeps the world list of every region (see discovery_cache).
+
+    Attributes:
+        path (str): Folder holding <path>/<gameworld>/<kind>.json.
+        ttl (int): Seconds an entry stays valid.
+    """
+
+    def __init__(self, path: str = "data/config-cache", ttl: int = CONFIG_TTL):
+        """Constructor for the ConfigCache class.
+
+        Args:
+            path (str): Folder of the on-disk cache, None to keep it in memory only.
+            ttl (int): Seconds an entry stays valid.
+        """
+        self.path = path
+        self.ttl = ttl
+        self._memory = {}
+
+    def _file(self, gameworld: str, kind: str) -> str:
+        return(os.path.join(self.path, gameworld, "{}.json".format(kind)))
+
+    def _fresh(self, fetched_at: float) -> bool:
+        return(time.time() - fetched_at < self.ttl)
+
+    def get(self, gameworld: str, kind: str, fetch, refresh: bool = False) -> dict:
+        """Get a configuration, calling fetch() only when no valid copy is cached.
+
+        Args:
+            gameworld (str): The game world identifier.
+            kind (str): Configuration name, e.g. "config", "building" or "unit".
+            fetch (callable): Returns the parsed configuration.
+            refresh (bool): Call fetch() even if a valid copy is cached.
+
+        Returns:
+            dict: The parsed configuration.
+        """
+        key = (gameworld, kind)
+        if not refresh and key in self._memory and self._fresh(self._memory[key][0]):
+            return(self._memory[key][1])
+
+        path = self._file(gameworld, kind) if self.path is not None else None
+        if not refresh and path is not None:
+            if os.path.exists(path) and self._fresh(os.path.getmtime(path)):
+                with open(path) as f:
+                    value = json.load(f)
+                self._memory[key] = (os.path.getmtime(path), value)
+                return(value)
+
+        value = fetch()
+        self._memory[key] = (time.time(), value)
+        if path is not None:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path + ".tmp", "w") as f:
+                json.dump(value, f)
+            os.replace(path + ".tmp", path)
+        return(value)
+
+    def clear(self, gameworld: str = None) -> None:
+        """Forget the in-memory entries, of one world or of all of them.
+
+        Args:
+            gameworld (str): The game world identifier, None for every world.
+        """
+        for key in list(self._memory):
+            if gameworld is None or key[0] == gameworld:
+                del self._memory[key]
+
+#: Cache shared by every World that doesnt get its own.
+default_cache = ConfigCache()
+
+#: World lists of the regions, shared by every Server that doesnt get its own cache.
+discovery_cache = ConfigCache("data/discovery-cache", DISCOVERY_TTL)
+
+class ValidatorStore:
+    """ETag and Last-Modified of the last processed version of each url.
+
+    Used to send conditional requests, so an unchanged map file costs a 304
+    instead of a full download. New validators stay pending until commit()
+    is called once the response was processed, so a crash in between never
+    makes a file look up to date.
+
+    Attributes:
+        path (str): Json file the committed validators are persisted to.
+    """
+
+    def __init__(self, path: str = "data/http-cache/validators.json"):
+        """Constructor for the ValidatorStore class.
+
+        Args:
+            path (str): Json file the validators are persisted to, None to keep them in memory only.
+        """
+        self.path = path
+        self._validators = {}
+        self._pending = {}
+        if path is not None and os.path.exists(path):
+            with open(path) as f:
+                self._validators = json.load(f)
+
+    def headers(self, url: str) -> dict:
+        """Get the conditional request headers for an url."""
+        validators = self._validators.get(url, {})
+        headers = {}
+        if "etag" in validators:
+            headers["If-None-Match"] = validators["etag"]
+        if "last_modified" in validators:
+            headers["If-Modified-Since"] = validators["last_modified"]
+        return(headers)
+
+    def update(self, url: str, response) -> None:
+        """Remember the validators of a 200 response until it is committed."""
+        validators = {}
+        if "ETag" in response.headers:
+            validators["etag"] = response.headers["ETag"]
+        if "Last-Modified" in response.headers:
+            validators["last_modified"] = response.headers["Last-Modified"]
+        self._pending[url] = validators
+
+    def get(self, url: str) -> dict:
+        """Get the committed validators of an url, {} if there are none."""
+        return(dict(self._validators.get(url, {})))
+
+    def pending(self, url: str) -> dict:
+        """Get the validators of the last response of an url not committed yet, None if there are none."""
+        return(self._pending.get(url))
+
+    def commit(self, url: str, validators: dict = None) -> None:
+        """Mark the last downloaded version of an url as processed.
+
+        Args:
+            url (str): Url of the processed response.
+            validators (dict): Validators to commit instead of the pending
+                ones, e.g. those of a response processed by another process.
+        """
+        if validators is not None:
+            self._pending.pop(url, None)
+            self._validators[url] = validators
+        elif url in self._pending:
+            self._validators[url] = self._pending.pop(url)
+
+    def save(self) -> None:
+        """Persist the committed validators."""
+        if self.path is None:
+            return
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path + ".tmp", "w") as f:
+            json.dump(self._validators, f)
+        os.replace(self.path + ".tmp", self.path)
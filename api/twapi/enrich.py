@@ -0,0 +1,112 @@
+import pandas as pd
+
+#: Columns of the enriched player table.
+PLAYER_COLUMNS = ["player_id", "name", "ally_id", "ally_tag", "ally_name", "num_vill", "points", "rank",
+                  "villages", "village_points", "continents", "main_continent",
+                  "oda", "oda_rank", "odd", "odd_rank", "datetime", "server"]
+
+#: Columns of the enriched ally table.
+ALLY_COLUMNS = ["ally_id", "name", "tag", "members", "num_vill", "points", "total_points", "rank",
+                "villages", "village_points", "continents", "main_continent",
+                "oda", "oda_rank", "odd", "odd_rank", "datetime", "server"]
+
+def village_aggregates(village: pd.DataFrame, key: str) -> pd.DataFrame:
+    """Aggregate the villages of each owner.
+
+    Args:
+        village (pd.DataFrame): Villages with a key column (player_id or
+            ally_id) and the continent and points columns. Rows whose key is
+            0 (barbarian villages, players without a tribe) are ignored.
+        key (str): Column to group by.
+
+    Returns:
+        pd.DataFrame: One row per key: villages (count), village_points
+        (sum), continents (distinct continents) and main_continent (the
+        continent holding most of the villages, the lowest on ties).
+    """
+    owned = village.loc[village[key] != 0, [key, "continent", "points"]]
+    grouped = owned.groupby(key, sort=False)
+    aggregates = pd.DataFrame({"villages": grouped.size(),
+                               "village_points": grouped["points"].sum(),
+                               "continents": grouped["continent"].nunique()})
+    per_continent = owned.groupby([key, "continent"]).size().reset_index(name="count")
+    main = (per_continent.sort_values([key, "count", "continent"], ascending=[True, False, True])
+                         .drop_duplicates(key).set_index(key)["continent"])
+    aggregates["main_continent"] = main
+    return(aggregates)
+
+def rank(values: pd.Series) -> pd.Series:
+    """Rank values descending, ties sharing the best rank, zero values unranked."""
+    ranks = values.where(values > 0).rank(method="min", ascending=False)
+    return(ranks.astype("Int64"))
+
+def enrich_players(player: pd.DataFrame, ally: pd.DataFrame, village: pd.DataFrame,
+                   oda: pd.DataFrame, odd: pd.DataFrame) -> pd.DataFrame:
+    """Join the datasets of a world into one table of players.
+
+    Every join is a hash join on player_id or ally_id, each input is read
+    once.
+
+    Args:
+        player (pd.DataFrame): Parsed player.txt.
+        ally (pd.DataFrame): Parsed ally.txt.
+        village (pd.DataFrame): Parsed village.txt.
+        oda (pd.DataFrame): Parsed kill_att.txt.
+        odd (pd.DataFrame): Parsed kill_def.txt.
+
+    Returns:
+        pd.DataFrame: PLAYER_COLUMNS, one row per player: the player, the
+        tag and name of its tribe, its village aggregates (see
+        village_aggregates) and its ODA and ODD points and ranks. Players
+        without villages or kills get 0, missing ranks are null.
+    """
+    tribes = ally[["ally_id", "tag", "name"]].drop_duplicates("ally_id")
+    table = player.merge(tribes.rename(columns={"tag": "ally_tag", "name": "ally_name"}), on="ally_id", how="left")
+    table = table.merge(village_aggregates(village, "player_id"), left_on="player_id", right_index=True, how="left")
+    for name, kills in (("oda", oda), ("odd", odd)):
+        kills = kills[["player_id", "points", "rank"]].drop_duplicates("player_id")
+        table = table.merge(kills.rename(columns={"points": name, "rank": name + "_rank"}), on="player_id", how="left")
+    for column in ("villages", "village_points", "continents", "oda", "odd"):
+        table[column] = table[column].fillna(0).astype("int64")
+    for column in ("main_continent", "oda_rank", "odd_rank"):
+        table[column] = table[column].astype("Int64")
+    return(table[PLAYER_COLUMNS])
+
+def enrich_allies(ally: pd.DataFrame, players: pd.DataFrame, village: pd.DataFrame) -> pd.DataFrame:
+    """Aggregate the enriched players of a world into one table of tribes.
+
+    Args:
+        ally (pd.DataFrame): Parsed ally.txt.
+        players (pd.DataFrame): Enriched players, see enrich_players.
+        village (pd.DataFrame): Parsed village.txt.
+
+    Returns:
+        pd.DataFrame: ALLY_COLUMNS, one row per tribe: the tribe, the
+        village aggregates of its members' villages, and the ODA and ODD of
+        its members summed and ranked among the tribes.
+    """
+    owners = (players.loc[players["ally_id"] != 0, ["player_id", "ally_id"]]
+                     .drop_duplicates("player_id").set_index("player_id")["ally_id"])
+    villages = village[["player_id", "continent", "points"]].assign(
+        ally_id=village["player_id"].map(owners).fillna(0).astype("int64"))
+    members = players.loc[players["ally_id"] != 0].groupby("ally_id", sort=False)[["oda", "odd"]].sum()
+
+    table = ally.merge(village_aggregates(villages, "ally_id"), left_on="ally_id", right_index=True, how="left")
+    table = table.merge(members, left_on="ally_id", right_index=True, how="left")
+    for column in ("villages", "village_points", "continents", "oda", "odd"):
+        table[column] = table[column].fillna(0).astype("int64")
+    table["main_continent"] = table["main_continent"].astype("Int64")
+    table["oda_rank"] = rank(table["oda"])
+    table["odd_rank"] = rank(table["odd"])
+    return(table[ALLY_COLUMNS])
+
+def enrich(player: pd.DataFrame, ally: pd.DataFrame, village: pd.DataFrame,
+           oda: pd.DataFrame, odd: pd.DataFrame) -> dict:
+    """Build the enriched player and ally tables of a world.
+
+    Returns:
+        dict: {"player_enriched": players, "ally_enriched": tribes}, see
+        enrich_players and enrich_allies.
+    """
+    players = enrich_players(player, ally, village, oda, odd)
+    return({"player_enriched": players, "ally_enriched": enrich_allies(ally, players, village)})
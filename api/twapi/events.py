@@ -0,0 +1,164 @@
+import numpy as np
+import pandas as pd
+
+#: Columns of the conquer events.
+CONQUER_COLUMNS = ["village_id", "x", "y", "continent", "points", "old_player_id", "new_player_id",
+                   "old_ally_id", "new_ally_id", "datetime", "server"]
+
+#: Columns of the point_delta events.
+POINT_DELTA_COLUMNS = ["player_id", "kind", "old_points", "new_points", "delta", "old_rank", "new_rank",
+                       "datetime", "server"]
+
+#: Columns of the tribe_change events.
+TRIBE_CHANGE_COLUMNS = ["player_id", "old_ally_id", "new_ally_id", "points", "datetime", "server"]
+
+def sorted_by(frame: pd.DataFrame, key: str) -> pd.DataFrame:
+    """Get a snapshot sorted by its key, unique.
+
+    Map files come sorted by their key, checking it is linear and skips the
+    sort.
+    """
+    if not frame[key].is_unique:
+        frame = frame.drop_duplicates(key, keep="last")
+    if not frame[key].is_monotonic_increasing:
+        frame = frame.sort_values(key, kind="stable")
+    return(frame)
+
+def values(frame: pd.DataFrame, column: str) -> np.ndarray:
+    """Get an integer column as int64, missing values as 0."""
+    return(frame[column].fillna(0).to_numpy(dtype="int64"))
+
+def align(old: pd.DataFrame, new: pd.DataFrame, key: str) -> tuple:
+    """Match the rows of two snapshots sorted by key (see sorted_by).
+
+    Returns:
+        tuple: The positions of the matched rows in old and in new, and
+        the positions of the rows of new missing from old.
+    """
+    old_keys, new_keys = values(old, key), values(new, key)
+    if not len(old_keys):
+        return(np.empty(0, "int64"), np.empty(0, "int64"), np.arange(len(new_keys)))
+    positions = np.minimum(np.searchsorted(old_keys, new_keys), len(old_keys) - 1)
+    found = old_keys[positions] == new_keys
+    return(positions[found], np.flatnonzero(found), np.flatnonzero(~found))
+
+def lookup(table: pd.DataFrame, key: str, column: str, keys: np.ndarray) -> np.ndarray:
+    """Get the column of the rows of a sorted table with the given keys, 0 where there is none."""
+    if table is None or not len(table):
+        return(np.zeros(len(keys), "int64"))
+    table_keys = values(table, key)
+    positions = np.minimum(np.searchsorted(table_keys, keys), len(table_keys) - 1)
+    return(np.where(table_keys[positions] == keys, values(table, column)[positions], 0))
+
+def conquers(old_village: pd.DataFrame, new_village: pd.DataFrame, old_player: pd.DataFrame = None,
+             new_player: pd.DataFrame = None) -> pd.DataFrame:
+    """Get the villages that changed owner between two snapshots.
+
+    Args:
+        old_village (pd.DataFrame): Previous village.txt snapshot.
+        new_village (pd.DataFrame): Current village.txt snapshot.
+        old_player (pd.DataFrame): Previous player.txt snapshot, sorted by
+            player_id, gives the tribe of the old owner.
+        new_player (pd.DataFrame): Current player.txt snapshot, sorted by
+            player_id, gives the tribe of the new owner.
+
+    Returns:
+        pd.DataFrame: CONQUER_COLUMNS but datetime and server, one row per
+        village taken by a player (from a player or barbarians), its tribe
+        ids being 0 for none.
+    """
+    old, new = sorted_by(old_village, "village_id"), sorted_by(new_village, "village_id")
+    old_rows, new_rows, _ = align(old, new, "village_id")
+    before = values(old, "player_id")[old_rows]
+    after = values(new, "player_id")[new_rows]
+    taken = (before != after) & (after != 0)
+    rows = new_rows[taken]
+    events = pd.DataFrame({column: values(new, column)[rows]
+                           for column in ("village_id", "x", "y", "continent", "points")})
+    events["old_player_id"] = before[taken]
+    events["new_player_id"] = after[taken]
+    events["old_ally_id"] = lookup(old_player, "player_id", "ally_id", before[taken])
+    events["new_ally_id"] = lookup(new_player, "player_id", "ally_id", after[taken])
+    return(events)
+
+def point_deltas(kind: str, old: pd.DataFrame, new: pd.DataFrame) -> pd.DataFrame:
+    """Get the players whose points changed between two snapshots.
+
+    Args:
+        kind (str): Points compared, "points" (player.txt), "oda" or "odd".
+        old (pd.DataFrame): Previous snapshot, keyed by player_id.
+        new (pd.DataFrame): Current snapshot, keyed by player_id.
+
+    Returns:
+        pd.DataFrame: POINT_DELTA_COLUMNS but datetime and server, one row
+        per player whose points changed or who appeared with points, whose
+        old_points are then 0 and old_rank null.
+    """
+    old, new = sorted_by(old, "player_id"), sorted_by(new, "player_id")
+    old_rows, new_rows, added = align(old, new, "player_id")
+    old_points, new_points = values(old, "points"), values(new, "points")
+    old_ranks, new_ranks = values(old, "rank"), values(new, "rank")
+
+    changed = old_points[old_rows] != new_points[new_rows]
+    added = added[new_points[added] != 0]
+    rows = np.concatenate([new_rows[changed], added])
+    before = np.concatenate([old_points[old_rows][changed], np.zeros(len(added), "int64")])
+    events = pd.DataFrame({"player_id": values(new, "player_id")[rows],
+                           "kind": kind,
+                           "old_points": before,
+                           "new_points": new_points[rows]})
+    events["delta"] = events["new_points"] - events["old_points"]
+    old_rank = pd.array(np.concatenate([old_ranks[old_rows][changed], np.zeros(len(added), "int64")]), dtype="Int64")
+    old_rank[len(rows) - len(added):] = pd.NA
+    events["old_rank"] = old_rank
+    events["new_rank"] = new_ranks[rows]
+    return(events.sort_values("player_id", kind="stable").reset_index(drop=True))
+
+def tribe_changes(old_player: pd.DataFrame, new_player: pd.DataFrame) -> pd.DataFrame:
+    """Get the players who joined, left or switched tribe between two snapshots.
+
+    Returns:
+        pd.DataFrame: TRIBE_CHANGE_COLUMNS but datetime and server, the
+        tribe ids being 0 for none.
+    """
+    old, new = sorted_by(old_player, "player_id"), sorted_by(new_player, "player_id")
+    old_rows, new_rows, _ = align(old, new, "player_id")
+    before = values(old, "ally_id")[old_rows]
+    after = values(new, "ally_id")[new_rows]
+    moved = before != after
+    rows = new_rows[moved]
+    return(pd.DataFrame({"player_id": values(new, "player_id")[rows],
+                         "old_ally_id": before[moved],
+                         "new_ally_id": after[moved],
+                         "points": values(new, "points")[rows]}))
+
+def diff(old: dict, new: dict, server: str, date: str) -> dict:
+    """Get the events between two snapshots of a world.
+
+    Every snapshot is sorted once (or only checked, map files are sorted)
+    and matched to the other by a binary search of its integer keys over
+    numpy arrays, without building any hash table, so time and memory grow
+    about linearly with the rows of the world.
+
+    Args:
+        old (dict): Previous {dataset: frame} of village, player, oda and odd.
+        new (dict): Current {dataset: frame} of the same datasets.
+        server (str): The game world identifier.
+        date (str): Day of the current snapshots, "%Y-%m-%d".
+
+    Returns:
+        dict: {"conquer", "point_delta", "tribe_change"} event tables, see
+        conquers, point_deltas and tribe_changes.
+    """
+    old = {dataset: sorted_by(frame, "village_id" if dataset == "village" else "player_id")
+           for dataset, frame in old.items()}
+    new = {dataset: sorted_by(frame, "village_id" if dataset == "village" else "player_id")
+           for dataset, frame in new.items()}
+    events = {"conquer": conquers(old["village"], new["village"], old["player"], new["player"]),
+              "point_delta": pd.concat([point_deltas(kind, old[dataset], new[dataset])
+                                        for kind, dataset in (("points", "player"), ("oda", "oda"), ("odd", "odd"))],
+                                       ignore_index=True),
+              "tribe_change": tribe_changes(old["player"], new["player"])}
+    columns = {"conquer": CONQUER_COLUMNS, "point_delta": POINT_DELTA_COLUMNS, "tribe_change": TRIBE_CHANGE_COLUMNS}
+    return({name: table.assign(datetime=pd.Timestamp(date), server=server)[columns[name]]
+            for name, table in events.items()})
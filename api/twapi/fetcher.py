@@ -0,0 +1,130 @@
+import asyncio
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+from .world import DATASETS
+
+class AsyncFetcher:
+    """Downloads map datasets for many worlds concurrently.
+
+    Every (world, dataset) pair is scheduled at once on an asyncio loop and the
+    blocking downloads run in a thread pool, capped both overall and per host.
+
+    Attributes:
+        max_concurrency (int): Maximum number of downloads in flight.
+        per_host (int): Maximum number of downloads in flight against one host.
+        validators (ValidatorStore): Makes downloads conditional when set.
+        metrics (Metrics): Records every download when set.
+    """
+
+    def __init__(self, max_concurrency: int = 16, per_host: int = 4, validators=None, metrics=None):
+        """Constructor for the AsyncFetcher class.
+
+        Args:
+            max_concurrency (int): Maximum number of downloads in flight.
+            per_host (int): Maximum number of downloads in flight against one host.
+            validators (ValidatorStore): If given, every download is a
+                conditional request and unchanged files come back as None.
+            metrics (Metrics): Records the download and decode stages.
+        """
+        self.max_concurrency = max_concurrency
+        self.per_host = per_host
+        self.validators = validators
+        self.metrics = metrics
+
+    def get(self, world, dataset: str) -> str:
+        """Blocking download of one dataset, run inside the thread pool."""
+        return(world.download(dataset, self.validators, self.metrics))
+
+    async def fetch(self, pairs) -> dict:
+        """Download every (world, dataset) pair concurrently.
+
+        Args:
+            pairs (list): List of (World, dataset) tuples.
+
+        Returns:
+            dict: {(gameworld, dataset): text}. A failed download maps to the
+            exception it raised, so one broken world does not cancel the others,
+            and an unchanged file (304) to None.
+        """
+        pairs = list(pairs)
+        loop = asyncio.get_running_loop()
+        limit = asyncio.Semaphore(self.max_concurrency)
+        host_limits = defaultdict(lambda: asyncio.Semaphore(self.per_host))
+
+        async def fetch_one(world, dataset):
+            async with limit, host_limits[urlparse(world.url(dataset)).netloc]:
+                return await loop.run_in_executor(pool, self.get, world, dataset)
+
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as pool:
+            results = await asyncio.gather(*(fetch_one(world, dataset) for world, dataset in pairs),
+                                           return_exceptions=True)
+        return({(world.gameworld, dataset): result for (world, dataset), result in zip(pairs, results)})
+
+    async def pipeline(self, pairs, handle, consumers: int, queue_size: int) -> dict:
+        """Download every (world, dataset) pair and handle each response as it arrives.
+
+        Downloads feed a bounded queue drained by consumers coroutines, each
+        awaiting handle(world, dataset, result) on one response at a time,
+        so processing overlaps the remaining downloads. A download only
+        releases its concurrency slot once its response is queued: when the
+        consumers fall behind the downloads stall, and at most
+        max_concurrency + queue_size + consumers responses are held in memory.
+
+        Args:
+            pairs (list): List of (World, dataset) tuples.
+            handle (coroutine function): Called with (world, dataset, text),
+                text being None for an unchanged file (304).
+            consumers (int): Number of responses handled at once.
+            queue_size (int): Maximum number of downloaded responses waiting
+                for a consumer.
+
+        Returns:
+            dict: {(gameworld, dataset): return value of handle}, or the
+            exception raised by the download or by handle.
+        """
+        pairs = list(pairs)
+        loop = asyncio.get_running_loop()
+        limit = asyncio.Semaphore(self.max_concurrency)
+        host_limits = defaultdict(lambda: asyncio.Semaphore(self.per_host))
+        queue = asyncio.Queue(maxsize=queue_size)
+        results = {}
+
+        async def produce(world, dataset):
+            async with limit, host_limits[urlparse(world.url(dataset)).netloc]:
+                try:
+                    result = await loop.run_in_executor(pool, self.get, world, dataset)
+                except Exception as error:
+                    result = error
+                await queue.put((world, dataset, result))
+
+        async def consume():
+            while True:
+                world, dataset, result = await queue.get()
+                try:
+                    if not isinstance(result, Exception):
+                        result = await handle(world, dataset, result)
+                except Exception as error:
+                    result = error
+                results[(world.gameworld, dataset)] = result
+                queue.task_done()
+
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as pool:
+            workers = [asyncio.create_task(consume()) for _ in range(consumers)]
+            await asyncio.gather(*(produce(world, dataset) for world, dataset in pairs))
+            await queue.join()
+            for worker in workers:
+                worker.cancel()
+        return({(world.gameworld, dataset): results[(world.gameworld, dataset)] for world, dataset in pairs})
+
+    def fetch_all(self, worlds, datasets=DATASETS) -> dict:
+        """Download the given datasets of every world.
+
+        Args:
+            worlds (list): List of World objects.
+            datasets (list): Dataset names, defaults to all of them.
+
+        Returns:
+            dict: {(gameworld, dataset): text, None or exception}
+        """
+        return(asyncio.run(self.fetch([(world, dataset) for world in worlds for dataset in datasets])))
@@ -0,0 +1,210 @@
+import os
+import sys
+import json
+import time
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+try:
+    import resource
+except ImportError:
+    # not available on Windows
+    resource = None
+
+#: Numeric fields of a stage record, summed by the aggregates.
+FIELDS = ("seconds", "bytes", "rows", "dropped")
+
+#: Prometheus metrics written for every (stage, world, dataset), as {record field: (name, help)}.
+PROMETHEUS = {"seconds": ("twapi_stage_duration_seconds", "Time spent in the stage."),
+              "bytes": ("twapi_stage_bytes", "Bytes transferred (download), decoded, parsed or written."),
+              "rows": ("twapi_stage_rows", "Rows parsed, kept by validation or written."),
+              "dropped": ("twapi_stage_dropped_rows", "Rows dropped as invalid by validation."),
+              "peak_memory": ("twapi_stage_peak_memory_bytes", "Peak resident memory of the process running the stage.")}
+
+def peak_memory() -> int:
+    """Get the peak resident memory of the current process in bytes, None where unknown."""
+    if resource is None:
+        return(None)
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes everywhere but on macOS
+    return(peak if sys.platform == "darwin" else peak * 1024)
+
+def _write(path: str, text: str) -> None:
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path + ".tmp", "w") as f:
+        f.write(text)
+    os.replace(path + ".tmp", path)
+
+def _label(value) -> str:
+    return(str(value if value is not None else "").replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+
+class Metrics:
+    """Collects the duration, bytes, rows and peak memory of every stage of a run.
+
+    A stage is one step (download, decode, parse, validate, write...) of one
+    dataset of one world. Stages are recorded with the stage() context
+    manager, from any thread. Stages running in another process are
+    recorded by a Metrics of that process and merged with extend().
+
+    Attributes:
+        records (list): One dict per stage: stage, world, dataset, seconds,
+            bytes, rows, dropped and peak_memory (None when not relevant).
+        started (float): Start of the run, as a timestamp.
+    """
+
+    def __init__(self):
+        """Constructor for the Metrics class."""
+        self._lock = threading.Lock()
+        self.reset()
+
+    def __getstate__(self) -> dict:
+        # picklable without its lock, e.g. when a task runner ships the flow to a worker
+        state = dict(self.__dict__)
+        del state["_lock"]
+        return(state)
+
+    def __setstate__(self, state: dict) -> None:
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def reset(self) -> None:
+        """Forget every record and restart the run clock."""
+        with self._lock:
+            self.records = []
+            self.started = time.time()
+
+    @contextmanager
+    def stage(self, stage: str, world: str = None, dataset: str = None):
+        """Time a stage, recorded even when it raises.
+
+        Args:
+            stage (str): Stage name, e.g. "download".
+            world (str): The game world identifier.
+            dataset (str): Dataset name, see DATASETS.
+
+        Returns:
+            dict: The record, whose bytes, rows and dropped the caller fills.
+        """
+        record = {"stage": stage, "world": world, "dataset": dataset,
+                  "seconds": None, "bytes": None, "rows": None, "dropped": None, "peak_memory": None}
+        start = time.perf_counter()
+        try:
+            yield record
+        finally:
+            record["seconds"] = time.perf_counter() - start
+            record["peak_memory"] = peak_memory()
+            with self._lock:
+                self.records.append(record)
+
+    def extend(self, records: list) -> None:
+        """Add records collected elsewhere, e.g. in a worker process."""
+        with self._lock:
+            self.records.extend(records)
+
+    def totals(self, *keys) -> dict:
+        """Sum the records by the given keys.
+
+        Args:
+            keys (str): Record fields to group by, e.g. "stage", "world".
+
+        Returns:
+            dict: {key values: {"seconds", "bytes", "rows", "dropped", "peak_memory"}},
+            peak_memory being the maximum. Durations of concurrent stages,
+            like downloads, add up to more than the wall time.
+        """
+        with self._lock:
+            records = list(self.records)
+        totals = {}
+        for record in records:
+            group = tuple(record[key] for key in keys)
+            total = totals.setdefault(group, {field: None for field in FIELDS + ("peak_memory",)})
+            for field in FIELDS:
+                if record[field] is not None:
+                    total[field] = (total[field] or 0) + record[field]
+            if record["peak_memory"] is not None:
+                total["peak_memory"] = max(total["peak_memory"] or 0, record["peak_memory"])
+        return(totals)
+
+    def summary(self) -> dict:
+        """Get the JSON run summary.
+
+        Returns:
+            dict: Run start, end and duration, totals per stage and per
+            dataset and stage, one flat row per world (seconds spent and
+            <stage>_<field> totals, e.g. download_bytes or validate_dropped)
+            slowest first, and the raw records.
+        """
+        finished = time.time()
+        datasets, worlds = {}, {}
+        for (dataset, stage), total in self.totals("dataset", "stage").items():
+            if dataset is not None:
+                datasets.setdefault(dataset, {})[stage] = total
+        for (world, stage), total in self.totals("world", "stage").items():
+            if world is None:
+                continue
+            row = worlds.setdefault(world, {"world": world, "seconds": 0})
+            row["seconds"] += total["seconds"] or 0
+            row.update({"{}_{}".format(stage, field): value for field, value in total.items()
+                        if value is not None and field != "peak_memory"})
+        return({"started": datetime.fromtimestamp(self.started, timezone.utc).isoformat(),
+                "finished": datetime.fromtimestamp(finished, timezone.utc).isoformat(),
+                "duration_seconds": finished - self.started,
+                "peak_memory_bytes": peak_memory(),
+                "stages": {stage: total for (stage,), total in self.totals("stage").items()},
+                "datasets": datasets,
+                "worlds": sorted(worlds.values(), key=lambda row: row["seconds"], reverse=True),
+                "records": list(self.records)})
+
+    def prometheus(self, shard: str = None) -> str:
+        """Get the metrics in the Prometheus text exposition format.
+
+        Args:
+            shard (str): Name of the shard of a sharded run, added as a
+                shard label to every series when given.
+        """
+        totals = self.totals("stage", "world", "dataset")
+        extra = ',shard="{}"'.format(_label(shard)) if shard is not None else ""
+        run = "{{{}}}".format(extra[1:]) if shard is not None else ""
+        lines = []
+        for field, (name, description) in PROMETHEUS.items():
+            lines.append("# HELP {} {}".format(name, description))
+            lines.append("# TYPE {} gauge".format(name))
+            for (stage, world, dataset), total in sorted(totals.items(), key=lambda item: str(item[0])):
+                if total[field] is not None:
+                    lines.append('{}{{stage="{}",world="{}",dataset="{}"{}}} {}'.format(
+                        name, _label(stage), _label(world), _label(dataset), extra, total[field]))
+        lines.extend(["# HELP twapi_run_duration_seconds Duration of the last run.",
+                      "# TYPE twapi_run_duration_seconds gauge",
+                      "twapi_run_duration_seconds{} {}".format(run, time.time() - self.started),
+                      "# HELP twapi_run_finished_timestamp_seconds End of the last run.",
+                      "# TYPE twapi_run_finished_timestamp_seconds gauge",
+                      "twapi_run_finished_timestamp_seconds{} {}".format(run, time.time())])
+        return("\n".join(lines) + "\n")
+
+    def export(self, folder: str, shard: str = None) -> dict:
+        """Write the Prometheus textfile and the JSON run summary.
+
+        <folder>/twapi.prom is overwritten by every run, for the textfile
+        collector of the node exporter, and <folder>/runs/<start>.json
+        keeps the summary of each run. A shard of a sharded run writes
+        <folder>/twapi.<shard>.prom, its series labelled with the shard,
+        and <folder>/runs/<start>.<shard>.json, so the shards sharing a
+        folder are all collected.
+
+        Args:
+            folder (str): Output folder, e.g. data/metrics.
+            shard (str): Name of the shard, e.g. "shard-0-of-4".
+
+        Returns:
+            dict: The run summary.
+        """
+        summary = self.summary()
+        suffix = ".{}".format(shard) if shard is not None else ""
+        _write(os.path.join(folder, "twapi{}.prom".format(suffix)), self.prometheus(shard))
+        name = datetime.fromtimestamp(self.started, timezone.utc).strftime("%Y-%m-%dT%H-%M-%SZ")
+        _write(os.path.join(folder, "runs", "{}{}.json".format(name, suffix)), json.dumps(summary, indent=1))
+        return(summary)
+
+#: Metrics of the current run, shared by every World fetch and subflow of the process.
+run_metrics = Metrics()
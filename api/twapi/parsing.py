@@ -0,0 +1,162 @@
+from __future__ import annotations
+import io
+from datetime import datetime
+from urllib.parse import unquote_plus
+
+#: Columns of each map file, in file order.
+COLUMNS = {"village": ["village_id", "name", "x", "y", "player_id", "points", "bonus"],
+           "player": ["player_id", "name", "ally_id", "num_vill", "points", "rank"],
+           "ally": ["ally_id", "name", "tag", "members", "num_vill", "points", "total_points", "rank"],
+           "odd": ["rank", "player_id", "points"],
+           "oda": ["rank", "player_id", "points"]}
+
+#: Column identifying a row of each map file.
+KEYS = {"village": "village_id",
+        "player": "player_id",
+        "ally": "ally_id",
+        "odd": "player_id",
+        "oda": "player_id"}
+
+#: Url-encoded text columns, every other column is an integer.
+TEXT_COLUMNS = {"village": ["name"],
+                "player": ["name"],
+                "ally": ["name", "tag"],
+                "odd": [],
+                "oda": []}
+
+#: Columns of the parsed frames, in the order of the World.get_* dictionaries.
+OUTPUT_COLUMNS = {"village": ["village_id", "name", "x", "y", "continent", "player_id", "points", "datetime", "server"],
+                  "player": ["player_id", "name", "ally_id", "num_vill", "points", "rank", "datetime", "server"],
+                  "ally": ["ally_id", "name", "tag", "members", "num_vill", "points", "total_points", "rank", "datetime", "server"],
+                  "odd": ["rank", "player_id", "points", "datetime", "server"],
+                  "oda": ["rank", "player_id", "points", "datetime", "server"]}
+
+def dtypes(dataset: str) -> dict:
+    """Get the {column: dtype} of a map file."""
+    return({column: (str if column in TEXT_COLUMNS[dataset] else "int64")
+            for column in COLUMNS[dataset]})
+
+def decode(column: pd.Series) -> pd.Series:
+    """Url-decode a text column.
+
+    Fields are decoded one by one after the csv is split, so an encoded
+    comma or plus sign ("%2C", "%2B") stays part of the name. Only the
+    rows that actually contain an escape are decoded.
+    """
+    encoded = column.str.contains("[%+]", regex=True)
+    if encoded.any():
+        column = column.copy()
+        column[encoded] = column[encoded].map(unquote_plus)
+    return(column)
+
+def continent(x: pd.Series, y: pd.Series) -> pd.Series:
+    """Get the continent number of coordinates, K<y hundreds><x hundreds>."""
+    return((y // 100) * 10 + x // 100)
+
+def parse_frame(dataset: str, text: str, server: str, date: str = None) -> pd.DataFrame:
+    """Parse the raw text of a map file into a typed DataFrame.
+
+    The csv is split by the C parser of pandas, integer columns are parsed
+    as int64, and the datetime and server columns are added once as constants.
+    If a field of an integer column is malformed or empty, the file is read
+    again as text and those columns are converted with a null for every
+    bad field (as floats), so validation drops and reports these rows
+    instead of the whole file being lost.
+
+    Args:
+        dataset (str): One of the keys of COLUMNS.
+        text (str): Raw, still url-encoded, content of the map file.
+        server (str): The game world identifier.
+        date (str): Snapshot date as "%Y-%m-%d", defaults to today.
+
+    Returns:
+        pd.DataFrame: One row per line, with the columns of OUTPUT_COLUMNS.
+    """
+    # pandas is only loaded once a map file is parsed, get_servers.php and the configs dont need it
+    import pandas as pd
+    types = dtypes(dataset)
+    try:
+        frame = pd.read_csv(io.StringIO(text), header=None, names=COLUMNS[dataset],
+                            dtype=types, engine="c", na_filter=False)
+    except pd.errors.EmptyDataError:
+        frame = pd.DataFrame({column: pd.Series(dtype=dtype) for column, dtype in types.items()})
+    except ValueError:
+        frame = pd.read_csv(io.StringIO(text), header=None, names=COLUMNS[dataset],
+                            dtype=str, engine="c", na_filter=False)
+        for column, dtype in types.items():
+            if dtype == "int64":
+                numbers = pd.to_numeric(frame[column], errors="coerce")
+                frame[column] = numbers.where(numbers % 1 == 0)
+
+    for column in TEXT_COLUMNS[dataset]:
+        frame[column] = decode(frame[column])
+    if dataset == "village":
+        frame["continent"] = continent(frame["x"], frame["y"])
+    frame["datetime"] = pd.Timestamp(date or datetime.now().strftime("%Y-%m-%d"))
+    frame["server"] = server
+    return(frame[OUTPUT_COLUMNS[dataset]])
+
+def unserialize(data):
+    """Parse a PHP serialized value, like the answer of backend/get_servers.php.
+
+    Supports arrays (as dicts), strings, integers, floats, booleans and
+    null. String lengths are byte counts, so the payload is parsed as bytes
+    and strings may contain quotes, semicolons or multi-byte characters.
+
+    Args:
+        data (bytes): Serialized value, str is encoded as utf-8.
+
+    Returns:
+        The value: dict, str, int, float, bool or None.
+
+    Raises:
+        ValueError: The payload is not a valid serialized value.
+    """
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+
+    def expect(position: int, token: bytes) -> int:
+        if data[position:position + len(token)] != token:
+            raise ValueError("Invalid PHP serialized data at byte {}: expected {!r}".format(position, token))
+        return(position + len(token))
+
+    def until(position: int, token: bytes) -> tuple:
+        end = data.find(token, position)
+        if end < 0:
+            raise ValueError("Invalid PHP serialized data at byte {}: missing {!r}".format(position, token))
+        return(data[position:end].decode("ascii"), end + len(token))
+
+    def value(position: int) -> tuple:
+        kind = data[position:position + 1]
+        if kind == b"N":
+            return(None, expect(position + 1, b";"))
+        position = expect(position + 1, b":")
+        if kind == b"i":
+            raw, position = until(position, b";")
+            return(int(raw), position)
+        if kind == b"d":
+            raw, position = until(position, b";")
+            return(float(raw), position)
+        if kind == b"b":
+            raw, position = until(position, b";")
+            return(raw == "1", position)
+        if kind == b"s":
+            size, position = until(position, b":")
+            position = expect(position, b'"')
+            end = position + int(size)
+            text = data[position:end].decode("utf-8")
+            return(text, expect(expect(end, b'"'), b";"))
+        if kind == b"a":
+            size, position = until(position, b":")
+            position = expect(position, b"{")
+            array = {}
+            for _ in range(int(size)):
+                key, position = value(position)
+                array[key], position = value(position)
+            return(array, expect(position, b"}"))
+        raise ValueError("Invalid PHP serialized data at byte {}: unknown type {!r}".format(position - 1, kind))
+
+    result, position = value(0)
+    if data[position:].strip():
+        raise ValueError("Invalid PHP serialized data at byte {}: trailing data".format(position))
+    return(result)
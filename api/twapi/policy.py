@@ -0,0 +1,202 @@
+import time
+import random
+import logging
+import threading
+from collections import defaultdict
+import requests
+
+logger = logging.getLogger(__name__)
+
+#: Statuses worth retrying: throttling and server errors.
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+class CircuitOpenError(requests.ConnectionError):
+    """Raised instead of sending a request to a host whose circuit is open."""
+
+class TokenBucket:
+    """Thread safe token bucket pacing the requests sent to one host.
+
+    Holds up to burst tokens, refilled at rate tokens per second. acquire()
+    takes a token, sleeping until one is available.
+
+    Attributes:
+        rate (float): Tokens added per second.
+        burst (float): Maximum number of tokens.
+    """
+
+    def __init__(self, rate: float, burst: float = None):
+        """Constructor for the TokenBucket class.
+
+        Args:
+            rate (float): Requests per second.
+            burst (float): Requests that can be sent at once, defaults to rate.
+        """
+        self.rate = rate
+        self.burst = burst if burst is not None else max(rate, 1)
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> float:
+        """Take a token, waiting for it if needed.
+
+        Returns:
+            float: Seconds waited.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            # reserve the token now, so waiting threads are served in order
+            self.tokens -= 1
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0
+        if wait:
+            time.sleep(wait)
+        return(wait)
+
+class CircuitBreaker:
+    """Stops sending requests to hosts that keep failing.
+
+    A host failing threshold times in a row is skipped for the rest of the
+    run (or for reset_after seconds): its requests raise CircuitOpenError
+    at once instead of waiting on timeouts and retries.
+
+    Attributes:
+        threshold (int): Consecutive failures opening the circuit of a host.
+        reset_after (float): Seconds a circuit stays open, None for the rest of the run.
+    """
+
+    def __init__(self, threshold: int = 5, reset_after: float = None):
+        """Constructor for the CircuitBreaker class.
+
+        Args:
+            threshold (int): Consecutive failures opening the circuit of a host.
+            reset_after (float): Seconds before a host is tried again, None
+                to skip it for the rest of the run.
+        """
+        self.threshold = threshold
+        self.reset_after = reset_after
+        self.failures = defaultdict(int)
+        self.opened = {}
+        self._lock = threading.Lock()
+
+    def check(self, host: str) -> None:
+        """Raise CircuitOpenError if the circuit of host is open."""
+        with self._lock:
+            if host not in self.opened:
+                return
+            if self.reset_after is not None and time.monotonic() - self.opened[host] >= self.reset_after:
+                # half open: let the next request through, one failure opens it again
+                del self.opened[host]
+                self.failures[host] = self.threshold - 1
+                return
+        raise CircuitOpenError("{} is failing, skipped for the rest of the run".format(host))
+
+    def success(self, host: str) -> None:
+        with self._lock:
+            self.failures[host] = 0
+
+    def failure(self, host: str) -> None:
+        with self._lock:
+            self.failures[host] += 1
+            if self.failures[host] >= self.threshold and host not in self.opened:
+                self.opened[host] = time.monotonic()
+                logger.error("%s failed %d times in a row, circuit opened", host, self.failures[host])
+
+    def is_open(self, host: str) -> bool:
+        return(host in self.opened)
+
+class FetchPolicy:
+    """How requests are sent to the game servers: paced, retried and cut off.
+
+    Every host gets its own token bucket, failed attempts (connection
+    errors, timeouts, 429 and 5xx) are retried after a jittered exponential
+    backoff, honouring Retry-After, and a host failing too often is skipped
+    by the circuit breaker. A failing host only holds up its own requests.
+
+    Attributes:
+        rate (float): Requests per second per host, None for no limit.
+        burst (float): Requests sent at once per host.
+        retries (int): Retries after the first attempt.
+        backoff (float): Base delay in seconds, doubled on every retry.
+        max_backoff (float): Maximum delay between two attempts.
+        breaker (CircuitBreaker): Circuit breaker shared by every host.
+    """
+
+    def __init__(self, rate: float = 5, burst: float = 10, retries: int = 3, backoff: float = 1,
+                 max_backoff: float = 30, failure_threshold: int = 5, retry_statuses=RETRY_STATUSES):
+        """Constructor for the FetchPolicy class.
+
+        Args:
+            rate (float): Requests per second per host, None for no limit.
+            burst (float): Requests sent at once per host.
+            retries (int): Retries after the first attempt.
+            backoff (float): Base delay in seconds, doubled on every retry.
+            max_backoff (float): Maximum delay between two attempts.
+            failure_threshold (int): Consecutive failed attempts after which
+                a host is skipped for the rest of the run.
+            retry_statuses (tuple): Http statuses that are retried.
+        """
+        self.rate = rate
+        self.burst = burst
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.retry_statuses = retry_statuses
+        self.breaker = CircuitBreaker(failure_threshold)
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def bucket(self, host: str) -> TokenBucket:
+        """Get the token bucket of a host, None without rate limit."""
+        if self.rate is None:
+            return(None)
+        with self._lock:
+            if host not in self._buckets:
+                self._buckets[host] = TokenBucket(self.rate, self.burst)
+            return(self._buckets[host])
+
+    def delay(self, attempt: int, retry_after: str = None) -> float:
+        """Seconds to wait before retry number attempt + 1 ("full jitter")."""
+        if retry_after is not None and retry_after.isdigit():
+            return(min(float(retry_after), self.max_backoff))
+        return(random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt)))
+
+    def send(self, host: str, send) -> requests.Response:
+        """Send a request to host following the policy.
+
+        Args:
+            host (str): Host of the request, what the limits apply to.
+            send (callable): Sends the request and returns the response.
+
+        Returns:
+            requests.Response: The first response that isnt retried.
+
+        Raises:
+            CircuitOpenError: The host is being skipped.
+            requests.RequestException: The last attempt failed, HTTPError
+                for a retried status.
+        """
+        for attempt in range(self.retries + 1):
+            self.breaker.check(host)
+            bucket = self.bucket(host)
+            if bucket is not None:
+                bucket.acquire()
+            try:
+                response = send()
+            except (requests.ConnectionError, requests.Timeout) as error:
+                self.breaker.failure(host)
+                if attempt == self.retries:
+                    raise
+                wait, reason = self.delay(attempt), error
+            else:
+                if response.status_code not in self.retry_statuses:
+                    self.breaker.success(host)
+                    return(response)
+                self.breaker.failure(host)
+                if attempt == self.retries:
+                    response.raise_for_status()
+                wait, reason = self.delay(attempt, response.headers.get("Retry-After")), response.status_code
+                response.close()
+            logger.warning("%s: attempt %d failed (%s), retrying in %.1fs", host, attempt + 1, reason, wait)
+            time.sleep(wait)
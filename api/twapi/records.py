@@ -0,0 +1,155 @@
+from collections.abc import Mapping
+import numpy as np
+import pandas as pd
+from .parsing import KEYS
+
+class Record(Mapping):
+    """Read-only view of one row of a RecordTable.
+
+    Behaves like the per-row dictionaries World.get_* used to return
+    (record["points"], dict(record), iteration over the column names) and
+    also exposes the columns as attributes (record.points). It holds no
+    data of its own, only the table and a row position.
+    """
+
+    __slots__ = ("_table", "_position")
+
+    def __init__(self, table, position: int):
+        self._table = table
+        self._position = position
+
+    def __getitem__(self, column: str):
+        return(self._table.value(column, self._position))
+
+    def __getattr__(self, column: str):
+        if column.startswith("_"):
+            raise AttributeError(column)
+        try:
+            return(self._table.value(column, self._position))
+        except KeyError:
+            raise AttributeError(column) from None
+
+    def __iter__(self):
+        return(iter(self._table.names))
+
+    def __len__(self) -> int:
+        return(len(self._table.names))
+
+    def __repr__(self) -> str:
+        return("Record({})".format(dict(self)))
+
+class RecordTable(Mapping):
+    """Compact, array-backed table of one map dataset of a world.
+
+    Every column is a single numpy array (int64 for the numeric columns),
+    and the date and server, identical for every row, are stored once on
+    the table. This costs a few bytes per integer field instead of one str
+    object each.
+
+    For backward compatibility the table is a mapping {str(id): Record}
+    in file order, like the dict of dicts World.get_* used to return. The
+    values are typed now: integer fields are ints and no longer str. It is
+    not a dict though: to_dict() gives the old dict of dicts (e.g. for
+    json.dumps) and to_frame() replaces pd.DataFrame(data).T, which raises
+    a TypeError pointing to it instead of building a frame of the ids.
+
+    Attributes:
+        dataset (str): Dataset name, see DATASETS.
+        server (str): The game world identifier.
+        date (str): Snapshot date, "%Y-%m-%d".
+        key (str): Column identifying a row.
+        columns (dict): {column: numpy array}
+    """
+
+    __slots__ = ("dataset", "server", "date", "key", "columns", "names", "_order", "_sorted")
+
+    def __init__(self, dataset: str, columns: dict, server: str, date: str):
+        """Constructor for the RecordTable class.
+
+        Args:
+            dataset (str): Dataset name, see DATASETS.
+            columns (dict): {column: numpy array}, without datetime and server.
+            server (str): The game world identifier.
+            date (str): Snapshot date, "%Y-%m-%d".
+        """
+        self.dataset = dataset
+        self.server = server
+        self.date = date
+        self.key = KEYS[dataset]
+        self.columns = columns
+        self.names = list(columns) + ["datetime", "server"]
+        self._order = np.argsort(columns[self.key], kind="stable")
+        self._sorted = columns[self.key][self._order]
+
+    @classmethod
+    def from_frame(cls, dataset: str, frame: pd.DataFrame):
+        """Build a table from a frame of api.twapi.parsing.parse_frame."""
+        columns = {column: frame[column].to_numpy() for column in frame.columns
+                   if column not in ("datetime", "server")}
+        date = frame["datetime"].iloc[0].strftime("%Y-%m-%d") if len(frame) else None
+        server = frame["server"].iloc[0] if len(frame) else None
+        return(cls(dataset, columns, server, date))
+
+    def value(self, column: str, position: int):
+        """Get one field, as a python int or str."""
+        if column == "datetime":
+            return(self.date)
+        if column == "server":
+            return(self.server)
+        value = self.columns[column][position]
+        return(value.item() if isinstance(value, np.generic) else value)
+
+    def position(self, key) -> int:
+        """Get the row position of an id, given as int or str."""
+        key = int(key)
+        found = np.searchsorted(self._sorted, key)
+        if found == len(self._sorted) or self._sorted[found] != key:
+            raise KeyError(key)
+        return(int(self._order[found]))
+
+    def __getitem__(self, key) -> Record:
+        try:
+            return(Record(self, self.position(key)))
+        except ValueError:
+            raise KeyError(key) from None
+
+    def __contains__(self, key) -> bool:
+        try:
+            self.position(key)
+        except (KeyError, ValueError):
+            return(False)
+        return(True)
+
+    def __iter__(self):
+        return((str(key) for key in self.columns[self.key].tolist()))
+
+    def __len__(self) -> int:
+        return(len(self.columns[self.key]))
+
+    def records(self):
+        """Iterate over the rows as Records, in file order."""
+        return((Record(self, position) for position in range(len(self))))
+
+    def to_dict(self) -> dict:
+        """Get the table as the dict of dicts {str(id): {column: value}} World.get_* used to return."""
+        return({key: dict(record) for key, record in zip(self, self.records())})
+
+    def __array__(self, dtype=None, copy=None):
+        # pd.DataFrame(table) would otherwise iterate over the ids
+        raise TypeError("a RecordTable is a mapping of records, use to_frame() for a DataFrame "
+                        "or to_dict() for a dict of dicts")
+
+    def to_frame(self) -> pd.DataFrame:
+        """Get the table as a typed DataFrame, like World.get_frame."""
+        frame = pd.DataFrame(self.columns)
+        frame["datetime"] = pd.Timestamp(self.date) if self.date is not None else pd.NaT
+        frame["server"] = self.server
+        return(frame)
+
+    @property
+    def nbytes(self) -> int:
+        """Memory held by the column arrays, not counting the str objects."""
+        return(sum(column.nbytes for column in self.columns.values()))
+
+    def __repr__(self) -> str:
+        return("RecordTable({}, {}, {}, {} rows)".format(self.dataset, self.server, self.date, len(self)))
@@ -0,0 +1,67 @@
+from urllib.parse import urlparse
+from functools import partial
+import requests
+from requests.adapters import HTTPAdapter
+from .policy import FetchPolicy
+
+#: (connect, read) timeout in seconds used when a request doesnt set its own.
+DEFAULT_TIMEOUT = (10, 120)
+
+class Session(requests.Session):
+    """HTTP session shared by the Server and World objects of a run.
+
+    Keeps connections alive between downloads, applies default headers and a
+    default timeout to every request, and sizes its connection pools to the
+    hosts it is going to talk to. Requests follow a FetchPolicy: rate
+    limited per host, retried with backoff and cut off by a circuit breaker.
+    Any object with a requests-like get(url, **kwargs) method can be
+    injected in its place.
+
+    Attributes:
+        timeout (tuple): Default (connect, read) timeout in seconds.
+        pool_maxsize (int): Connections kept alive per host.
+        hosts (set): Hosts registered with register_hosts.
+        policy (FetchPolicy): Pacing, retries and circuit breaker.
+    """
+
+    def __init__(self, timeout=DEFAULT_TIMEOUT, pool_maxsize: int = 10, headers: dict = None,
+                 policy: FetchPolicy = None):
+        """Constructor for the Session class.
+
+        Args:
+            timeout (tuple): Default (connect, read) timeout in seconds.
+            pool_maxsize (int): Connections kept alive per host, should be at
+                least the per host concurrency of the AsyncFetcher.
+            headers (dict): Extra headers sent with every request.
+            policy (FetchPolicy): Fetch policy, a default FetchPolicy if None.
+        """
+        super().__init__()
+        self.timeout = timeout
+        self.pool_maxsize = pool_maxsize
+        self.policy = policy if policy is not None else FetchPolicy()
+        self.hosts = set()
+        self.headers.update({"User-Agent": "TribalWarsAPI",
+                             "Accept-Encoding": "gzip, deflate"})
+        self.headers.update(headers or {})
+        self._mount_adapters()
+
+    def _mount_adapters(self):
+        adapter = HTTPAdapter(pool_connections=max(len(self.hosts), 10),
+                              pool_maxsize=self.pool_maxsize)
+        self.mount("http://", adapter)
+        self.mount("https://", adapter)
+
+    def register_hosts(self, urls) -> None:
+        """Size the connection pools so every given host keeps its connections.
+
+        Args:
+            urls (list): Urls (or base urls) of the hosts that will be queried.
+        """
+        hosts = self.hosts | {urlparse(url).netloc for url in urls}
+        if hosts != self.hosts:
+            self.hosts = hosts
+            self._mount_adapters()
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault("timeout", self.timeout)
+        return self.policy.send(urlparse(url).netloc, partial(super().request, method, url, **kwargs))
@@ -0,0 +1,133 @@
+import numpy as np
+import pandas as pd
+from .parsing import continent
+
+class VillageIndex:
+    """Grid index over the village coordinates of one world snapshot.
+
+    Villages are bucketed into square cells of cell x cell fields and stored
+    sorted by cell, row by row, so the villages of a row of cells form one
+    contiguous slice. A radius query only looks at the rows of cells
+    overlapping its bounding box. Villages are also grouped by player and
+    by continent for the owner and continent lookups.
+
+    Attributes:
+        frame (pd.DataFrame): The indexed villages, one row per village.
+        cell (int): Side of a grid cell, in fields.
+
+    :method within: villages within a radius of a point
+    :type: pd.DataFrame
+    :method barbarians: barbarian villages of a continent
+    :type: pd.DataFrame
+    :method nearest: nearest villages to a point, optionally of one player
+    :type: pd.DataFrame
+    """
+
+    def __init__(self, frame: pd.DataFrame, cell: int = 20):
+        """Constructor for the VillageIndex class.
+
+        Args:
+            frame (pd.DataFrame): Villages with at least the village_id, x, y
+                and player_id columns, e.g. World.get_frame("village").
+            cell (int): Side of a grid cell, in fields.
+        """
+        self.cell = cell
+        self.frame = frame.reset_index(drop=True)
+        self.x = self.frame["x"].to_numpy(dtype=np.int64)
+        self.y = self.frame["y"].to_numpy(dtype=np.int64)
+        self.player = self.frame["player_id"].to_numpy(dtype=np.int64)
+        self.continent = continent(self.x, self.y)
+
+        self.columns = int(self.x.max()) // cell + 1 if len(self.x) else 1
+        self.rows = int(self.y.max()) // cell + 1 if len(self.y) else 1
+        cells = (self.y // cell) * self.columns + self.x // cell
+        self.order = np.argsort(cells, kind="stable")
+        self.starts = np.searchsorted(cells[self.order], np.arange(self.rows * self.columns + 1))
+
+        self._arrays = {column: self.frame[column].to_numpy() for column in self.frame.columns}
+        self._players = self._groups(self.player)
+        self._continents = self._groups(self.continent)
+
+    @classmethod
+    def from_world(cls, world, data: str = None, cell: int = 20):
+        """Build the index of a World's current village.txt.
+
+        Args:
+            world (World): The world to index.
+            data (str): Raw village.txt, downloaded when omitted.
+            cell (int): Side of a grid cell, in fields.
+        """
+        return(cls(world.get_frame("village", data), cell))
+
+    def _groups(self, values: np.ndarray) -> dict:
+        """{value: positions of the villages having it}"""
+        order = np.argsort(values, kind="stable")
+        keys, starts = np.unique(values[order], return_index=True)
+        return(dict(zip(keys.tolist(), np.split(order, starts[1:]))))
+
+    def _rows(self, positions: np.ndarray, distances: np.ndarray = None) -> pd.DataFrame:
+        # built from plain arrays, much cheaper than frame.take on small results
+        rows = {column: values[positions] for column, values in self._arrays.items()}
+        if distances is not None:
+            rows["distance"] = distances
+        return(pd.DataFrame(rows, index=positions, copy=False))
+
+    def within(self, x: int, y: int, radius: float) -> pd.DataFrame:
+        """Get the villages within radius fields of (x, y), nearest first.
+
+        Args:
+            x (int): X coordinate of the center.
+            y (int): Y coordinate of the center.
+            radius (float): Maximum euclidean distance, in fields.
+
+        Returns:
+            pd.DataFrame: The matching villages with a distance column.
+        """
+        x0 = max(int((x - radius) // self.cell), 0)
+        x1 = min(int((x + radius) // self.cell), self.columns - 1)
+        y0 = max(int((y - radius) // self.cell), 0)
+        y1 = min(int((y + radius) // self.cell), self.rows - 1)
+        if x0 > x1 or y0 > y1:
+            return(self._rows(np.empty(0, dtype=np.int64), np.empty(0)))
+
+        candidates = np.concatenate([self.order[self.starts[row * self.columns + x0]:
+                                                self.starts[row * self.columns + x1 + 1]]
+                                     for row in range(y0, y1 + 1)])
+        distances = np.hypot(self.x[candidates] - x, self.y[candidates] - y)
+        inside = distances <= radius
+        candidates, distances = candidates[inside], distances[inside]
+        order = np.argsort(distances, kind="stable")
+        return(self._rows(candidates[order], distances[order]))
+
+    def continent_villages(self, continent: int) -> pd.DataFrame:
+        """Get the villages of a continent, e.g. 45 for K45."""
+        return(self._rows(self._continents.get(continent, np.empty(0, dtype=np.int64))))
+
+    def barbarians(self, continent: int) -> pd.DataFrame:
+        """Get the barbarian (player_id 0) villages of a continent, e.g. 45 for K45."""
+        positions = self._continents.get(continent, np.empty(0, dtype=np.int64))
+        return(self._rows(positions[self.player[positions] == 0]))
+
+    def nearest(self, x: int, y: int, n: int = 1, player_id: int = None) -> pd.DataFrame:
+        """Get the n villages nearest to (x, y), nearest first.
+
+        Args:
+            x (int): X coordinate of the point.
+            y (int): Y coordinate of the point.
+            n (int): Number of villages.
+            player_id (int): Only consider the villages of this player
+                (0 for barbarians), every village if None.
+
+        Returns:
+            pd.DataFrame: At most n villages with a distance column.
+        """
+        if player_id is None:
+            positions = np.arange(len(self.frame))
+        else:
+            positions = self._players.get(player_id, np.empty(0, dtype=np.int64))
+        distances = np.hypot(self.x[positions] - x, self.y[positions] - y)
+        if n < len(positions):
+            closest = np.argpartition(distances, n - 1)[:n]
+            positions, distances = positions[closest], distances[closest]
+        order = np.argsort(distances, kind="stable")
+        return(self._rows(positions[order], distances[order]))
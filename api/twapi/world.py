@@ -1,8 +1,27 @@
-import requests
-import xmltodict
-from urllib.parse import unquote
-from datetime import datetime
-from prefect import task
+from .session import Session
+from .cache import ConfigCache, ValidatorStore, default_cache
+from .parsing import parse_frame
+from .metrics import Metrics
+
+#: Map datasets exposed by every world, as {dataset: World attribute holding its url}.
+DATASETS = {"player": "player_data",
+            "ally": "ally_data",
+            "odd": "kill_def",
+            "oda": "kill_att",
+            "village": "village_data"}
+
+#: Bytes read at a time from a streamed response.
+CHUNK_SIZE = 1 << 16
+
+#: World configurations, as {kind: World attribute holding its url}.
+CONFIGS = {"config": "gameworld_config",
+           "building": "building_config",
+           "unit": "unit_config"}
+
+def record_table(dataset: str, frame):
+    """Build the RecordTable of a parsed frame, numpy being loaded by the first one."""
+    from .records import RecordTable
+    return(RecordTable.from_frame(dataset, frame))
 
 class World:
     """This class contains all available public world data.
@@ -10,34 +29,51 @@ class World:
     Attributes:
         gameworld (str): The game world identifier.
         server (str): The server URL.
+        session (Session): HTTP session used for every request.
+        config_cache (ConfigCache): Cache of the world configurations.
 
+    :method config: returns a whole parsed configuration
+    :type: dict
     :method worldspeed: property that returns world speed
     :type: dict
     :method building: returns building data 
     :type: dict
     :method unit: returns unit data
     :type dict:
+    :method get_frame: returns a map dataset as a typed DataFrame
+    :type: pd.DataFrame
+    :method iter_frames: streams a map dataset as typed DataFrame batches
+    :type: generator
+    :method village_index: returns a spatial index over the villages
+    :type: VillageIndex
     :method get_village: returns data on all villages in the world
-    :type dict:
+    :type: RecordTable
     :method get_player: returns data on all players in the world
-    :type dict:
+    :type: RecordTable
     :method get_ally: returns data on all tribes in the world
-    :type dict:
+    :type: RecordTable
     :method get_odd: returns data on defensive pontuation
-    :type dict:
+    :type: RecordTable
     :method get_oda: returns data on offensive pontuation
-    :type dict:
+    :type: RecordTable
     """
 
-    def __init__(self, gameworld: str, server: str):
+    def __init__(self, gameworld: str, server: str, session: Session = None,
+                 config_cache: ConfigCache = None):
         """Constructor for the World class.
 
         Args:
             gameworld (str): The game world identifier.
             server (str): The server URL.
+            session (Session): HTTP session, usually shared by all worlds
+                of a Server. A new one is created if None.
+            config_cache (ConfigCache): Cache of the world configurations,
+                defaults to the cache shared by the whole process.
         """
         self.gameworld = gameworld
         self.server = server
+        self.session = session if session is not None else Session()
+        self.config_cache = config_cache if config_cache is not None else default_cache
         self.building_config = f"{server}/interface.php?func=get_building_info"
         self.gameworld_config = f"{server}/interface.php?func=get_config"
         self.unit_config = f"{server}/interface.php?func=get_unit_info"
@@ -47,6 +83,173 @@ class World:
         self.kill_att = f"{server}/map/kill_att.txt"
         self.village_data = f"{server}/map/village.txt"
 
+    def url(self, dataset: str) -> str:
+        """Get the endpoint url of a map dataset or of a configuration.
+
+        Args:
+            dataset (str): One of the keys of DATASETS or of CONFIGS.
+        """
+        return(getattr(self, DATASETS[dataset] if dataset in DATASETS else CONFIGS[dataset]))
+
+    def download(self, dataset: str, validators: ValidatorStore = None, metrics: Metrics = None) -> str:
+        """Download the raw text of a map dataset.
+
+        The response is streamed with compressed transfer encoding and
+        decompressed chunk by chunk.
+
+        Args:
+            dataset (str): One of the keys of DATASETS.
+            validators (ValidatorStore): If given, the request is conditional
+                on the last committed ETag/Last-Modified of the url.
+            metrics (Metrics): Records the download (bytes over the wire)
+                and decode (bytes decoded) stages when given.
+
+        Returns:
+            str: The raw text, or None if the server answered 304 Not Modified.
+
+        Raises:
+            requests.HTTPError: The server answered with an error status.
+        """
+        metrics = metrics if metrics is not None else Metrics()
+        url = self.url(dataset)
+        headers = validators.headers(url) if validators is not None else {}
+        with metrics.stage("download", self.gameworld, dataset) as stage:
+            with self.session.get(url, headers=headers, stream=True) as response:
+                if response.status_code == 304:
+                    return(None)
+                # an error page (e.g. a closed world) is neither data nor a validator to keep
+                response.raise_for_status()
+                if validators is not None:
+                    validators.update(url, response)
+                content = b"".join(response.iter_content(CHUNK_SIZE))
+                # compressed size, as read from the socket
+                stage["bytes"] = response.raw.tell() if hasattr(response.raw, "tell") else len(content)
+        with metrics.stage("decode", self.gameworld, dataset) as stage:
+            text = content.decode(response.encoding or "utf-8", errors="replace")
+            stage["bytes"] = len(content)
+        return(text)
+
+    def iter_batches(self, dataset: str, batch_size: int = 100000, validators: ValidatorStore = None):
+        """Stream a map dataset as raw text batches of at most batch_size lines.
+
+        The response is read chunk by chunk and split into lines as it
+        arrives, so only one batch is held in memory at a time.
+
+        Args:
+            dataset (str): One of the keys of DATASETS.
+            batch_size (int): Maximum number of lines per batch.
+            validators (ValidatorStore): If given, the request is conditional.
+
+        Returns:
+            generator: Yields the batches as str, or None if the server
+            answered 304 Not Modified.
+
+        Raises:
+            requests.HTTPError: The server answered with an error status.
+        """
+        url = self.url(dataset)
+        headers = validators.headers(url) if validators is not None else {}
+        response = self.session.get(url, headers=headers, stream=True)
+        if response.status_code == 304:
+            response.close()
+            return(None)
+        if not response.ok:
+            response.close()
+            response.raise_for_status()
+        if validators is not None:
+            validators.update(url, response)
+
+        def batches():
+            with response:
+                lines = []
+                for line in response.iter_lines(CHUNK_SIZE):
+                    lines.append(line)
+                    if len(lines) == batch_size:
+                        yield b"\n".join(lines).decode(response.encoding or "utf-8", errors="replace")
+                        lines = []
+                if lines:
+                    yield b"\n".join(lines).decode(response.encoding or "utf-8", errors="replace")
+
+        return(batches())
+
+    def iter_frames(self, dataset: str, batch_size: int = 100000, validators: ValidatorStore = None,
+                    date: str = None):
+        """Stream a map dataset as typed DataFrames of at most batch_size rows.
+
+        Peak memory is bounded by the batch size instead of the world size,
+        which matters for village.txt on the largest worlds.
+
+        Args:
+            dataset (str): One of the keys of DATASETS.
+            batch_size (int): Maximum number of rows per DataFrame.
+            validators (ValidatorStore): If given, the request is conditional.
+            date (str): Snapshot date as "%Y-%m-%d", defaults to today.
+
+        Returns:
+            generator: Yields pd.DataFrame batches, or None if the server
+            answered 304 Not Modified.
+        """
+        batches = self.iter_batches(dataset, batch_size, validators)
+        if batches is None:
+            return(None)
+        return(parse_frame(dataset, batch, self.gameworld, date) for batch in batches)
+
+    def get_frame(self, dataset: str, data: str = None, date: str = None):
+        """Get a map dataset as a typed DataFrame.
+
+        Faster than the get_* record tables: the file is parsed
+        by a C csv reader straight into int64/str columns.
+
+        Args:
+            dataset (str): One of the keys of DATASETS.
+            data (str): Raw response, e.g. downloaded by AsyncFetcher.
+                Downloaded here when omitted.
+            date (str): Snapshot date as "%Y-%m-%d", defaults to today.
+
+        Returns:
+            pd.DataFrame: The columns of the dataset's pandera schema.
+        """
+        if data is None:
+            data = self.download(dataset)
+        return(parse_frame(dataset, data, self.gameworld, date))
+
+    def village_index(self, data: str = None, cell: int = 20):
+        """Get a spatial index over the villages of the world.
+
+        Answers radius, continent and nearest-village queries without
+        scanning the whole village table, see VillageIndex.
+
+        Args:
+            data (str): Raw village.txt, downloaded when omitted.
+            cell (int): Side of a grid cell of the index, in fields.
+
+        Returns:
+            VillageIndex: The index of the current snapshot.
+        """
+        from .spatial import VillageIndex
+        return(VillageIndex.from_world(self, data, cell))
+
+    def config(self, kind: str = "config") -> dict:
+        """Get a whole parsed world configuration.
+
+        The configuration is downloaded once and then served from the
+        config cache until its TTL expires.
+
+        Args:
+            kind (str): One of the keys of CONFIGS: "config" for the world
+                settings, "building" or "unit".
+
+        Returns:
+            dict: The content of the <config> root element.
+        """
+        def fetch():
+            import xmltodict
+            response = self.session.get(self.url(kind))
+            response.raise_for_status()
+            return(xmltodict.parse(response.text)["config"])
+
+        return(self.config_cache.get(self.gameworld, kind, fetch))
+
     @property
     def worldspeed(self) -> int:           
         """Get the world speed.
@@ -57,8 +260,7 @@ class World:
         :returns:
             {"speed": 1}
         """
-        gameworld_config = xmltodict.parse(requests.get(self.gameworld_config).text)
-        return({"speed": gameworld_config["config"]["speed"]})
+        return({"speed": self.config("config")["speed"]})
 
     def building(self, building: str) -> dict:
         """Get information about a specific building.
@@ -72,8 +274,7 @@ class World:
                      ('build_time', '6000'), ('build_time_factor', '1.2')])
         """
 
-        building_config = xmltodict.parse(requests.get(self.building_config).text)
-        return(building_config["config"][building])
+        return(self.config("building")[building])
 
     def unit(self, unit: str) -> dict:
         """Get information about a specific unit.
@@ -88,190 +289,142 @@ class World:
            :param unit:
         """
 
-        unit_config = xmltodict.parse(requests.get(self.unit_config).text)
-        return(unit_config["config"][unit])
+        return(self.config("unit")[unit])
 
-    def get_village(self):
+    def get_village(self, data: str = None):
         """Get data on all villages in the world.
 
+        Args:
+            data (str): Raw response, e.g. downloaded by AsyncFetcher.
+                Downloaded here when omitted.
+
         Returns:
-            dict: A dictionary containing village information.
+            RecordTable: {str(id): record} mapping of the village information,
+            with int values for the numeric fields.
+            Use its to_dict() for the former dict of dicts (json.dumps) and
+            its to_frame() for a DataFrame, instead of pd.DataFrame(data).T.
         
         :returns:
            '47199': {
-              'village_id': '47199',
+              'village_id': 47199,
               'name': 'Aldeia de rpcg980',
-              'x': '469',
-              'y': '696',
-              'continent': '64',
-              'player_id': '265454'
-              'points': '26'
+              'x': 469,
+              'y': 696,
+              'continent': 64,
+              'player_id': 265454,
+              'points': 26
         }
         """
 
-        @task(name="{}:Fetch Village Data".format(self.gameworld),
-            description="Pull village data from endpoint.")
-        def parser(data:str):
-            info = {}
-            for row in data.splitlines():
-                _info = row.split(",")
-                info.update({_info[0]: 
-                                {"village_id": _info[0],
-                                "name": _info[1],
-                                "x": _info[2],
-                                "y": _info[3],
-                                "continent": _info[3][:1]+_info[2][:1],
-                                "player_id": _info[4],
-                                "points": _info[5],
-                                "datetime": str(datetime.now().strftime("%Y-%m-%d")),
-                                "server": self.gameworld}})
-            return(info)
-
-        data = unquote(requests.get(self.village_data).text).replace("+", " ")
-        return parser(data)
-
-
-    def get_player(self):
+        if data is None:
+            data = self.download("village")
+        return(record_table("village", parse_frame("village", data, self.gameworld)))
+
+
+    def get_player(self, data: str = None):
         """Get data on all players in the world.
 
+        Args:
+            data (str): Raw response, e.g. downloaded by AsyncFetcher.
+                Downloaded here when omitted.
+
         Returns:
-            dict: A dictionary containing player information.
+            RecordTable: {str(id): record} mapping of the player information,
+            with int values for the numeric fields.
+            Use its to_dict() for the former dict of dicts (json.dumps) and
+            its to_frame() for a DataFrame, instead of pd.DataFrame(data).T.
         
         :returns:
            '455936': {
-             'player_id': '455936',
+             'player_id': 455936,
              'name': 'marco faria',
-             'ally_id': '2736',
-             'num_vill': '2',
-             'points': '908',
-             'rank': '1659'
+             'ally_id': 2736,
+             'num_vill': 2,
+             'points': 908,
+             'rank': 1659
           },
         """
 
-        @task(name="{}:Fetch Player Data".format(self.gameworld),
-            description="Pull player data from endpoint.")
-        def parser(data:str):
-            info = {}
-            for row in data.splitlines():
-                _info = row.split(",")
-                info.update({_info[0]: 
-                                {"player_id": _info[0],
-                                "name": _info[1],
-                                "ally_id": _info[2],
-                                "num_vill": _info[3],
-                                "points": _info[4],
-                                "rank": _info[5],
-                                "datetime": str(datetime.now().strftime("%Y-%m-%d")),
-                                "server": self.gameworld}})
-
-            return(info)
-
-
-        data = unquote(requests.get(self.player_data).text).replace("+", " ")
-        return parser(data)
-
-    def get_ally(self):
+        if data is None:
+            data = self.download("player")
+        return(record_table("player", parse_frame("player", data, self.gameworld)))
+
+    def get_ally(self, data: str = None):
         """Get data on all tribes in the world.
 
+        Args:
+            data (str): Raw response, e.g. downloaded by AsyncFetcher.
+                Downloaded here when omitted.
+
         Returns:
-            dict: A dictionary containing ally information.
+            RecordTable: {str(id): record} mapping of the ally information,
+            with int values for the numeric fields.
+            Use its to_dict() for the former dict of dicts (json.dumps) and
+            its to_frame() for a DataFrame, instead of pd.DataFrame(data).T.
         
         :returns:
            '4': {
-             'ally_id': '4',
+             'ally_id': 4,
              'name': 'Vai Tudo Abaixo ...',
              'tag': 'VT@',
-             'members': '40',
-             'num_vill': '3360',
-             'points': '29194494',
-             'total_points': '29194494',
-             'rank': '1'
+             'members': 40,
+             'num_vill': 3360,
+             'points': 29194494,
+             'total_points': 29194494,
+             'rank': 1
           },
         """
 
-        @task(name="{}:Fetch Ally Data".format(self.gameworld),
-            description="Pull ally data from endpoint.")
-        def parser(data:str):
-            info = {}
-            for row in data.splitlines():
-                _info = row.split(",")
-                info.update({_info[0]: 
-                                {"ally_id": _info[0],
-                                "name": _info[1],
-                                "tag": _info[2],
-                                "members": _info[3],
-                                "num_vill": _info[4],
-                                "points": _info[5],
-                                "total_points": _info[6],
-                                "rank": _info[7],
-                                "datetime": str(datetime.now().strftime("%Y-%m-%d")),
-                                "server": self.gameworld}})
-
-            return(info)
-
-        data = unquote(requests.get(self.ally_data).text).replace("+", " ")
-        return parser(data)
-
-    def get_odd(self):
+        if data is None:
+            data = self.download("ally")
+        return(record_table("ally", parse_frame("ally", data, self.gameworld)))
+
+    def get_odd(self, data: str = None):
         """Get data on defensive pontuation in the world.
 
+        Args:
+            data (str): Raw response, e.g. downloaded by AsyncFetcher.
+                Downloaded here when omitted.
+
         Returns:
-            dict: A dictionary containing ODD (Defensive) information.
+            RecordTable: {str(id): record} mapping of the ODD (Defensive) information,
+            with int values for the numeric fields.
+            Use its to_dict() for the former dict of dicts (json.dumps) and
+            its to_frame() for a DataFrame, instead of pd.DataFrame(data).T.
         
         :returns:
            '351544': {
-             'rank': '1150',
-             'player_id': '351544',
-             'points': '53328'
+             'rank': 1150,
+             'player_id': 351544,
+             'points': 53328
           },
         """
 
-        @task(name="{}:Fetch ODD Data".format(self.gameworld),
-            description="Pull ODD data from endpoint.")
-        def parser(data:str):
-            info = {}
-            for row in data.splitlines():
-                _info = row.split(",")
-                info.update({_info[1]: 
-                                {"rank": _info[0],
-                                "player_id": _info[1],
-                                "points": _info[2],
-                                "datetime": str(datetime.now().strftime("%Y-%m-%d")),
-                                "server": self.gameworld}})
-
-            return(info)
-
-        data = unquote(requests.get(self.kill_def).text).replace("+", " ")
-        return parser(data)
-
-    def get_oda(self):
+        if data is None:
+            data = self.download("odd")
+        return(record_table("odd", parse_frame("odd", data, self.gameworld)))
+
+    def get_oda(self, data: str = None):
         """Get data on offensive pontuation in the world.
 
+        Args:
+            data (str): Raw response, e.g. downloaded by AsyncFetcher.
+                Downloaded here when omitted.
+
         Returns:
-            dict: A dictionary containing ODA (Offensive) information.
+            RecordTable: {str(id): record} mapping of the ODA (Offensive) information,
+            with int values for the numeric fields.
+            Use its to_dict() for the former dict of dicts (json.dumps) and
+            its to_frame() for a DataFrame, instead of pd.DataFrame(data).T.
         
         :returns:
            '352972': {
-             'rank': '1222',
-             'player_id': '352972',
-             'points': '6790'
+             'rank': 1222,
+             'player_id': 352972,
+             'points': 6790
           },
         """
 
-        @task(name="{}:Fetch ODA Data".format(self.gameworld),
-            description="Pull ODA data from endpoint.")
-        def parser(data:str):
-            info = {}
-            for row in data.splitlines():
-                _info = row.split(",")
-                info.update({_info[1]: 
-                                {"rank": _info[0],
-                                "player_id": _info[1],
-                                "points": _info[2],
-                                "datetime": str(datetime.now().strftime("%Y-%m-%d")),
-                                "server": self.gameworld}})
-
-            return(info)
-
-        data = unquote(requests.get(self.kill_att).text).replace("+", " ")
-        return parser(data)
+        if data is None:
+            data = self.download("oda")
+        return(record_table("oda", parse_frame("oda", data, self.gameworld)))
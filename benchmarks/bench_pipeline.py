@@ -0,0 +1,254 @@
+"""
+Times every stage of the daily job, offline, against a local stub of the
+Tribal Wars endpoints serving synthetic files.
+
+    python -m benchmarks.bench_pipeline --rows 10000 100000 1000000 --output report.json
+
+Stages, per scale (villages per world) and dataset: generate, discover
+(get_servers.php), discover_cached, config, download, parse, records (World.get_*),
+validate_pandera, validate_fast, write_json, write_parquet, events
+(api.twapi.events.diff of two snapshots of every world), end_to_end
+(the tasks.dump_unit of every world: download, parse, validate and write), archive
+(RawArchive.put of every raw file), replay (subflows.replay_world:
+read the archive, parse, validate and write), and with pyarrow, compact
+(HistoryStore.compact of the end_to_end files) and read_history (reading
+them back from the monthly history). The report
+is JSON, compare two of them with benchmarks.compare.
+"""
+import sys
+sys.path.append(".")
+import argparse
+import importlib.util
+import json
+import os
+import platform
+import subprocess
+import tempfile
+import time
+from importlib import metadata
+
+from api.twapi.baseserver import Server
+from api.twapi.cache import ConfigCache
+from api.twapi.fetcher import AsyncFetcher
+from api.twapi.parsing import parse_frame
+from api.twapi.records import RecordTable
+from api.twapi.events import diff
+from api.twapi.session import Session
+from api.twapi.policy import FetchPolicy
+from api.twapi.world import CONFIGS, DATASETS
+from api.pandera.schemas import SCHEMAS
+from api.pandera.fast import fast_validate
+from api.storage.writers import get_writer
+from api.storage.archive import RawArchive
+
+from .stub import StubServer
+from .synthetic import region_files
+
+PACKAGES = ["pandas", "numpy", "pandera", "pyarrow", "requests", "prefect"]
+
+def environment() -> dict:
+    """Versions the timings depend on."""
+    versions = {}
+    for package in PACKAGES:
+        try:
+            versions[package] = metadata.version(package)
+        except metadata.PackageNotFoundError:
+            versions[package] = None
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output = True,
+                                text = True, check = True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {"commit": commit,
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "cpus": os.cpu_count(),
+            "packages": versions}
+
+def best_of(repeat, function, *args):
+    """Best wall clock time of repeat calls, and the last result."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function(*args)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+class Report:
+    """Collects the stage timings of one scale."""
+
+    def __init__(self, rows: int):
+        self.rows = rows
+        self.stages = []
+
+    def add(self, stage: str, seconds: float, dataset: str = None, rows: int = None, size: int = None):
+        self.stages.append({"scale": self.rows,
+                            "stage": stage,
+                            "dataset": dataset,
+                            "seconds": seconds,
+                            "rows": rows,
+                            "bytes": size,
+                            "rows_per_second": rows / seconds if rows and seconds else None})
+
+def end_to_end(worlds, folder: str, output_format: str, validation: str, workers: int) -> dict:
+    """Seconds of the dump_unit tasks of every world per dataset, run side by side, dumping under folder."""
+    from concurrent.futures import ThreadPoolExecutor
+    from api.prefect_config import subflows
+    from api.prefect_config.tasks import dump_unit
+    from api.prefect_config.units import plan_units
+    # every world lives on the stub host, pacing it would only time the rate limit
+    options = {"output_format": output_format, "validation": validation, "workers": workers,
+               "session_options": {"per_host": 4, "requests_per_second": None}}
+    cwd = os.getcwd()
+    os.chdir(folder)
+    try:
+        seconds = {}
+        for dataset in DATASETS:
+            units = plan_units(worlds, [dataset], subflows.date)
+            start = time.perf_counter()
+            # as many units in flight as fetch_from_api keeps per host
+            with ThreadPoolExecutor(4) as pool:
+                list(pool.map(lambda unit: dump_unit.fn(unit, **options), units))
+            seconds[dataset] = time.perf_counter() - start
+        return seconds
+    finally:
+        subflows.shutdown_pools()
+        os.chdir(cwd)
+
+def replay(worlds, folder: str, archive: RawArchive, digests: dict, output_format: str, validation: str) -> dict:
+    """Seconds of subflows.replay_world per dataset, rebuilding one archived day under folder."""
+    from api.prefect_config import subflows
+    cwd = os.getcwd()
+    os.chdir(folder)
+    try:
+        seconds = {}
+        for dataset in DATASETS:
+            start = time.perf_counter()
+            for world in worlds:
+                subflows.replay_world(archive.root, dataset, world.gameworld,
+                                      [("2000-01-01", digests[(world.gameworld, dataset)])],
+                                      output_format = output_format, validation = validation)
+            seconds[dataset] = time.perf_counter() - start
+        return seconds
+    finally:
+        os.chdir(cwd)
+
+def run_scale(rows: int, worlds: int, repeat: int, workers: int) -> list:
+    report = Report(rows)
+    names = ["zz{}".format(i + 1) for i in range(worlds)]
+
+    with StubServer() as stub, tempfile.TemporaryDirectory() as folder:
+        seconds, files = best_of(1, region_files, stub.url, names, rows)
+        stub.files.update(files)
+        stub.prepare()
+        report.add("generate", seconds, rows = rows * worlds, size = sum(len(body) for body in files.values()))
+
+        # every world lives on the stub host, pacing it would only time the rate limit
+        session = Session(pool_maxsize = 4, policy = FetchPolicy(rate = None))
+        # a cache that never holds, so every repeat downloads and parses get_servers.php
+        seconds, found = best_of(repeat, lambda: Server(stub.host, session, ConfigCache(None, ttl = 0)).generate_worlds())
+        report.add("discover", seconds, rows = len(found))
+        cache = ConfigCache(None)
+        Server(stub.host, session, cache).get_active_servers(stub.host)
+        seconds, _ = best_of(repeat, lambda: Server(stub.host, session, cache).generate_worlds())
+        report.add("discover_cached", seconds, rows = len(found))
+
+        def configs():
+            cache = ConfigCache(tempfile.mkdtemp(dir = folder))
+            for world in found:
+                world.config_cache = cache
+                for kind in CONFIGS:
+                    world.config(kind)
+        seconds, _ = best_of(repeat, configs)
+        report.add("config", seconds, rows = len(found) * len(CONFIGS))
+
+        seconds, raw = best_of(repeat, AsyncFetcher().fetch_all, found)
+        report.add("download", seconds, rows = len(raw), size = sum(len(text) for text in raw.values()))
+
+        formats = {"write_json": "json"}
+        if importlib.util.find_spec("pyarrow") is not None:
+            formats["write_parquet"] = "parquet"
+
+        counts = {}
+        parsed = {}
+        for dataset in DATASETS:
+            texts = [(world.gameworld, raw[(world.gameworld, dataset)]) for world in found]
+            size = sum(len(text) for _, text in texts)
+            seconds, frames = best_of(repeat, lambda: [parse_frame(dataset, text, name) for name, text in texts])
+            count = counts[dataset] = sum(len(frame) for frame in frames)
+            parsed[dataset] = frames
+            report.add("parse", seconds, dataset, count, size)
+
+            seconds, _ = best_of(repeat, lambda: [RecordTable.from_frame(dataset, frame) for frame in frames])
+            report.add("records", seconds, dataset, count)
+
+            schema = SCHEMAS[dataset]
+            seconds, valid = best_of(repeat, lambda: [schema.validate(frame, lazy = True) for frame in frames])
+            report.add("validate_pandera", seconds, dataset, count)
+            seconds, _ = best_of(repeat, lambda: [fast_validate(schema, frame) for frame in frames])
+            report.add("validate_fast", seconds, dataset, count)
+
+            for stage, output_format in formats.items():
+                writer = get_writer(output_format, schema)
+                paths = [os.path.join(folder, "{}.{}.{}".format(name, dataset, writer.extension)) for name, _ in texts]
+                seconds, _ = best_of(repeat, lambda: [writer.write(frame, path) for frame, path in zip(valid, paths)])
+                report.add(stage, seconds, dataset, count, sum(os.path.getsize(path) for path in paths))
+
+        # a day later, a tenth of the villages changed owner and every player scored
+        snapshots = []
+        for i, world in enumerate(found):
+            old = {dataset: parsed[dataset][i] for dataset in ("village", "player", "oda", "odd")}
+            new = dict(old, village = old["village"].assign(player_id = old["village"]["player_id"].where(
+                           old["village"].index % 10 != 0, old["village"]["player_id"] + 1)),
+                       player = old["player"].assign(points = old["player"]["points"] + 1))
+            snapshots.append((old, new, world.gameworld))
+        seconds, _ = best_of(repeat, lambda: [diff(old, new, name, "2000-01-02") for old, new, name in snapshots])
+        report.add("events", seconds, rows = counts["village"] + counts["player"] + counts["oda"] + counts["odd"])
+
+        for dataset, seconds in end_to_end(found, folder, "json", "fast", workers).items():
+            report.add("end_to_end", seconds, dataset, counts[dataset])
+
+        archive = RawArchive(os.path.join(os.path.abspath(folder), "raw"))
+        seconds, digests = best_of(repeat, lambda: {key: archive.put(text) for key, text in raw.items()})
+        report.add("archive", seconds, rows = len(raw), size = sum(len(text) for text in raw.values()))
+        for dataset, seconds in replay(found, folder, archive, digests, "json", "fast").items():
+            report.add("replay", seconds, dataset, counts[dataset])
+
+        if "write_parquet" in formats:
+            from api.storage.history import HistoryStore
+            history = HistoryStore(os.path.join(folder, "data"))
+            # a second compaction has nothing left to do, time the first one only
+            seconds, _ = best_of(1, history.compact)
+            report.add("compact", seconds, rows = sum(counts.values()))
+            for dataset in DATASETS:
+                seconds, _ = best_of(repeat, lambda: [history.read(dataset, world.gameworld) for world in found])
+                report.add("read_history", seconds, dataset, counts[dataset])
+        session.close()
+    return report.stages
+
+def main(scales: list, worlds: int, repeat: int, workers: int = None) -> dict:
+    stages = []
+    for rows in scales:
+        stages.extend(run_scale(rows, worlds, repeat, workers))
+    return {"benchmark": "pipeline",
+            "environment": environment(),
+            "worlds": worlds,
+            "repeat": repeat,
+            "workers": workers,
+            "stages": stages}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = __doc__, formatter_class = argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type = int, nargs = "+", default = [10000, 100000],
+                        help = "villages per world, one run per value (10k to 2M)")
+    parser.add_argument("--worlds", type = int, default = 2)
+    parser.add_argument("--repeat", type = int, default = 1)
+    parser.add_argument("--workers", type = int, default = None, help = "worker processes of the end_to_end stage")
+    parser.add_argument("--output", default = None, help = "write the report there instead of stdout")
+    args = parser.parse_args()
+    report = json.dumps(main(args.rows, args.worlds, args.repeat, args.workers), indent = 2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(report)
+    else:
+        print(report)
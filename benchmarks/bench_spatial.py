@@ -0,0 +1,66 @@
+"""
+Times the VillageIndex queries on a synthetic world.
+
+    python -m benchmarks.bench_spatial --rows 300000
+"""
+import sys
+sys.path.append(".")
+import argparse
+import json
+import time
+
+import numpy as np
+import pandas as pd
+
+from api.twapi.spatial import VillageIndex
+
+def villages(rows: int, seed: int = 0) -> pd.DataFrame:
+    """Synthetic village table with rows villages, a fifth of them barbarian."""
+    rng = np.random.default_rng(seed)
+    players = rng.integers(1, max(rows // 20, 2), rows)
+    return pd.DataFrame({"village_id": np.arange(1, rows + 1),
+                         "x": rng.integers(0, 1000, rows),
+                         "y": rng.integers(0, 1000, rows),
+                         "player_id": np.where(rng.random(rows) < 0.2, 0, players),
+                         "points": rng.integers(26, 12154, rows)})
+
+def per_query(queries: int, function) -> float:
+    """Mean seconds per call of function(i)."""
+    start = time.perf_counter()
+    for i in range(queries):
+        function(i)
+    return (time.perf_counter() - start) / queries
+
+def main(rows: int, queries: int) -> dict:
+    frame = villages(rows)
+    start = time.perf_counter()
+    index = VillageIndex(frame)
+    build = time.perf_counter() - start
+
+    rng = np.random.default_rng(1)
+    points = rng.integers(0, 1000, (queries, 2))
+    players = rng.choice(frame["player_id"].to_numpy(), queries)
+
+    radius = per_query(queries, lambda i: index.within(points[i, 0], points[i, 1], 15))
+    barbarians = per_query(queries, lambda i: index.barbarians(int(points[i, 0] // 100 * 10 + points[i, 1] // 100)))
+    nearest = per_query(queries, lambda i: index.nearest(points[i, 0], points[i, 1], 5, int(players[i])))
+
+    # the index must agree with a full scan
+    x, y = points[0]
+    scan = np.hypot(frame["x"] - x, frame["y"] - y) <= 15
+    agrees = set(frame.loc[scan, "village_id"]) == set(index.within(x, y, 15)["village_id"])
+
+    return {"benchmark": "spatial",
+            "rows": rows,
+            "build_seconds": build,
+            "within_radius_15_seconds": radius,
+            "barbarians_in_continent_seconds": barbarians,
+            "nearest_5_of_player_seconds": nearest,
+            "agrees_with_scan": bool(agrees)}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = __doc__)
+    parser.add_argument("--rows", type = int, default = 300000)
+    parser.add_argument("--queries", type = int, default = 1000)
+    args = parser.parse_args()
+    print(json.dumps(main(args.rows, args.queries), indent = 2))
@@ -0,0 +1,74 @@
+"""
+Times the startup of fresh interpreters importing the package, the cost
+paid by every python -m api command before any request.
+
+    python -m benchmarks.bench_startup --repeat 5 --output startup.json
+
+Stages: python (a bare interpreter, the floor), the client modules
+(api.twapi.world, api.twapi.baseserver), the command line (api.cli, and
+python -m api --help), and the validation (api.pandera.schemas) and
+orchestration (api.prefect_config.flows) paths. Every stage records the
+heavy packages it loaded. The report has the shape of the bench_pipeline
+one, compare two of them with benchmarks.compare.
+"""
+import sys
+sys.path.append(".")
+import argparse
+import json
+import os
+import subprocess
+import time
+
+from .bench_pipeline import environment
+
+#: Packages that should only load with the path needing them.
+HEAVY = ["numpy", "pandas", "pandera", "pyarrow", "prefect", "pycountry", "xmltodict"]
+
+#: Stage name and code run by a fresh interpreter.
+STAGES = [("python", "pass"),
+          ("import_world", "import api.twapi.world"),
+          ("import_baseserver", "import api.twapi.baseserver"),
+          ("import_cli", "import api.cli"),
+          ("cli_help", "import sys; sys.argv = ['api', '--help']\ntry:\n    import api.cli; api.cli.main()\n"
+                       "except SystemExit:\n    pass"),
+          ("import_schemas", "import api.pandera.schemas"),
+          ("import_flows", "import api.prefect_config.flows")]
+
+def startup(code: str) -> tuple:
+    """Wall clock seconds of a fresh interpreter running code, and the heavy packages it loaded."""
+    probe = "{}\nimport sys\nprint('loaded:', *[name for name in {!r} if name in sys.modules])".format(code, HEAVY)
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, "-c", probe], capture_output = True, text = True, check = True,
+                            env = dict(os.environ, DISABLE_PANDERA_IMPORT_WARNING = "True"))
+    seconds = time.perf_counter() - start
+    # the last line, after whatever the code printed
+    return seconds, result.stdout.strip().splitlines()[-1].split()[1:]
+
+def main(repeat: int) -> dict:
+    stages = []
+    for stage, code in STAGES:
+        best, loaded = float("inf"), []
+        for _ in range(repeat):
+            seconds, loaded = startup(code)
+            best = min(best, seconds)
+        stages.append({"scale": None,
+                       "stage": stage,
+                       "dataset": None,
+                       "seconds": best,
+                       "loaded": loaded})
+    return {"benchmark": "startup",
+            "environment": environment(),
+            "repeat": repeat,
+            "stages": stages}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = __doc__, formatter_class = argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type = int, default = 5)
+    parser.add_argument("--output", default = None, help = "write the report there instead of stdout")
+    args = parser.parse_args()
+    report = json.dumps(main(args.repeat), indent = 2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(report)
+    else:
+        print(report)
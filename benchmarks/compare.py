@@ -0,0 +1,52 @@
+"""
+Compares two bench_pipeline reports stage by stage, e.g. before and after
+an upgrade, and fails when a stage got slower than the threshold.
+
+    python -m benchmarks.compare before.json after.json --threshold 0.2
+
+Exits with status 1 on a regression. Stages faster than --min-seconds in
+the baseline are reported but never fail, they are mostly noise.
+"""
+import argparse
+import json
+import sys
+
+def key(stage: dict) -> tuple:
+    return stage["scale"], stage["stage"], stage["dataset"]
+
+def compare(baseline: dict, current: dict, threshold: float = 0.2, min_seconds: float = 0.05) -> dict:
+    """Ratio current / baseline of every stage present in both reports."""
+    before = {key(stage): stage["seconds"] for stage in baseline["stages"]}
+    stages = []
+    for stage in current["stages"]:
+        if key(stage) not in before:
+            continue
+        old, new = before[key(stage)], stage["seconds"]
+        ratio = new / old if old else None
+        stages.append({"scale": stage["scale"],
+                       "stage": stage["stage"],
+                       "dataset": stage["dataset"],
+                       "baseline_seconds": old,
+                       "seconds": new,
+                       "ratio": ratio,
+                       "regression": bool(ratio and old >= min_seconds and ratio > 1 + threshold)})
+    return {"baseline": baseline.get("environment"),
+            "current": current.get("environment"),
+            "threshold": threshold,
+            "regressions": sum(stage["regression"] for stage in stages),
+            "stages": stages}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = __doc__, formatter_class = argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("baseline")
+    parser.add_argument("current")
+    parser.add_argument("--threshold", type = float, default = 0.2, help = "tolerated slowdown, 0.2 for 20%%")
+    parser.add_argument("--min-seconds", type = float, default = 0.05)
+    args = parser.parse_args()
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.current) as f:
+        current = json.load(f)
+    result = compare(baseline, current, args.threshold, args.min_seconds)
+    print(json.dumps(result, indent = 2))
+    sys.exit(1 if result["regressions"] else 0)
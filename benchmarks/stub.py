@@ -0,0 +1,101 @@
+"""
+Local HTTP server standing in for the Tribal Wars endpoints.
+
+    with StubServer() as stub:
+        stub.files.update(region_files(stub.url, ["pt1", "pt2"], 100000))
+        worlds = Server(stub.host).generate_worlds()
+
+Serves a {path: body} dict with gzip transfer encoding and ETags, so
+conditional requests get their 304 like on the real servers.
+"""
+import gzip
+import hashlib
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+class StubServer:
+    """Threaded HTTP server serving files from memory on 127.0.0.1.
+
+    Attributes:
+        files (dict): {path with query string: str or bytes body}
+        host (str): "127.0.0.1:<port>", what Server() takes as a region.
+        url (str): "http://127.0.0.1:<port>"
+    """
+
+    def __init__(self, files: dict = None, port: int = 0):
+        """Constructor for the StubServer class.
+
+        Args:
+            files (dict): {path: body} to serve, more can be added later.
+            port (int): Port to listen on, any free port if 0.
+        """
+        self.files = dict(files or {})
+        self._encoded = {}
+        self.server = ThreadingHTTPServer(("127.0.0.1", port), self._handler())
+        self.server.daemon_threads = True
+        self.host = "127.0.0.1:{}".format(self.server.server_address[1])
+        self.url = "http://" + self.host
+        self.thread = None
+
+    def _body(self, path: str, compress: bool):
+        """(body, etag) of a path, the encoded bodies are cached."""
+        body = self.files.get(path)
+        if body is None:
+            return None, None
+        if path not in self._encoded or self._encoded[path][0] is not body:
+            raw = body.encode() if isinstance(body, str) else body
+            self._encoded[path] = (body, raw, '"{}"'.format(hashlib.md5(raw).hexdigest()), gzip.compress(raw, 1))
+        _, raw, etag, compressed = self._encoded[path]
+        return (compressed if compress else raw), etag
+
+    def prepare(self):
+        """Encode every file now rather than on its first request."""
+        for path in list(self.files):
+            self._body(path, True)
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                compress = "gzip" in (self.headers.get("Accept-Encoding") or "")
+                body, etag = stub._body(self.path, compress)
+                if body is None:
+                    self.send_response(404)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                if self.headers.get("If-None-Match") == etag:
+                    self.send_response(304)
+                    self.send_header("ETag", etag)
+                    self.end_headers()
+                    return
+                self.send_response(200)
+                self.send_header("ETag", etag)
+                if compress:
+                    self.send_header("Content-Encoding", "gzip")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        return Handler
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
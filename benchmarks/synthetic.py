@@ -0,0 +1,131 @@
+"""
+Synthetic Tribal Wars files, shaped like the real ones: url-encoded map
+files, the get_servers.php list of a region and the config XML files.
+
+A world of n villages gets n // 10 players, n // 250 tribes and kill
+files for six players out of ten. Generation is vectorized, a 2M
+villages world takes a few seconds.
+"""
+from urllib.parse import quote_plus
+
+import numpy as np
+import pandas as pd
+
+#: Name patterns, with the accents, spaces and symbols the real files url-encode.
+NAMES = ["Aldeia de {}", "Aldeia Bárbara {}", "Dorf von {}", "{}'s village", "Cidade 100% {}", "Forte #{} & Co"]
+
+def _names(pattern: list, count: int, rng) -> np.ndarray:
+    """count url-encoded names drawn from a pool of 1000."""
+    pool = np.array([quote_plus(pattern[i % len(pattern)].format(i)) for i in range(1000)], dtype=object)
+    return pool[rng.integers(0, len(pool), count)]
+
+def _csv(columns: dict) -> str:
+    return pd.DataFrame(columns).to_csv(header=False, index=False, lineterminator="\n")
+
+def sizes(rows: int) -> dict:
+    """Number of rows of every map file of a world of rows villages."""
+    players = max(rows // 10, 1)
+    return {"village": rows,
+            "player": players,
+            "ally": max(rows // 250, 1),
+            "odd": max(players * 6 // 10, 1),
+            "oda": max(players * 6 // 10, 1)}
+
+def village_txt(rows: int, seed: int = 0) -> str:
+    """village.txt: id, name, x, y, player id (0 for a fifth, barbarians), points, bonus."""
+    rng = np.random.default_rng(seed)
+    players = sizes(rows)["player"]
+    return _csv({"village_id": np.arange(1, rows + 1),
+                 "name": _names(NAMES, rows, rng),
+                 "x": rng.integers(0, 1000, rows),
+                 "y": rng.integers(0, 1000, rows),
+                 "player_id": np.where(rng.random(rows) < 0.2, 0, rng.integers(1, players + 1, rows)),
+                 "points": rng.integers(26, 12155, rows),
+                 "bonus": np.where(rng.random(rows) < 0.05, rng.integers(1, 9, rows), 0)})
+
+def player_txt(rows: int, seed: int = 0) -> str:
+    """player.txt: id, name, tribe id (0 for none), villages, points, rank."""
+    rng = np.random.default_rng(seed + 1)
+    count, allies = sizes(rows)["player"], sizes(rows)["ally"]
+    return _csv({"player_id": np.arange(1, count + 1),
+                 "name": _names(["jogador {}", "Spieler_{}", "player {} ç"], count, rng),
+                 "ally_id": np.where(rng.random(count) < 0.4, 0, rng.integers(1, allies + 1, count)),
+                 "num_vill": rng.integers(1, 200, count),
+                 "points": rng.integers(26, 3000000, count),
+                 "rank": rng.permutation(count) + 1})
+
+def ally_txt(rows: int, seed: int = 0) -> str:
+    """ally.txt: id, name, tag, members, villages, points, all points, rank."""
+    rng = np.random.default_rng(seed + 2)
+    count = sizes(rows)["ally"]
+    points = rng.integers(1000, 50000000, count)
+    return _csv({"ally_id": np.arange(1, count + 1),
+                 "name": _names(["Tribo {}", "Die Ritter {}", "Vai Tudo Abaixo {}"], count, rng),
+                 "tag": _names(["T{}", "VT@{}", "[{}]"], count, rng),
+                 "members": rng.integers(1, 100, count),
+                 "num_vill": rng.integers(1, 5000, count),
+                 "points": points,
+                 "total_points": points + rng.integers(0, 1000000, count),
+                 "rank": rng.permutation(count) + 1})
+
+def kill_txt(rows: int, seed: int = 0) -> str:
+    """kill_att.txt / kill_def.txt: rank, player id, score."""
+    rng = np.random.default_rng(seed + 3)
+    count = sizes(rows)["odd"]
+    return _csv({"rank": np.arange(1, count + 1),
+                 "player_id": rng.choice(sizes(rows)["player"], count, replace=False) + 1,
+                 "points": np.sort(rng.integers(1, 10000000, count))[::-1]})
+
+def get_servers_php(worlds: dict) -> str:
+    """PHP serialized {gameworld: url} array, like backend/get_servers.php."""
+    def string(value):
+        return 's:{}:"{}";'.format(len(value.encode()), value)
+    return "a:{}:{{{}}}".format(len(worlds), "".join(string(key) + string(url) for key, url in worlds.items()))
+
+def config_xml(speed: float = 1.5) -> str:
+    """interface.php?func=get_config"""
+    return ("<?xml version=\"1.0\" encoding=\"UTF-8\" ?><config><speed>{}</speed><unit_speed>1</unit_speed>"
+            "<moral>1</moral><build><destroy>1</destroy></build><misc><kill_ranking>2</kill_ranking></misc>"
+            "<game><barbarian_rise>0.003</barbarian_rise><tech>2</tech><church>0</church></game>"
+            "<night><active>1</active><start_hour>0</start_hour><end_hour>8</end_hour></night></config>"
+            .format(speed))
+
+def building_xml() -> str:
+    """interface.php?func=get_building_info"""
+    buildings = {"main": 30, "barracks": 25, "stable": 20, "garage": 15, "smith": 20, "place": 1,
+                 "market": 25, "wood": 30, "stone": 30, "iron": 30, "farm": 30, "storage": 30, "wall": 20}
+    return "<?xml version=\"1.0\" encoding=\"UTF-8\" ?><config>{}</config>".format("".join(
+        "<{0}><max_level>{1}</max_level><min_level>0</min_level><wood>90</wood><stone>80</stone>"
+        "<iron>70</iron><pop>5</pop><wood_factor>1.26</wood_factor><stone_factor>1.275</stone_factor>"
+        "<iron_factor>1.26</iron_factor><pop_factor>1.17</pop_factor><build_time>900</build_time>"
+        "<build_time_factor>1.2</build_time_factor></{0}>".format(name, level) for name, level in buildings.items()))
+
+def unit_xml() -> str:
+    """interface.php?func=get_unit_info"""
+    units = ["spear", "sword", "axe", "archer", "spy", "light", "marcher", "heavy", "ram", "catapult", "snob"]
+    return "<?xml version=\"1.0\" encoding=\"UTF-8\" ?><config>{}</config>".format("".join(
+        "<{0}><build_time>1020</build_time><pop>1</pop><speed>18.000000000504</speed><attack>10</attack>"
+        "<defense>15</defense><defense_cavalry>45</defense_cavalry><defense_archer>20</defense_archer>"
+        "<carry>25</carry></{0}>".format(name) for name in units))
+
+def world_files(rows: int, seed: int = 0) -> dict:
+    """{path below the world url: body} of every file of one world."""
+    kills = kill_txt(rows, seed)
+    return {"/map/village.txt": village_txt(rows, seed),
+            "/map/player.txt": player_txt(rows, seed),
+            "/map/ally.txt": ally_txt(rows, seed),
+            "/map/kill_def.txt": kills,
+            "/map/kill_att.txt": kill_txt(rows, seed + 10),
+            "/interface.php?func=get_config": config_xml(),
+            "/interface.php?func=get_building_info": building_xml(),
+            "/interface.php?func=get_unit_info": unit_xml()}
+
+def region_files(base_url: str, worlds: list, rows: int, seed: int = 0) -> dict:
+    """{path: body} of a region served at base_url, worlds living at base_url/<world>.
+
+    Every world gets its own seed, so their files differ.
+    """
+    files = {"/backend/get_servers.php": get_servers_php({world: "{}/{}".format(base_url, world) for world in worlds})}
+    for i, world in enumerate(worlds):
+        files.update({"/{}{}".format(world, path): body for path, body in world_files(rows, seed + 100 * i).items()})
+    return files
@@ -1,4 +1,14 @@
+import os
 from api.prefect_config.flows import fetch_from_api
 
+# regions fetched by the deployment, its tribalwars_server_list parameter
+tribalwars_server_list = ["tribalwars.com.pt",
+                          "die-staemme.de",
+                          "tribalwars.com.br"]
+
 if __name__ == "__main__":
-    fetch_from_api()
\ No newline at end of file
+    # a worker of a sharded run, e.g. TWAPI_SHARD=0 TWAPI_SHARDS=4, merged by merge_shard_runs
+    shard = os.environ.get("TWAPI_SHARD")
+    fetch_from_api(tribalwars_server_list,
+                   shard = int(shard) if shard is not None else None,
+                   shards = int(os.environ.get("TWAPI_SHARDS", 1)))